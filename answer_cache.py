@@ -0,0 +1,104 @@
+"""Precomputed answers for the most frequent queries.
+
+Query traffic follows a steep power law, so a few hundred normalized queries
+cover a large share of requests. tools.precompute_answers runs them through
+the full pipeline offline and writes the responses to a JSON file tagged with
+the corpus version they were computed against. Workers load the file once at
+startup, and only if its version matches the corpus they serve; from then on
+it is a read-only dictionary lookup in front of the pipeline.
+"""
+
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from config import settings
+from schemas import EnrichedChatResponse
+from utils.logger import logger
+
+
+class PrecomputedAnswers:
+    """Read-only map from normalized query text to a complete response."""
+
+    def __init__(self):
+        self._answers: Dict[str, EnrichedChatResponse] = {}
+        self.corpus_version: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def get(self, normalized_text: str) -> Optional[EnrichedChatResponse]:
+        """Precomputed response for a normalized query, if any."""
+        return self._answers.get(normalized_text)
+
+    def clear(self):
+        self._answers = {}
+        self.corpus_version = None
+
+    def load(self, corpus_version: str, path: str = None) -> int:
+        """Load answers computed for corpus_version; stale or missing files are ignored.
+
+        Args:
+            corpus_version: Version of the corpus this worker serves
+            path: Answer file written by tools.precompute_answers
+
+        Returns:
+            int: Number of answers loaded
+        """
+        path = path or settings.answer_cache_path
+        self.clear()
+        if not os.path.exists(path):
+            return 0
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read precomputed answers from {path}: {e}")
+            return 0
+
+        if data.get("corpus_version") != corpus_version:
+            logger.warning(
+                f"Ignoring precomputed answers for corpus {data.get('corpus_version')}, "
+                f"serving corpus {corpus_version}"
+            )
+            return 0
+
+        # Validated once here; lookups return the shared, immutable models
+        self._answers = {
+            entry["key"]: EnrichedChatResponse.model_validate(entry["response"])
+            for entry in data.get("entries", [])
+        }
+        self.corpus_version = corpus_version
+        logger.info(f"Loaded {len(self._answers)} precomputed answers for corpus {corpus_version}")
+        return len(self._answers)
+
+
+def write_answers(path: str, corpus_version: str, entries: List[dict]):
+    """Atomically write an answer file.
+
+    Args:
+        path: Destination file
+        corpus_version: Corpus the answers were computed against
+        entries: Dicts with key (normalized query), query, count and response
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    data = {
+        "corpus_version": corpus_version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "entries": entries,
+    }
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+# Global precomputed answer store
+precomputed_answers = PrecomputedAnswers()
@@ -13,6 +13,10 @@ class Settings(BaseSettings):
     # Database configuration
     database_path: str = "dof_db/db.duckdb"
     
+    # Versioned corpus snapshots (see corpus.py); without a CURRENT file the paths above are served
+    corpus_dir: str = "dof_db/snapshots"  # Published with `python -m tools.publish_snapshot`
+    corpus_poll_interval_s: float = 30.0  # How often workers check for a new snapshot; 0 disables hot swapping
+    
     # Gemini API configuration
     # TODO: Enable API key validation for production deployment
     # For development, allow empty API key to test system without real Gemini calls
@@ -33,9 +37,20 @@ class Settings(BaseSettings):
     #     return v.strip()
     
     # Embedding model configuration
+    embedding_backend: str = "mock"  # "mock" or "sentence-transformers"
     embedding_model: str = "Qwen/Qwen3-Embedding-0.6B"
     embedding_dimension: int = 1024
     model_max_seq_length: int = 1024
+    embedding_cache_size: int = 1024  # Recent query embeddings kept per worker
+    
+    # Embedding worker processes (serve.py); 0 runs the model inside each web worker
+    embedding_workers: int = 0
+    embedding_threads_per_worker: int = 4  # Torch intra-op threads per embedding process
+    embedding_cpu_sets: str = ""  # Optional pinning, one CPU list per embedding process, e.g. "0-3;4-7"
+    embedding_socket_path: str = "data/embeddings.sock"  # Relative to the working directory, so one per deployment
+    embedding_ping_timeout_s: float = 1.0  # Max wait for an embedding worker to answer a readiness ping
+    embedding_timeout_s: float = 10.0  # Max wait for an embedding worker's answer
+    embedding_io_timeout_s: float = 1.0  # Max stall of a client mid-frame before an embedding worker drops it
     
     # Device configuration (CPU)
     device: str = "cpu" 
@@ -43,8 +58,88 @@ class Settings(BaseSettings):
     # Task description for Qwen model instruction
     task_description: str = "Retrieve relevant legal document fragments including text, image descriptions, and table content that match the query"
     
+    # Search index configuration (built with `python -m tools.build_index`)
+    search_backend: str = "auto"  # auto (partitioned index if built, else SQL), partitioned, ivf or sql
+    index_path: str = "dof_db/index"
+    ivf_index_path: str = "dof_db/ivf"  # Built with `python -m tools.build_index --kind ivf`
+    ivf_nprobe: int = 8  # Clusters scanned per query; higher is slower and closer to exact
+    recency_bias: float = 0.05  # Score bonus for the newest partition; 0 disables it
+    recency_half_life_months: float = 24.0  # Months for the recency bonus to halve
+    index_scan_budget: int = 100000  # Rows the partitioned index scans per query before skipping less promising partitions; 0 is exact
+    
     # RAG configuration
     max_chunks: int = 5
+    document_cache_size: int = 4096  # Documents kept in the metadata cache
+    answer_cache_path: str = "dof_db/answer_cache.json"  # Precomputed answers (tools.precompute_answers)
+    source_render_threads: int = 4  # Threads rendering source HTML while the LLM answers
+    
+    # Context assembly configuration (between search and generation)
+    search_candidates: int = 20  # Chunks retrieved before context assembly
+    context_token_budget: int = 2048  # Max fragment tokens sent to the LLM
+    context_score_gap: float = 0.15  # Cut results after a score drop this large
+    context_mmr_lambda: float = 0.7  # Relevance vs. diversity trade-off for MMR
+    context_duplicate_threshold: float = 0.95  # Drop chunks this similar to a selected one
+    
+    # Reranking configuration (optional cross-encoder stage after search)
+    rerank_enabled: bool = False
+    rerank_model: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    rerank_candidates: int = 30  # Chunks retrieved for the cross-encoder to score
+    rerank_max_length: int = 256  # Max tokens per (query, chunk) pair
+    rerank_time_budget_ms: int = 400  # Skip reranking if it would end past this point in the request
+    rerank_score_gap: float = 0.0  # Cut reranked results after a cross-encoder score drop this large; 0 disables
+    
+    # Conversation memory (writable store, separate from the read-only corpus)
+    conversation_db_path: str = "data/conversations.sqlite3"
+    conversation_recent_turns: int = 4  # Turns kept verbatim; older ones go to the summary
+    conversation_summary_max_chars: int = 1500  # Upper bound for the rolling summary
+    conversation_flush_interval_s: float = 1.0  # Max delay before queued turns are written
+    conversation_max_pending_writes: int = 256  # Write early once this many turns are queued
+    
+    # Admission control for /v1/chat (per worker process: effective limits are these times server_workers)
+    chat_max_concurrency: int = 8  # Requests running the RAG pipeline at once
+    chat_max_queue: int = 32  # Requests allowed to wait for a free slot
+    chat_queue_timeout_s: float = 10.0  # Max wait for a slot before answering 429
+    chat_retry_after_s: int = 2  # Minimum Retry-After hint sent with 429 responses
+    chat_user_rate_per_minute: float = 30.0  # Sustained requests per user (Clerk user or address); 0 disables
+    chat_user_burst: int = 10  # Requests a user may send at once above the sustained rate
+    chat_user_max_queued: int = 4  # Requests one user may have waiting; a flooding client cannot fill the queue
+    disconnect_poll_interval_s: float = 0.25  # How often a running request checks whether its client left
+    
+    # Retrieval-only search endpoint (/v1/search)
+    search_max_results: int = 200  # Deepest result reachable through pagination
+    
+    # Batch chat endpoint (/v1/chat/batch)
+    batch_embedding_size: int = 64  # Queries per embedding forward pass
+    batch_llm_concurrency: int = 4  # Concurrent LLM calls per batch request
+    batch_max_requests: int = 2  # Batch requests processed at once per worker
+    
+    # Production server configuration (serve.py)
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: int = 2
+    torch_threads_per_worker: int = 2  # Intra-op threads per worker; workers * threads <= cores
+    
+    # Readiness probe (/ready)
+    readiness_require_database: bool = False  # Enable in production: not ready without a valid corpus schema
+    warmup_query: str = "¿Qué obligaciones fiscales establece la ley?"  # Embedded and searched once at startup
+    
+    # Logging (records are queued and written by a background thread)
+    log_level: str = "INFO"
+    log_format: str = "text"  # "text" or "json" (one object per line, with request id)
+    log_sample_rate: float = 1.0  # Fraction of requests whose INFO/DEBUG records are kept
+    log_queue_size: int = 10000  # Records buffered before new ones are dropped
+    
+    # On-demand profiling of live /v1/chat requests (utils.profiling); nothing runs while disabled
+    profiling_enabled: bool = False
+    profiling_admin_token: str = ""  # Required in X-Admin-Token to force a profile and to download profiles
+    profiling_sample_rate: float = 0.0  # Fraction of requests profiled without being asked
+    profiling_memory: bool = False  # Also trace allocations in admin-forced captures (slows the whole worker meanwhile)
+    profiling_dir: str = "profiles"
+    profiling_max_files: int = 50  # Captures kept; older ones are deleted
+    
+    # Clerk secret key (shared with airclerk), used to identify API users for fair scheduling
+    clerk_secret_key: str = ""
+    clerk_authorized_parties: str = ""  # Comma-separated origins whose session tokens are accepted, e.g. "https://dof.example.mx"
     
     # Application configuration
     app_name: str = "DOF Chat"
@@ -0,0 +1,288 @@
+"""Server-side conversation memory for follow-up questions.
+
+Each conversation keeps its last few turns verbatim plus a rolling summary of
+everything older, so the state (and the prompt built from it) stays bounded
+no matter how long the conversation runs.
+
+State lives in a small writable SQLite file, separate from the read-only
+DuckDB corpus. Requests only queue their turns: a writer thread per worker
+process appends every queued turn in one write transaction per batch, every
+settings.conversation_flush_interval_s or once
+settings.conversation_max_pending_writes turns are waiting. Each append is a
+read-modify-write inside that transaction, so turns queued by several
+workers for the same conversation never overwrite each other. Reads see the
+committed state plus the turns this worker has queued but not yet written.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from utils.logger import logger
+from utils.metrics import metrics
+
+# (user message, assistant answer) of a turn waiting to be written
+Turn = Tuple[str, str]
+
+
+class ConversationState:
+    """Bounded memory of one conversation: rolling summary plus recent turns."""
+
+    __slots__ = ("conversation_id", "summary", "recent_turns", "turn_count")
+
+    def __init__(
+        self,
+        conversation_id: str,
+        summary: str = "",
+        recent_turns: Optional[List[Dict[str, str]]] = None,
+        turn_count: int = 0
+    ):
+        self.conversation_id = conversation_id
+        self.summary = summary
+        self.recent_turns = recent_turns or []
+        self.turn_count = turn_count
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.summary and not self.recent_turns
+
+    def last_user_message(self) -> Optional[str]:
+        """Most recent user question, used to resolve elliptical follow-ups."""
+        return self.recent_turns[-1]["user"] if self.recent_turns else None
+
+    def as_prompt_context(self) -> str:
+        """Render summary and recent turns as text for the LLM prompt."""
+        parts = []
+        if self.summary:
+            parts.append(f"Resumen de la conversación:\n{self.summary}")
+        for turn in self.recent_turns:
+            parts.append(f"Usuario: {turn['user']}\nAsistente: {turn['assistant']}")
+        return "\n\n".join(parts)
+
+
+def _first_sentence(text: str, max_chars: int = 200) -> str:
+    sentence = text.strip().split("\n", 1)[0].split(". ", 1)[0]
+    return sentence[:max_chars]
+
+
+def _fold_into_summary(summary: str, turn: Dict[str, str]) -> str:
+    """Compress an evicted turn into the rolling summary, keeping it bounded."""
+    entry = f"- {turn['user'][:200]} → {_first_sentence(turn['assistant'])}"
+    lines = [line for line in summary.split("\n") if line] + [entry]
+
+    # Drop the oldest lines until the summary fits its budget
+    while len(lines) > 1 and sum(len(line) + 1 for line in lines) > settings.conversation_summary_max_chars:
+        lines.pop(0)
+    return "\n".join(lines)[-settings.conversation_summary_max_chars:]
+
+
+class ConversationStore:
+    """Conversation state in SQLite, shared by all worker processes, with batched writes."""
+
+    def __init__(self, db_path: str = None):
+        """Initialize conversation store.
+
+        Args:
+            db_path: Path to the writable SQLite file
+        """
+        self.db_path = db_path or settings.conversation_db_path
+        self._lock = threading.Lock()
+        # Held while a batch commits, so reads never count its turns twice or not at all
+        self._commit_lock = threading.Lock()
+        self._pending: Dict[str, List[Turn]] = {}
+        self._pending_count = 0
+        self._writing: Dict[str, List[Turn]] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread SQLite connection, tracked so close() can close them all.
+
+        Opened in autocommit mode; flush() manages its own transaction.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Only ever used by the opening thread; close() closes it from another
+            connection = sqlite3.connect(
+                self.db_path, timeout=5.0, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    conversation_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    recent_turns TEXT NOT NULL,
+                    turn_count INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _ensure_writer(self):
+        """Start the writer thread (once per process, also after fork)."""
+        if self._writer is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._writer = threading.Thread(target=self._write_loop, name="conversation-writer", daemon=True)
+            self._writer.start()
+
+    @staticmethod
+    def _read(connection: sqlite3.Connection, conversation_id: str) -> ConversationState:
+        row = connection.execute(
+            "SELECT summary, recent_turns, turn_count FROM conversations WHERE conversation_id = ?",
+            (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return ConversationState(conversation_id)
+        return ConversationState(conversation_id, row[0], json.loads(row[1]), row[2])
+
+    def get(self, conversation_id: str) -> ConversationState:
+        """Load a conversation: its committed state plus this worker's unwritten turns.
+
+        Args:
+            conversation_id: Session-scoped conversation key (see utils.user_identity)
+
+        Returns:
+            ConversationState: Existing state, or an empty one for new conversations
+        """
+        connection = self._connection()
+        with self._commit_lock:
+            state = self._read(connection, conversation_id)
+            with self._lock:
+                unwritten = self._writing.get(conversation_id, []) + self._pending.get(conversation_id, [])
+        for user, assistant in unwritten:
+            state = self._append(state, user, assistant)
+        return state
+
+    def append_turn(self, conversation_id: str, user: str, assistant: str):
+        """Queue a completed turn; the writer thread stores it shortly after.
+
+        The oldest recent turn is folded into the summary once more than
+        settings.conversation_recent_turns are kept, so the cost of a turn
+        does not grow with the length of the conversation.
+        """
+        with self._lock:
+            self._pending.setdefault(conversation_id, []).append((user, assistant))
+            self._pending_count += 1
+            pending_count = self._pending_count
+        metrics.set_gauge("conversation_pending_writes", pending_count)
+
+        self._ensure_writer()
+        if pending_count >= settings.conversation_max_pending_writes:
+            self._wake.set()
+
+    def flush(self):
+        """Write every queued turn in one transaction.
+
+        Each conversation is read and rewritten inside an IMMEDIATE
+        transaction, which takes SQLite's write lock up front, so turns
+        written by other workers in the meantime are kept, not overwritten.
+        Turns are queued again if the write fails.
+        """
+        with self._lock:
+            batch, self._pending, self._pending_count = self._pending, {}, 0
+            self._writing = batch
+        if not batch:
+            return
+
+        connection = self._connection()
+        started = time.monotonic()
+        now = time.time()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for conversation_id, turns in batch.items():
+                    state = self._read(connection, conversation_id)
+                    for user, assistant in turns:
+                        state = self._append(state, user, assistant)
+                    connection.execute(
+                        """
+                        INSERT INTO conversations (conversation_id, summary, recent_turns, turn_count, updated_at)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(conversation_id) DO UPDATE SET
+                            summary = excluded.summary,
+                            recent_turns = excluded.recent_turns,
+                            turn_count = excluded.turn_count,
+                            updated_at = excluded.updated_at
+                        """,
+                        (
+                            conversation_id, state.summary, json.dumps(state.recent_turns, ensure_ascii=False),
+                            state.turn_count, now
+                        )
+                    )
+                with self._commit_lock:
+                    connection.execute("COMMIT")
+                    with self._lock:
+                        self._writing = {}
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            logger.error(f"Failed to write {sum(map(len, batch.values()))} conversation turns: {e}")
+            # Back in front of turns queued meanwhile, for the next attempt
+            with self._lock:
+                for conversation_id, turns in batch.items():
+                    self._pending[conversation_id] = turns + self._pending.get(conversation_id, [])
+                    self._pending_count += len(turns)
+                self._writing = {}
+            return
+        finally:
+            metrics.set_gauge("conversation_pending_writes", self._pending_count)
+
+        metrics.increment("conversation_flushes_total")
+        metrics.increment("conversation_turns_written_total", sum(map(len, batch.values())))
+        metrics.set_gauge("conversation_write_seconds", time.monotonic() - started)
+
+    def _write_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(settings.conversation_flush_interval_s)
+            self._wake.clear()
+            self.flush()
+
+    @staticmethod
+    def _append(state: ConversationState, user: str, assistant: str) -> ConversationState:
+        """State after adding a turn, folding evicted turns into the summary."""
+        turns = state.recent_turns + [{"user": user, "assistant": assistant}]
+        summary = state.summary
+        while len(turns) > settings.conversation_recent_turns:
+            summary = _fold_into_summary(summary, turns.pop(0))
+        return ConversationState(state.conversation_id, summary, turns, state.turn_count + 1)
+
+    def close(self):
+        """Stop the writer, write queued turns and close every thread's connection."""
+        writer = self._writer
+        if writer is not None and self._pid == os.getpid():
+            self._stop.set()
+            self._wake.set()
+            writer.join()
+        self._writer = None
+        self.flush()
+
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        # Threads that use the store again open fresh connections
+        self._local = threading.local()
+
+
+# Global conversation store instance
+conversation_store = ConversationStore()
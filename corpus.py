@@ -0,0 +1,231 @@
+"""Versioned corpus snapshots and hot swapping between them.
+
+New DOF editions are published daily. Instead of rewriting the database a
+running worker has open, each edition is published as a new snapshot
+directory under settings.corpus_dir, and a CURRENT file names the one to
+serve:
+
+    dof_db/snapshots/
+        CURRENT                 "2026-10-19"
+        2026-10-18/
+        2026-10-19/
+            db.duckdb
+            index/              optional, tools.build_index --kind partitioned
+            ivf/                optional, tools.build_index --kind ivf
+            answer_cache.json   optional, tools.precompute_answers
+
+tools.publish_snapshot copies a snapshot in and then replaces CURRENT
+atomically. Every worker polls CURRENT with a CorpusWatcher; rag_service
+opens, validates and warms the new snapshot next to the one it is serving,
+swaps it in, and closes the old one once the last query pinned to it has
+finished. Without a CURRENT file the static settings.database_path and index
+paths are served, and CURRENT is still watched, so publishing the first
+snapshot needs no restart either.
+"""
+
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, Optional
+from config import settings
+from database import DatabaseManager
+from utils.document_metadata import DocumentMetadataStore
+from utils.logger import logger
+
+CURRENT_FILE = "CURRENT"
+DATABASE_FILE = "db.duckdb"
+INDEX_DIR = "index"
+IVF_INDEX_DIR = "ivf"
+ANSWER_CACHE_FILE = "answer_cache.json"
+
+
+class CorpusChanged(Exception):
+    """Raised when a request continues work started on a corpus version no longer served."""
+
+
+class SnapshotLocation:
+    """Where the files of one corpus snapshot live."""
+
+    __slots__ = ("name", "database_path", "index_path", "ivf_index_path", "answer_cache_path")
+
+    def __init__(
+        self,
+        name: Optional[str],
+        database_path: str,
+        index_path: str,
+        ivf_index_path: str,
+        answer_cache_path: str
+    ):
+        self.name = name
+        self.database_path = database_path
+        self.index_path = index_path
+        self.ivf_index_path = ivf_index_path
+        self.answer_cache_path = answer_cache_path
+
+    @classmethod
+    def static(cls) -> "SnapshotLocation":
+        """The unversioned corpus configured by the individual path settings."""
+        return cls(
+            None, settings.database_path, settings.index_path,
+            settings.ivf_index_path, settings.answer_cache_path
+        )
+
+    @classmethod
+    def in_directory(cls, name: str, corpus_dir: str = None) -> "SnapshotLocation":
+        """Files of the snapshot called name inside the corpus directory."""
+        directory = os.path.join(corpus_dir or settings.corpus_dir, name)
+        return cls(
+            name,
+            os.path.join(directory, DATABASE_FILE),
+            os.path.join(directory, INDEX_DIR),
+            os.path.join(directory, IVF_INDEX_DIR),
+            os.path.join(directory, ANSWER_CACHE_FILE)
+        )
+
+    @property
+    def label(self) -> str:
+        return self.name or "static"
+
+
+def current_snapshot_name(corpus_dir: str = None) -> Optional[str]:
+    """Snapshot named by the CURRENT file, or None when snapshots are not used."""
+    path = os.path.join(corpus_dir or settings.corpus_dir, CURRENT_FILE)
+    try:
+        with open(path, encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name or None
+
+
+def resolve_location(corpus_dir: str = None) -> SnapshotLocation:
+    """Location of the snapshot to serve: the CURRENT one, else the static paths."""
+    name = current_snapshot_name(corpus_dir)
+    if name is None:
+        return SnapshotLocation.static()
+    return SnapshotLocation.in_directory(name, corpus_dir)
+
+
+def set_current(name: str, corpus_dir: str = None):
+    """Atomically point CURRENT at a snapshot; workers pick it up on their next poll."""
+    corpus_dir = corpus_dir or settings.corpus_dir
+    if not os.path.exists(os.path.join(corpus_dir, name, DATABASE_FILE)):
+        raise FileNotFoundError(f"Snapshot {name} has no {DATABASE_FILE} in {corpus_dir}")
+    fd, tmp_path = tempfile.mkstemp(dir=corpus_dir, prefix=".current-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(name + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(corpus_dir, CURRENT_FILE))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class CorpusSnapshot:
+    """One opened corpus: database, vector index and document metadata cache.
+
+    Queries pin the snapshot they start on (acquire/release) and use it
+    throughout, so index hits are always resolved against the database they
+    were built from. A retired snapshot is closed when its last query
+    releases it.
+    """
+
+    def __init__(
+        self,
+        location: SnapshotLocation,
+        database: DatabaseManager,
+        documents: DocumentMetadataStore,
+        index=None,
+        database_search: bool = False,
+        version: str = "mock",
+        checks: Dict[str, bool] = None
+    ):
+        """Initialize an opened snapshot.
+
+        Args:
+            location: Files the snapshot was opened from
+            database: Read-only connection manager for its database
+            documents: Metadata cache over that database
+            index: Loaded vector index, or None for database search
+            database_search: Whether the chunks table is usable
+            version: Corpus fingerprint keying derived caches
+            checks: Readiness checks (database, search_index)
+        """
+        self.location = location
+        self.database = database
+        self.documents = documents
+        self.index = index
+        self.database_search = database_search
+        self.version = version
+        self.checks = checks or {}
+        self._lock = threading.Lock()
+        self._refs = 0
+        self._retired = False
+        self._closed = False
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            close = self._retired and self._refs == 0
+        if close:
+            self.close()
+
+    def retire(self):
+        """Mark the snapshot as replaced; it closes once no query holds it."""
+        with self._lock:
+            self._retired = True
+            close = self._refs == 0
+            if not close:
+                logger.info(f"Draining {self._refs} queries from corpus snapshot {self.location.label}")
+        if close:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self.database.close()
+        logger.info(f"Closed corpus snapshot {self.location.label} ({self.version})")
+
+
+class CorpusWatcher:
+    """Daemon thread that calls a refresh callback every poll interval."""
+
+    def __init__(self, refresh: Callable[[], object], interval: float = None):
+        """Initialize watcher.
+
+        Args:
+            refresh: Checks CURRENT and swaps snapshots when it changed
+            interval: Seconds between polls
+        """
+        self.refresh = refresh
+        self.interval = interval or settings.corpus_poll_interval_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="corpus-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {settings.corpus_dir} for new corpus snapshots every {self.interval:g}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Corpus snapshot refresh failed: {e}", exc_info=True)
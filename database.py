@@ -1,10 +1,26 @@
 """Database connection utilities for DuckDB vector database."""
 
 import duckdb
-from typing import List, Dict, Any
+import hashlib
+from typing import List, Dict, Any, Optional, Tuple
 import os
+import threading
 from config import settings
+from schemas import SearchFilters
 from utils.logger import logger
+from utils.text_compression import TextCodec
+
+# Columns the RAG pipeline reads from each table
+EXPECTED_COLUMNS = {
+    "chunks": ("chunk_id", "doc_id", "header", "text", "doc_type", "token_count", "embedding"),
+    "documents": ("doc_id", "title", "url", "publication_date", "doc_type", "agency"),
+}
+
+# Compressed layout (tools.compress_chunks): chunk text moves out of chunks
+COMPRESSED_TEXT_COLUMNS = {
+    "chunk_texts": ("chunk_id", "dict_id", "text_zstd"),
+    "text_dictionaries": ("dict_id", "dictionary"),
+}
 
 
 class DatabaseManager:
@@ -18,33 +34,74 @@ class DatabaseManager:
         """
         self.db_path = db_path or settings.database_path
         self._connection = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # None until checked: whether chunk text is stored zstd-compressed
+        self._compressed_text: Optional[bool] = None
+        self._codec: Optional[TextCodec] = None
     
     def connect(self) -> duckdb.DuckDBPyConnection:
         """Establish connection to DuckDB database with validation.
         
+        A DuckDB connection must not be used by several threads at once, so
+        each thread gets its own cursor on the shared read-only database.
+        
         Returns:
-            DuckDB connection object
+            DuckDB connection object for the calling thread
         """
         if not os.path.exists(self.db_path):
             logger.error(f"Database file not found: {self.db_path}")
             raise FileNotFoundError(f"Database file not found: {self.db_path}")
         
-        # Check if connection exists and is still valid
-        if self._connection is not None:
+        # close() replaces the thread-local store, dropping stale cursors
+        cursor = getattr(self._local, "cursor", None)
+        failed = False
+        
+        # Check if this thread's cursor exists and is still valid
+        if cursor is not None:
             try:
                 # Test connection validity with a simple query
-                result = self._connection.execute("SELECT 1").fetchone()
+                result = cursor.execute("SELECT 1").fetchone()
                 if result != (1,):
                     raise Exception("Database connection validation failed: unexpected result")
             except Exception as e:
-                logger.warning(f"Existing connection failed validation, reconnecting: {e}")
-                self._connection = None
+                # Only this thread's cursor is replaced; other threads keep theirs
+                logger.warning(f"Existing cursor failed validation, replacing it: {e}")
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+                self._local.cursor = cursor = None
+                failed = True
         
-        if self._connection is None:
-            logger.info(f"Connecting to database: {self.db_path}")
-            self._connection = duckdb.connect(self.db_path, read_only=True)
+        if cursor is None:
+            with self._lock:
+                if failed and self._connection is not None and not self._is_alive(self._connection):
+                    logger.warning("Shared database connection is dead, reopening it")
+                    try:
+                        self._connection.close()
+                    except Exception:
+                        pass
+                    self._connection = None
+                if self._connection is None:
+                    logger.info(f"Connecting to database: {self.db_path}")
+                    self._connection = duckdb.connect(self.db_path, read_only=True)
+                cursor = self._connection.cursor()
+                self._local.cursor = cursor
         
-        return self._connection
+        return cursor
+    
+    @staticmethod
+    def _is_alive(connection: duckdb.DuckDBPyConnection) -> bool:
+        """Whether the shared connection can still open a working cursor."""
+        try:
+            probe = connection.cursor()
+            try:
+                return probe.execute("SELECT 1").fetchone() == (1,)
+            finally:
+                probe.close()
+        except Exception:
+            return False
     
     def execute_query(self, query: str, params: List[Any] = None) -> List[Dict[str, Any]]:
         """Execute a query and return results.
@@ -56,9 +113,6 @@ class DatabaseManager:
         Returns:
             List of dictionaries with query results
         """
-        # TODO: Add vector similarity search methods for querying embeddings
-        # TODO: Implement methods to retrieve chunks based on similarity
-        
         conn = self.connect()
         
         try:
@@ -76,32 +130,285 @@ class DatabaseManager:
             return result_dicts
             
         except Exception as e:
-            logger.error(f"Query execution failed: {e}")
+            logger.error("Query execution failed: %s", e)
             raise
     
+    def has_table(self, table_name: str) -> bool:
+        """Check whether a table exists in the main schema.
+        
+        Args:
+            table_name: Name of the table to look up
+            
+        Returns:
+            True if the table exists
+        """
+        rows = self.execute_query(
+            "SELECT 1 FROM information_schema.tables WHERE table_name = ?",
+            [table_name]
+        )
+        return bool(rows)
+    
+    def rank_chunks(
+        self,
+        embedding: List[float],
+        top_k: int,
+        filters: Optional[SearchFilters] = None
+    ) -> List[Tuple[int, float]]:
+        """Rank chunks by cosine similarity, returning only ids and scores.
+        
+        Only chunk_id, embedding and the filter columns are read, so the
+        scan never touches text or other payload columns (DuckDB stores
+        columns separately). Filters are applied in the WHERE clause, so the
+        top-k is taken over the filtered subset.
+        
+        Args:
+            embedding: Query embedding vector
+            top_k: Number of rows to return
+            filters: Optional metadata restrictions
+            
+        Returns:
+            List of (chunk_id, score) sorted by descending score
+        """
+        where_sql, where_params = self._filter_clause(filters)
+        query = f"""
+            SELECT chunk_id,
+                   array_cosine_similarity(embedding, ?::FLOAT[{settings.embedding_dimension}]) AS score
+            FROM chunks
+            {where_sql}
+            ORDER BY score DESC
+            LIMIT ?
+        """
+        return [(row["chunk_id"], row["score"]) for row in self.execute_query(query, [embedding, *where_params, top_k])]
+    
+    def search_chunks(
+        self,
+        embedding: List[float],
+        top_k: int,
+        filters: Optional[SearchFilters] = None
+    ) -> List[Dict[str, Any]]:
+        """Two-phase similarity search: rank ids and scores, then fetch payloads.
+        
+        Args:
+            embedding: Query embedding vector
+            top_k: Number of rows to return
+            filters: Optional metadata restrictions
+            
+        Returns:
+            List of chunk rows (with token_count, embedding and score) sorted by score
+        """
+        ranked = self.rank_chunks(embedding, top_k, filters)
+        rows_by_id = {
+            row["chunk_id"]: row
+            for row in self.fetch_chunks([chunk_id for chunk_id, _ in ranked], include_embeddings=True)
+        }
+        results = []
+        for chunk_id, score in ranked:
+            row = rows_by_id.get(chunk_id)
+            if row is not None:
+                row["score"] = score
+                results.append(row)
+        return results
+    
+    def fetch_chunks(self, chunk_ids: List[int], include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        """Fetch chunk payloads for a batch of chunk ids in a single primary-key lookup.
+        
+        Args:
+            chunk_ids: Primary keys of the chunks to load
+            include_embeddings: Also return the stored embedding of each chunk
+            
+        Returns:
+            List of chunk rows (chunk_id, doc_id, text, header, doc_type, token_count), unordered
+        """
+        if not chunk_ids:
+            return []
+        
+        embedding_column = ", c.embedding" if include_embeddings else ""
+        if not self.compressed_text():
+            query = f"""
+                SELECT c.chunk_id, c.doc_id, c.text, c.header, c.doc_type, c.token_count{embedding_column}
+                FROM chunks c
+                WHERE c.chunk_id IN (SELECT UNNEST(?::BIGINT[]))
+            """
+            return self.execute_query(query, [list(chunk_ids)])
+        
+        query = f"""
+            SELECT c.chunk_id, c.doc_id, c.header, c.doc_type, c.token_count{embedding_column}, t.dict_id, t.text_zstd
+            FROM chunks c
+            LEFT JOIN chunk_texts t ON t.chunk_id = c.chunk_id
+            WHERE c.chunk_id IN (SELECT UNNEST(?::BIGINT[]))
+        """
+        return self._decode_texts(self.execute_query(query, [list(chunk_ids)]))
+    
+    def compressed_text(self) -> bool:
+        """Whether chunk text lives zstd-compressed in chunk_texts (checked once)."""
+        if self._compressed_text is None:
+            compressed = self.has_table("chunk_texts") and self.has_table("text_dictionaries")
+            if compressed:
+                rows = self.execute_query("SELECT dict_id, dictionary FROM text_dictionaries")
+                self._codec = TextCodec({row["dict_id"]: bytes(row["dictionary"]) for row in rows})
+            self._compressed_text = compressed
+        return self._compressed_text
+    
+    def _decode_texts(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replace (dict_id, text_zstd) with the decompressed text in each row."""
+        for row in rows:
+            data, dict_id = row.pop("text_zstd"), row.pop("dict_id")
+            row["text"] = self._codec.decompress(data, dict_id) if data is not None else ""
+        return rows
+    
+    @staticmethod
+    def _filter_clause(filters: Optional[SearchFilters]) -> Tuple[str, List[Any]]:
+        """Build a WHERE clause over the chunks table for search filters.
+        
+        Document-level conditions (date, agency) become a semi-join against
+        the documents table; doc_type is filtered on chunks directly.
+        
+        Returns:
+            Tuple of (SQL clause or empty string, positional parameters)
+        """
+        if filters is None or filters.is_empty():
+            return "", []
+        
+        conditions = []
+        params = []
+        if filters.doc_type:
+            conditions.append("doc_type = ?")
+            params.append(filters.doc_type)
+        
+        doc_conditions = []
+        if filters.date_from:
+            doc_conditions.append("publication_date >= ?")
+            params.append(filters.date_from)
+        if filters.date_to:
+            doc_conditions.append("publication_date <= ?")
+            params.append(filters.date_to)
+        if filters.agency:
+            doc_conditions.append("agency = ?")
+            params.append(filters.agency)
+        if doc_conditions:
+            conditions.append(
+                f"doc_id IN (SELECT doc_id FROM documents WHERE {' AND '.join(doc_conditions)})"
+            )
+        
+        return f"WHERE {' AND '.join(conditions)}", params
+    
+    def fetch_documents(self, doc_ids: List[str]) -> List[Dict[str, Any]]:
+        """Fetch metadata rows for a batch of documents in a single query.
+        
+        Args:
+            doc_ids: Document identifiers to look up
+            
+        Returns:
+            List of document rows (doc_id, title, url, publication_date, doc_type, agency)
+        """
+        if not doc_ids:
+            return []
+        
+        query = """
+            SELECT doc_id, title, url, publication_date, doc_type, agency
+            FROM documents
+            WHERE doc_id IN (SELECT UNNEST(?::VARCHAR[]))
+        """
+        return self.execute_query(query, [list(doc_ids)])
+    
     def close(self):
-        """Close database connection."""
-        if self._connection:
-            self._connection.close()
-            self._connection = None
+        """Close database connection (and with it every thread's cursor)."""
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+            self._local = threading.local()
+            self._compressed_text = None
+            self._codec = None
     
-    def test_connection(self) -> Dict[str, Any]:
-        """Test database connection for RAG service initialization.
+    def corpus_version(self, include_documents: bool = True) -> str:
+        """Short fingerprint of the corpus contents, used to key derived caches.
+        
+        Changes whenever chunks or documents are added or removed.
+        
+        Args:
+            include_documents: Whether to fingerprint the documents table too;
+                pass False when it is missing or unusable
+        
+        Returns:
+            12-character hex fingerprint
+        """
+        chunks = self.execute_query("SELECT count(*) AS total, max(chunk_id) AS last_id FROM chunks")[0]
+        raw = f"{chunks['total']}:{chunks['last_id']}"
+        if include_documents:
+            documents = self.execute_query(
+                "SELECT count(*) AS total, max(publication_date) AS latest FROM documents"
+            )[0]
+            raw += f":{documents['total']}:{documents['latest']}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+    
+    def validate_schema(self) -> Dict[str, List[str]]:
+        """Check that the tables used by the RAG pipeline are usable.
+        
+        Verifies the expected columns (with text either inline in chunks or
+        compressed in chunk_texts), the embedding type and dimension
+        (FLOAT[settings.embedding_dimension]) and that chunks has data.
         
         Returns:
-            Dictionary with connection test results
+            Problems found per table; an empty list means the table is valid
         """
-        # TODO: Add schema validation for existing vector tables
-        # TODO: Verify embedding columns exist and data is available
+        rows = self.execute_query(
+            "SELECT table_name, column_name, data_type FROM information_schema.columns "
+            "WHERE table_name IN (SELECT UNNEST(?::VARCHAR[]))",
+            [list(EXPECTED_COLUMNS) + list(COMPRESSED_TEXT_COLUMNS)]
+        )
+        columns: Dict[str, Dict[str, str]] = {}
+        for row in rows:
+            columns.setdefault(row["table_name"], {})[row["column_name"]] = row["data_type"]
+        
+        expected_columns = dict(EXPECTED_COLUMNS)
+        if "chunk_texts" in columns:
+            expected_columns["chunks"] = tuple(name for name in EXPECTED_COLUMNS["chunks"] if name != "text")
+            expected_columns.update(COMPRESSED_TEXT_COLUMNS)
         
+        problems: Dict[str, List[str]] = {}
+        for table, expected in expected_columns.items():
+            found = columns.get(table)
+            if not found:
+                problems[table] = ["missing table"]
+                continue
+            problems[table] = [f"missing column {name}" for name in expected if name not in found]
+        
+        embedding_type = columns.get("chunks", {}).get("embedding")
+        expected_type = f"FLOAT[{settings.embedding_dimension}]"
+        if embedding_type and embedding_type != expected_type:
+            problems["chunks"].append(f"embedding is {embedding_type}, expected {expected_type}")
+        
+        # Chunk text is unusable if its compressed tables are broken
+        for table in COMPRESSED_TEXT_COLUMNS:
+            if problems.get(table):
+                problems["chunks"].append(f"text storage table {table} is invalid")
+        
+        if not problems["chunks"] and not self.execute_query("SELECT 1 FROM chunks LIMIT 1"):
+            problems["chunks"].append("no rows")
+        
+        return problems
+    
+    def test_connection(self) -> Dict[str, Any]:
+        """Test database connection and validate the schema for RAG service initialization.
+        
+        Returns:
+            Dictionary with connection test results; "tables" maps each
+            expected table to whether it passed schema validation
+        """
         try:
             self.connect()
+            problems = self.validate_schema()
             
             result = {
                 "status": "success",
-                "db_path": self.db_path
+                "db_path": self.db_path,
+                "tables": {table: not issues for table, issues in problems.items()},
+                "schema_errors": [f"{table}: {issue}" for table, issues in problems.items() for issue in issues]
             }
             
+            if result["schema_errors"]:
+                logger.warning(f"Database schema problems: {'; '.join(result['schema_errors'])}")
             logger.info("Database connection test successful")
             return result
             
@@ -0,0 +1,276 @@
+"""Embedding inference in dedicated worker processes.
+
+With settings.embedding_workers > 0, serve.py loads the sentence-transformers
+model once, forks that many inference processes and only then forks the
+web workers, which embed queries through EmbeddingClient instead of running
+the model themselves. Inference then no longer competes with request
+handling for the GIL, torch threads are sized per inference process
+(settings.embedding_threads_per_worker) instead of per web worker, and each
+inference process can be pinned to its own cores (settings.embedding_cpu_sets).
+
+Transport is a Unix domain socket shared by all inference processes. Every
+message is a frame: a 4-byte big-endian length followed by the payload.
+Requests carry a JSON list of texts; responses carry a status byte, the
+row and column counts and the float32 matrix. Each inference process
+encodes all requests that are ready at once in a single forward pass.
+"""
+
+import json
+import os
+import selectors
+import socket
+import struct
+import threading
+from typing import List, Optional, Set
+import numpy as np
+from config import settings
+from utils.logger import logger
+
+_LENGTH = struct.Struct(">I")
+_SHAPE = struct.Struct(">II")
+_OK = b"\x00"
+_ERROR = b"\x01"
+
+
+def load_embedding_model():
+    """Load the sentence-transformers embedding model.
+
+    Returns:
+        The model, or None if it could not be loaded
+    """
+    try:
+        from sentence_transformers import SentenceTransformer
+
+        logger.info(f"Loading embedding model: {settings.embedding_model}")
+        model = SentenceTransformer(settings.embedding_model, device=settings.device)
+        model.max_seq_length = settings.model_max_seq_length
+        model.eval()
+        return model
+    except Exception as e:
+        logger.error(f"Failed to load embedding model: {e}")
+        return None
+
+
+def encode_queries(model, texts: List[str]) -> np.ndarray:
+    """Embed query texts with the instruction prompt, L2-normalized.
+
+    Returns:
+        np.ndarray: (len(texts), dimension) float32 embeddings
+    """
+    # Qwen3 embedding queries are prefixed with the task instruction
+    embeddings = model.encode(
+        texts,
+        prompt=f"Instruct: {settings.task_description}\nQuery:",
+        batch_size=settings.batch_embedding_size,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def parse_cpu_sets(spec: str) -> List[Set[int]]:
+    """Parse "0-3;4-7" (one CPU list per process, ';'-separated) into CPU sets."""
+    cpu_sets = []
+    for group in filter(None, (part.strip() for part in spec.split(";"))):
+        cpus = set()
+        for item in group.split(","):
+            start, _, end = item.strip().partition("-")
+            cpus.update(range(int(start), int(end or start) + 1))
+        cpu_sets.append(cpus)
+    return cpu_sets
+
+
+def _recv_exact(conn: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def _recv_frame(conn: socket.socket) -> bytes:
+    (length,) = _LENGTH.unpack(_recv_exact(conn, _LENGTH.size))
+    return _recv_exact(conn, length)
+
+
+def _send_frame(conn: socket.socket, payload: bytes):
+    conn.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def bind_socket(path: str = None) -> socket.socket:
+    """Create the listening Unix socket shared by the inference processes."""
+    path = path or settings.embedding_socket_path
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(256)
+    sock.setblocking(False)
+    return sock
+
+
+def serve(model, listener: socket.socket, worker_id: int):
+    """Answer embedding requests until the process is terminated.
+
+    Args:
+        model: Loaded embedding model (inherited from the forking master)
+        listener: Listening socket from bind_socket
+        worker_id: Index of this inference process, selects its CPU set
+    """
+    cpu_sets = parse_cpu_sets(settings.embedding_cpu_sets)
+    if cpu_sets and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpu_sets[worker_id % len(cpu_sets)])
+    try:
+        import torch
+        torch.set_num_threads(settings.embedding_threads_per_worker)
+    except ImportError:
+        pass
+    logger.info(f"Embedding worker {worker_id} started (pid {os.getpid()})")
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    while True:
+        ready = []
+        for key, _ in selector.select():
+            if key.fileobj is listener:
+                try:
+                    conn, _ = listener.accept()
+                except BlockingIOError:
+                    # Another inference process accepted it first
+                    continue
+                # A client that stalls mid-frame is dropped instead of freezing this process
+                conn.settimeout(settings.embedding_io_timeout_s)
+                selector.register(conn, selectors.EVENT_READ)
+                continue
+            conn = key.fileobj
+            try:
+                ready.append((conn, json.loads(_recv_frame(conn))))
+            except (ConnectionError, OSError, ValueError):
+                selector.unregister(conn)
+                conn.close()
+
+        if ready:
+            _answer(model, ready, selector)
+
+
+def _answer(model, ready: list, selector: selectors.BaseSelector):
+    """Encode every ready request in one forward pass and send each its rows."""
+    texts = [text for _, request_texts in ready for text in request_texts]
+    try:
+        # Pings carry no texts and are answered without running the model
+        embeddings = encode_queries(model, texts) if texts else np.empty((0, 0), dtype=np.float32)
+        error = None
+    except Exception as e:
+        logger.error(f"Embedding batch of {len(texts)} texts failed: {e}", exc_info=True)
+        error = str(e).encode("utf-8")
+
+    offset = 0
+    for conn, request_texts in ready:
+        if error is None:
+            rows = embeddings[offset:offset + len(request_texts)]
+            offset += len(request_texts)
+            payload = _OK + _SHAPE.pack(*rows.shape) + rows.tobytes()
+        else:
+            payload = _ERROR + error
+        try:
+            _send_frame(conn, payload)
+        except OSError:
+            selector.unregister(conn)
+            conn.close()
+
+
+class EmbeddingClient:
+    """Client for the inference processes; one connection per calling thread."""
+
+    def __init__(self, path: str = None, timeout: float = None):
+        self.path = path or settings.embedding_socket_path
+        self.timeout = timeout or settings.embedding_timeout_s
+        self._local = threading.local()
+
+    @classmethod
+    def available(cls, path: str = None) -> bool:
+        """Whether something accepts connections on the socket (a stale file does not)."""
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(settings.embedding_ping_timeout_s)
+        try:
+            conn.connect(path or settings.embedding_socket_path)
+            return True
+        except OSError:
+            return False
+        finally:
+            conn.close()
+
+    def ping(self) -> bool:
+        """Whether an inference process answers a request right now.
+
+        The listening socket is inherited by every forked process, so a
+        successful connect() alone does not prove an inference process is
+        alive to accept and answer it.
+        """
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(settings.embedding_ping_timeout_s)
+        try:
+            conn.connect(self.path)
+            _send_frame(conn, b"[]")
+            return _recv_frame(conn)[:1] == _OK
+        except OSError:
+            return False
+        finally:
+            conn.close()
+
+    def _connection(self) -> socket.socket:
+        conn: Optional[socket.socket] = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed query texts in an inference process.
+
+        Args:
+            texts: Query texts
+
+        Returns:
+            np.ndarray: (len(texts), dimension) float32 embeddings
+
+        Raises:
+            RuntimeError: If the inference process failed to encode the batch
+            TimeoutError: If no answer arrived within the timeout
+            OSError: If no inference process answered
+        """
+        request = json.dumps(texts, ensure_ascii=False).encode("utf-8")
+        # One retry on a fresh connection: the inference process may have restarted.
+        # A timeout is not retried: the inference processes are busy, not gone.
+        for attempt in (1, 2):
+            try:
+                conn = self._connection()
+                _send_frame(conn, request)
+                response = _recv_frame(conn)
+                break
+            except TimeoutError:
+                self._reset()
+                raise
+            except OSError:
+                self._reset()
+                if attempt == 2:
+                    raise
+
+        if response[:1] != _OK:
+            raise RuntimeError(f"Embedding worker failed: {response[1:].decode('utf-8', 'replace')}")
+        rows, columns = _SHAPE.unpack_from(response, 1)
+        return np.frombuffer(response, dtype=np.float32, offset=1 + _SHAPE.size).reshape(rows, columns)
@@ -0,0 +1,364 @@
+"""Inverted-file (IVF) vector index for chunk embeddings.
+
+Embeddings are clustered offline with spherical k-means and stored grouped
+by cluster, so each cluster is one contiguous block of a memory-mapped
+matrix. A query is compared with the cluster centroids and only the
+settings.ivf_nprobe closest clusters are scanned. Search cost grows with
+nprobe instead of with the corpus, and nprobe is the single speed/recall
+trade-off: nprobe = nlist is exact search.
+
+On-disk layout (settings.ivf_index_path, next to the DuckDB file):
+- manifest.json: dimension, nlist, cluster offsets, vocabularies
+- centroids.npy: (nlist, dim) float32, L2-normalized
+- vectors.npy: (N, dim) float32, L2-normalized, grouped by cluster
+- chunk_ids.npy, dates.npy, doc_types.npy, agencies.npy: per-row metadata
+
+Scores include the same recency bonus as the partitioned index, and filters
+are applied per row; when filters leave fewer than top_k hits in the probed
+clusters, further clusters are probed in centroid order.
+"""
+
+import json
+import os
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from config import settings
+from schemas import SearchFilters
+from search_index import (
+    MANIFEST_FILE, QUERY_CHUNK_SIZE, days_since_epoch, prefetch_files, row_filter_mask, row_recency_bonus
+)
+from utils.logger import logger
+
+_ARRAYS = ("centroids", "vectors", "chunk_ids", "dates", "doc_types", "agencies")
+_UNDATED = np.iinfo(np.int32).min
+
+
+class IVFIndex:
+    """Approximate cosine-similarity search over k-means clusters."""
+
+    def __init__(self, path: str, manifest: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        self.path = path
+        self.dimension = manifest["dimension"]
+        self.offsets = np.asarray(manifest["offsets"], dtype=np.int64)
+        self.doc_type_codes = {name: code for code, name in enumerate(manifest["doc_types"])}
+        self.agency_codes = {name: code for code, name in enumerate(manifest["agencies"])}
+        self.centroids = arrays["centroids"]
+        self.vectors = arrays["vectors"]
+        self.chunk_ids = arrays["chunk_ids"]
+        self.dates = arrays["dates"]
+        self.doc_types = arrays["doc_types"]
+        self.agencies = arrays["agencies"]
+
+    @classmethod
+    def exists(cls, path: str = None) -> bool:
+        """Whether an IVF index has been built at path."""
+        return os.path.exists(os.path.join(path or settings.ivf_index_path, MANIFEST_FILE))
+
+    @classmethod
+    def load(cls, path: str = None) -> "IVFIndex":
+        """Open an IVF index with all arrays memory-mapped read-only.
+
+        Args:
+            path: Index directory
+
+        Returns:
+            IVFIndex: Loaded index
+        """
+        path = path or settings.ivf_index_path
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        index = cls(path, manifest, arrays)
+        logger.info(f"Loaded IVF index: {len(index)} vectors in {index.nlist} clusters")
+        return index
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    @property
+    def nlist(self) -> int:
+        return int(self.centroids.shape[0])
+
+    def prefetch(self) -> int:
+        """Fault every page of the index files into the page cache.
+
+        Returns:
+            int: Number of bytes covered
+        """
+        return prefetch_files([os.path.join(self.path, f"{name}.npy") for name in _ARRAYS])
+
+    def get_vectors(self, positions: np.ndarray) -> np.ndarray:
+        """Return the stored (normalized) vectors at the given row positions."""
+        return np.asarray(self.vectors[positions])
+
+    def _score_cluster(
+        self,
+        cluster: int,
+        queries: np.ndarray,
+        filters: Optional[SearchFilters],
+        today: date
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores (rows, queries) and row positions for one cluster, after filtering."""
+        start, end = int(self.offsets[cluster]), int(self.offsets[cluster + 1])
+        positions = np.arange(start, end)
+        dates = self.dates[start:end]
+        mask = row_filter_mask(
+            filters, self.doc_types[start:end], self.agencies[start:end], dates,
+            self.doc_type_codes, self.agency_codes
+        )
+        if mask is not None:
+            positions, dates = positions[mask], dates[mask]
+            vectors = self.vectors[positions]
+        else:
+            vectors = self.vectors[start:end]
+        scores = vectors @ queries.T + row_recency_bonus(np.asarray(dates), today)[:, None]
+        return scores, positions
+
+    def search(
+        self,
+        embedding: List[float],
+        top_k: int,
+        filters: Optional[SearchFilters] = None,
+        nprobe: int = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Find the top_k chunks among the nprobe clusters closest to the query.
+
+        Args:
+            embedding: Query embedding vector
+            top_k: Number of results to return
+            filters: Optional metadata restrictions applied before ranking
+            nprobe: Clusters to scan (settings.ivf_nprobe by default)
+
+        Returns:
+            Tuple of (chunk_ids, scores, row positions), sorted by descending score
+        """
+        nprobe = min(nprobe or settings.ivf_nprobe, self.nlist)
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        clusters = np.argsort(-(self.centroids @ query))
+        today = date.today()
+
+        all_scores, all_positions = [], []
+        found = 0
+        for probed, cluster in enumerate(clusters):
+            # Keep probing past nprobe only while filters leave too few hits
+            if probed >= nprobe and found >= top_k:
+                break
+            scores, positions = self._score_cluster(int(cluster), query[None, :], filters, today)
+            all_scores.append(scores[:, 0])
+            all_positions.append(positions)
+            found += positions.size
+
+        return self._top_k(all_scores, all_positions, top_k)
+
+    def search_batch(
+        self,
+        embeddings: List[List[float]],
+        top_k: int,
+        nprobe: int = None
+    ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Unfiltered search for many queries, scoring each cluster once for all queries probing it.
+
+        Queries are processed QUERY_CHUNK_SIZE at a time to bound the score
+        matrices held per chunk.
+
+        Args:
+            embeddings: Query embedding vectors
+            top_k: Number of results per query
+            nprobe: Clusters to scan per query (settings.ivf_nprobe by default)
+
+        Returns:
+            List of (chunk_ids, scores, row positions) per query, sorted by descending score
+        """
+        nprobe = min(nprobe or settings.ivf_nprobe, self.nlist)
+        results = []
+        for first in range(0, len(embeddings), QUERY_CHUNK_SIZE):
+            results.extend(self._search_chunk(embeddings[first:first + QUERY_CHUNK_SIZE], top_k, nprobe))
+        return results
+
+    def _search_chunk(
+        self,
+        embeddings: List[List[float]],
+        top_k: int,
+        nprobe: int
+    ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        today = date.today()
+
+        scores_by_query: List[List[np.ndarray]] = [[] for _ in range(len(queries))]
+        positions_by_query: List[List[np.ndarray]] = [[] for _ in range(len(queries))]
+        for cluster in np.unique(probes):
+            members = np.flatnonzero((probes == cluster).any(axis=1))
+            scores, positions = self._score_cluster(int(cluster), queries[members], None, today)
+            for column, query_number in enumerate(members):
+                scores_by_query[query_number].append(scores[:, column])
+                positions_by_query[query_number].append(positions)
+
+        results = []
+        for query_number, embedding in enumerate(embeddings):
+            if sum(part.size for part in positions_by_query[query_number]) < top_k:
+                # Tiny probed clusters: let search() widen the probe
+                results.append(self.search(embedding, top_k, nprobe=nprobe))
+            else:
+                results.append(self._top_k(scores_by_query[query_number], positions_by_query[query_number], top_k))
+        return results
+
+    def _top_k(
+        self,
+        scores: List[np.ndarray],
+        positions: List[np.ndarray],
+        top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if not scores:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        scores = np.concatenate(scores).astype(np.float32, copy=False)
+        positions = np.concatenate(positions)
+        if scores.size > top_k:
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            scores, positions = scores[keep], positions[keep]
+        order = np.argsort(-scores)
+        scores, positions = scores[order], positions[order]
+        return np.asarray(self.chunk_ids[positions]), scores, positions
+
+
+def _spherical_kmeans(sample: np.ndarray, nlist: int, iterations: int, seed: int = 0) -> np.ndarray:
+    """Cluster L2-normalized rows by cosine similarity; returns normalized centroids."""
+    if nlist > sample.shape[0]:
+        raise ValueError(f"Cannot seed {nlist} clusters from {sample.shape[0]} sampled rows")
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+
+        # Re-seed empty clusters with the rows worst served by their centroid
+        empty = np.flatnonzero(counts == 0)
+        if empty.size:
+            fit = np.einsum("ij,ij->i", sample, centroids[assignments])
+            sums[empty] = sample[np.argsort(fit)[:empty.size]]
+
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+def build_ivf_index(
+    connection,
+    path: str = None,
+    nlist: int = None,
+    iterations: int = 20,
+    sample_size: int = 100000,
+    batch_size: int = 10000
+) -> Dict[str, Any]:
+    """Export chunk embeddings from DuckDB into an IVF index directory.
+
+    Args:
+        connection: Open DuckDB connection with chunks and documents tables
+        path: Output directory (created if missing)
+        nlist: Number of clusters (default: 4 * sqrt(N))
+        iterations: k-means iterations
+        sample_size: Rows used to train the centroids
+        batch_size: Rows fetched from DuckDB and assigned per batch
+
+    Returns:
+        Dict: The written manifest
+    """
+    path = path or settings.ivf_index_path
+    os.makedirs(path, exist_ok=True)
+
+    total = connection.execute("SELECT count(*) FROM chunks").fetchone()[0]
+    dimension = settings.embedding_dimension
+    if total == 0:
+        raise ValueError("chunks table is empty")
+    # k-means seeds one centroid per distinct sampled row
+    sample_count = min(sample_size, total)
+    if nlist and nlist > sample_count:
+        logger.warning(f"Reducing nlist from {nlist} to the {sample_count} sampled rows")
+    nlist = int(min(max(nlist or 4 * np.sqrt(total), 1), sample_count))
+
+    # Pass 1: export normalized vectors and metadata in table order
+    unsorted_path = os.path.join(path, "vectors.unsorted.npy")
+    unsorted = np.lib.format.open_memmap(unsorted_path, mode="w+", dtype=np.float32, shape=(total, dimension))
+    chunk_ids = np.empty(total, dtype=np.int64)
+    dates = np.full(total, _UNDATED, dtype=np.int32)
+    doc_types = np.empty(total, dtype=np.int16)
+    agencies = np.empty(total, dtype=np.int16)
+    doc_type_vocab: Dict[str, int] = {}
+    agency_vocab: Dict[str, int] = {}
+
+    cursor = connection.execute("""
+        SELECT c.chunk_id, c.embedding, c.doc_type, d.agency, d.publication_date
+        FROM chunks c
+        LEFT JOIN documents d ON d.doc_id = c.doc_id
+        ORDER BY c.chunk_id
+    """)
+    row = 0
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        end = row + len(batch)
+        embeddings = np.asarray([item[1] for item in batch], dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        unsorted[row:end] = embeddings
+        for offset, (chunk_id, _, doc_type, agency, publication_date) in enumerate(batch):
+            chunk_ids[row + offset] = chunk_id
+            doc_types[row + offset] = doc_type_vocab.setdefault(doc_type or "DOCUMENTO", len(doc_type_vocab))
+            agencies[row + offset] = agency_vocab.setdefault(agency or "", len(agency_vocab))
+            if publication_date is not None:
+                dates[row + offset] = days_since_epoch(publication_date)
+        row = end
+
+    # Train centroids on a random sample
+    rng = np.random.default_rng(0)
+    sample_rows = np.sort(rng.choice(total, sample_count, replace=False))
+    centroids = _spherical_kmeans(np.asarray(unsorted[sample_rows]), nlist, iterations)
+
+    # Pass 2: assign every row, then write vectors grouped by cluster
+    assignments = np.empty(total, dtype=np.int32)
+    for start in range(0, total, batch_size):
+        block = np.asarray(unsorted[start:start + batch_size])
+        assignments[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    order = np.argsort(assignments, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))])
+
+    vectors = np.lib.format.open_memmap(
+        os.path.join(path, "vectors.npy"), mode="w+", dtype=np.float32, shape=(total, dimension)
+    )
+    for start in range(0, total, batch_size):
+        rows = order[start:start + batch_size]
+        # Gather in file order, then restore cluster order
+        vectors[start:start + rows.size] = unsorted[np.sort(rows)][np.argsort(np.argsort(rows))]
+    vectors.flush()
+    del unsorted
+    os.remove(unsorted_path)
+
+    np.save(os.path.join(path, "centroids.npy"), centroids)
+    np.save(os.path.join(path, "chunk_ids.npy"), chunk_ids[order])
+    np.save(os.path.join(path, "dates.npy"), dates[order])
+    np.save(os.path.join(path, "doc_types.npy"), doc_types[order])
+    np.save(os.path.join(path, "agencies.npy"), agencies[order])
+
+    manifest = {
+        "kind": "ivf",
+        "dimension": dimension,
+        "count": total,
+        "nlist": nlist,
+        "offsets": offsets.tolist(),
+        "doc_types": list(doc_type_vocab),
+        "agencies": list(agency_vocab),
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    sizes = np.diff(offsets)
+    logger.info(
+        f"Built IVF index at {path}: {total} vectors in {nlist} clusters "
+        f"(sizes min {sizes.min()}, median {int(np.median(sizes))}, max {sizes.max()})"
+    )
+    return manifest
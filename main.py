@@ -4,11 +4,12 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import threading
 import air
 import airclerk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from routers import web, api
-from utils.logger import logger
+from utils.logger import logger, bind_request_id, current_request_id, unbind_request_id
 from config import settings
 
 # Initialize Air application for web routes
@@ -18,17 +19,47 @@ app = air.Air()
 fastapi_app = FastAPI()
 fastapi_app.include_router(api.router)
 
-# Startup event to pre-initialize RAG service on FastAPI app
+# Tag every log record of an API request with its request id
+@fastapi_app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Bind the client-provided (or a generated) request id for logging."""
+    token = bind_request_id(request.headers.get("X-Request-ID"))
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = current_request_id()
+        return response
+    finally:
+        unbind_request_id(token)
+
+# Startup event to initialize and warm the RAG service on FastAPI app
 @fastapi_app.on_event("startup")
 async def startup_event():
-    """Initialize RAG service during application startup."""
+    """Initialize and warm up the RAG service in the background.
+    
+    Liveness (/health) answers immediately; readiness (/ready) reports
+    ready only once warm-up has finished.
+    """
     logger.info("Starting DOF Chat application...")
-    try:
-        from rag_service import rag_service
-        rag_service.initialize()
-        logger.info("RAG service pre-initialized")
-    except Exception as e:
-        logger.error(f"Failed to pre-initialize RAG service: {e}")
+    from rag_service import rag_service
+    
+    def warm_up():
+        try:
+            rag_service.warm_up()
+            # Started here, in the serving process, so no thread exists before serve.py forks
+            rag_service.start_corpus_watcher()
+        except Exception as e:
+            logger.error(f"Failed to pre-initialize RAG service: {e}")
+    
+    threading.Thread(target=warm_up, name="rag-warm-up", daemon=True).start()
+
+# Stop background work before the worker exits
+@fastapi_app.on_event("shutdown")
+async def shutdown_event():
+    """Stop watching for corpus snapshots, write queued conversation turns and close the store."""
+    from conversation_store import conversation_store
+    from rag_service import rag_service
+    rag_service.stop_corpus_watcher()
+    conversation_store.close()
 
 # Mount static files directory first to avoid routing conflicts
 app.mount("/static", air.StaticFiles(directory="static"), name="static")
@@ -48,10 +79,23 @@ app.include_router(airclerk.router)
 
 @app.get("/health")
 async def root_health():
-    """Root health check endpoint."""
+    """Root liveness endpoint."""
     return {"status": "ok", "service": "dof-chat"}
 
 
+@app.get("/ready")
+async def root_ready():
+    """Root readiness endpoint: 503 until the RAG service is warmed up."""
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.responses import JSONResponse
+    from rag_service import rag_service
+    ready, checks = await run_in_threadpool(rag_service.readiness)
+    return JSONResponse(
+        {"status": "ready" if ready else "starting", "checks": checks},
+        status_code=200 if ready else 503
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting DOF Chat application")
@@ -1,21 +1,104 @@
 """RAG service for document querying - Mock implementation for integration testing.
 
 Mock RAG pipeline for DOF Chat: demonstrates component integration without real models.
-Tests: query embedding → vector search → LLM generation → Air component rendering.
+Tests: query embedding → vector search → rerank → context assembly → LLM generation → Air component rendering.
 
 Current mode: Full simulation for testing component connectivity.
 """
 
+import contextvars
+import random
 import time
 import threading
-from typing import List
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from answer_cache import precomputed_answers
 from config import settings
-from database import db_manager
-from schemas import EnrichedChatResponse, ChunkData, DocumentSource
+from conversation_store import ConversationState, conversation_store
+from corpus import CorpusChanged, CorpusSnapshot, CorpusWatcher, SnapshotLocation, resolve_location
+from database import DatabaseManager, db_manager
+from embedding_workers import EmbeddingClient, encode_queries, load_embedding_model
+from reranker import reranker
+from ivf_index import IVFIndex
+from search_index import PartitionedIndex
+from schemas import EnrichedChatResponse, SearchFilters
+from records import ChunkRecord, SourceRecord
+from utils.cache import LRUCache
+from utils.cancellation import CancellationToken, QueryCancelled
 from utils.logger import logger
+from utils.metrics import metrics
+from utils.single_flight import SingleFlight
+from utils.context_assembly import assemble_context
+from utils.document_metadata import DocumentMetadataStore, document_store
 from utils.context_renderer import render_embedded_sources
 
 
+# Generic answer returned when the pipeline fails; never cached
+ERROR_ANSWER = "Lo siento, hubo un error al procesar tu consulta. Por favor, inténtalo de nuevo más tarde."
+
+# Longest wait before retrying a snapshot that failed to load
+_SNAPSHOT_RETRY_MAX_S = 3600.0
+
+# Corpus snapshot the current query runs against (see RAGService._pinned)
+_pinned_snapshot: contextvars.ContextVar[Optional[CorpusSnapshot]] = contextvars.ContextVar(
+    "pinned_snapshot", default=None
+)
+
+# Metadata for the mock chunks, used when the documents table is unavailable
+_MOCK_DOCUMENTS = {
+    "mock-lisr": {
+        "title": "Ley del Impuesto Sobre la Renta",
+        "url": "https://dof.gob.mx/nota_detalle.php?codigo=5678901",
+        "publication_date": "15 de enero de 2024",
+        "age_description": "Reciente",
+        "age_emoji": "🟢",
+    },
+    "mock-rsst": {
+        "title": "Reglamento de Seguridad y Salud en el Trabajo",
+        "url": "https://dof.gob.mx/nota_detalle.php?codigo=5678902",
+        "publication_date": "20 de febrero de 2024",
+        "age_description": "Reciente",
+        "age_emoji": "🟢",
+    },
+    "mock-nom001": {
+        "title": "NOM-001-SEMARNAT-2021",
+        "url": "https://dof.gob.mx/nota_detalle.php?codigo=5678903",
+        "publication_date": "10 de marzo de 2024",
+        "age_description": "Reciente",
+        "age_emoji": "🟢",
+    },
+}
+
+
+def normalize_query(text: str) -> str:
+    """Normalize query text so trivially different phrasings share a key.
+    
+    Applies Unicode NFKC, case folding, whitespace collapsing and strips
+    surrounding punctuation such as Spanish question marks.
+    """
+    normalized = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(normalized.split()).strip("¿?¡!.,;: ")
+
+
+def _query_key(text: str, filters: Optional[SearchFilters], conversation_id: Optional[str] = None) -> str:
+    """Coalescing/cache key: normalized text plus the active filters and conversation."""
+    key = normalize_query(text)
+    if filters is not None and not filters.is_empty():
+        key = f"{key}#{filters.cache_key()}"
+    if conversation_id:
+        # Follow-ups depend on history, so only coalesce within one conversation
+        key = f"{key}@{conversation_id}"
+    return key
+
+
+def _mock_embedding(text: str) -> List[float]:
+    """Deterministic pseudo-embedding derived from the text hash."""
+    generator = random.Random(hash(text) % 2147483647)
+    return [generator.uniform(-0.1, 0.1) for _ in range(settings.embedding_dimension)]
+
+
 class RAGService:
     """Mock RAG service for testing component integration.
     
@@ -38,127 +121,522 @@ class RAGService:
         # Only initialize once using instance attribute check
         if not hasattr(self, '_initialized'):
             self._initialized = False
+            self._embedding_model = None
+            self._embedding_client: Optional[EmbeddingClient] = None
+            self._snapshot: Optional[CorpusSnapshot] = None
+            # (name, consecutive failures, time.monotonic() of the next attempt)
+            self._failed_snapshot: Optional[Tuple[str, int, float]] = None
+            self._swap_lock = threading.Lock()
+            self._corpus_watcher: Optional[CorpusWatcher] = None
+            self._embedding_cache = LRUCache(settings.embedding_cache_size)
+            self._single_flight = SingleFlight()
+            self._init_lock = threading.Lock()
+            # Threads start on first use, i.e. in the serving process, never before fork
+            self._render_pool = ThreadPoolExecutor(
+                max_workers=settings.source_render_threads, thread_name_prefix="rag-render"
+            )
+            self.corpus_version = "mock"
+            self._checks: Dict[str, bool] = {"warm_up": False}
     
     def initialize(self):
-        """Initialize service with mock implementations."""
+        """Initialize service: embedding model (if configured), database and reranker."""
         if self._initialized:
             return
         
+        with self._init_lock:
+            if self._initialized:
+                return
+            self._initialize()
+    
+    def _initialize(self):
         logger.info("Initializing RAG service (mock mode)")
         
-        # TODO: Initialize embedding model (Qwen/Qwen3-Embedding-0.6B)
+        if settings.embedding_backend == "sentence-transformers":
+            self._load_embedding_model()
+        self._checks["embedding_model"] = (
+            settings.embedding_backend == "mock"
+            or self._embedding_model is not None
+            or self._embedding_client is not None
+        )
+        
         # TODO: Initialize Gemini API client
         # TODO: Validate API keys and model availability
         
-        # Test database connection (only connectivity, no model loading)
+        # Serve the corpus snapshot CURRENT points to, or the static database
+        self._snapshot = self._open_snapshot(resolve_location())
+        self.corpus_version = self._snapshot.version
+        self._checks.update(self._snapshot.checks)
+        
+        if settings.rerank_enabled:
+            reranker.load()
+        
+        precomputed_answers.load(self.corpus_version, self._snapshot.location.answer_cache_path)
+        
+        self._initialized = True
+        logger.info("RAG service initialized (mock mode)")
+    
+    def _open_snapshot(self, location: SnapshotLocation) -> CorpusSnapshot:
+        """Open a corpus snapshot: validate its database, fingerprint it and load its index.
+        
+        The static corpus is served through the global db_manager and
+        document_store; each versioned snapshot gets its own connection and
+        metadata cache, so nothing cached for one version leaks into the next.
+        """
+        if location.name is None:
+            database, documents = db_manager, document_store
+        else:
+            database = DatabaseManager(location.database_path)
+            documents = DocumentMetadataStore(database=database)
+        # Without usable chunks there is nothing to fingerprint; the name still tells snapshots apart
+        snapshot = CorpusSnapshot(location, database, documents, version=location.name or "mock")
+        
+        # Test database connection and validate the tables the pipeline reads
+        snapshot.checks["database"] = False
         try:
-            db_result = db_manager.test_connection()
+            db_result = database.test_connection()
             if db_result["status"] == "success":
-                logger.info("Database connected")
+                logger.info(f"Database connected (corpus snapshot {location.label})")
+                tables = db_result["tables"]
+                snapshot.database_search = tables["chunks"]
+                snapshot.checks["database"] = all(tables.values())
+                if not snapshot.database_search:
+                    logger.warning("Chunks table not usable, using mock search results")
+                else:
+                    snapshot.version = database.corpus_version(tables.get("documents", False))
             else:
                 logger.warning("Database connection failed, continuing with mocks")
         except Exception as e:
             logger.warning(f"Database test failed: {e}, continuing with mocks")
         
-        self._initialized = True
-        logger.info("RAG service ready (mock mode)")
+        snapshot.index, snapshot.checks["search_index"] = self._load_index(location)
+        return snapshot
+    
+    def _load_index(self, location: SnapshotLocation):
+        """Load the vector index selected by settings.search_backend.
+        
+        A missing index is fine in auto mode (database search); one that was
+        requested explicitly, or that fails to load, fails the readiness check.
+        
+        Returns:
+            Tuple of (index or None, whether the search_index check passed)
+        """
+        backend = settings.search_backend
+        paths = {PartitionedIndex: location.index_path, IVFIndex: location.ivf_index_path}
+        index_class = {"partitioned": PartitionedIndex, "ivf": IVFIndex}.get(backend)
+        if backend == "auto":
+            index_class = PartitionedIndex if PartitionedIndex.exists(location.index_path) else None
+        elif backend != "sql" and index_class is None:
+            logger.error(f"Unknown search backend '{backend}', using database search")
+        
+        if index_class is None:
+            return None, True
+        if not index_class.exists(paths[index_class]):
+            logger.error(f"Search backend '{backend}' selected but no index is built, using database search")
+            return None, False
+        try:
+            return index_class.load(paths[index_class]), True
+        except Exception as e:
+            logger.error(f"Failed to load search index, falling back to database search: {e}")
+            return None, False
+    
+    @contextmanager
+    def _pinned(self, snapshot: Optional[CorpusSnapshot] = None) -> Iterator[CorpusSnapshot]:
+        """Hold a corpus snapshot (default: the one being served) for the duration of the block.
+        
+        Nested blocks, including those on threads running a copy of the
+        caller's context, reuse the outer pin, so a query never mixes index
+        hits from one snapshot with rows from another. A swapped-out snapshot
+        stays open until its last pin is released.
+        """
+        pinned = _pinned_snapshot.get()
+        if snapshot is None and pinned is not None:
+            yield pinned
+            return
+        
+        if snapshot is None:
+            if not self._initialized:
+                self.initialize()
+            with self._swap_lock:
+                snapshot = self._snapshot
+                snapshot.acquire()
+        else:
+            snapshot.acquire()
+        token = _pinned_snapshot.set(snapshot)
+        try:
+            yield snapshot
+        finally:
+            _pinned_snapshot.reset(token)
+            snapshot.release()
+    
+    def _warm_snapshot(self, snapshot: CorpusSnapshot):
+        """Fault the snapshot's index pages in and run one search against it."""
+        if snapshot.index is not None:
+            prefetched = snapshot.index.prefetch()
+            logger.info(f"Prefetched {prefetched / 2**20:.1f} MiB of search index pages")
+        embedding = self.embed_query(settings.warmup_query)
+        with self._pinned(snapshot):
+            self.search_chunks(embedding, top_k=self._num_candidates())
+    
+    def refresh_corpus(self) -> bool:
+        """Swap in the snapshot CURRENT points to, if it is not the one being served.
+        
+        The new snapshot is opened, validated and warmed next to the current
+        one, which keeps serving meanwhile. After the swap, new queries use
+        the new snapshot, queries already running finish on the old one, and
+        the old one is closed once they have. Precomputed answers are
+        reloaded for the new corpus version; the embedding cache does not
+        depend on the corpus and is kept. A snapshot that fails validation
+        or warm-up (e.g. its index is still being written) is retried with
+        exponential backoff.
+        
+        Returns:
+            bool: Whether a new snapshot was swapped in
+        """
+        if not self._initialized:
+            self.initialize()
+        location = resolve_location()
+        if location.name is None or location.name == self._snapshot.location.name:
+            return False
+        failed = self._failed_snapshot
+        if failed is not None and failed[0] == location.name and time.monotonic() < failed[2]:
+            return False
+        
+        started = time.monotonic()
+        logger.info(f"New corpus snapshot {location.name} published, loading it")
+        snapshot = self._open_snapshot(location)
+        try:
+            if not (snapshot.database_search and snapshot.checks["search_index"]):
+                raise RuntimeError("database or search index is not usable")
+            self._warm_snapshot(snapshot)
+        except Exception as e:
+            failures = failed[1] + 1 if failed is not None and failed[0] == location.name else 1
+            delay = min(settings.corpus_poll_interval_s * 2 ** failures, _SNAPSHOT_RETRY_MAX_S)
+            self._failed_snapshot = (location.name, failures, time.monotonic() + delay)
+            logger.error(f"Not swapping to corpus snapshot {location.name}: {e}; retrying in {delay:.0f}s")
+            metrics.increment("corpus_swap_failures_total")
+            snapshot.close()
+            return False
+        
+        self._failed_snapshot = None
+        with self._swap_lock:
+            previous, self._snapshot = self._snapshot, snapshot
+            self.corpus_version = snapshot.version
+            self._checks.update(snapshot.checks)
+        # Until these are loaded, the previous version's answers are skipped (see _precomputed_answer)
+        precomputed_answers.load(snapshot.version, location.answer_cache_path)
+        previous.retire()
+        
+        metrics.increment("corpus_swaps_total")
+        metrics.set_gauge("corpus_swap_seconds", time.monotonic() - started)
+        logger.info(
+            f"Serving corpus snapshot {location.name} ({snapshot.version}), "
+            f"replaced {previous.location.label} ({previous.version}) after {time.monotonic() - started:.2f}s"
+        )
+        return True
+    
+    def start_corpus_watcher(self):
+        """Poll for new corpus snapshots in this process (call after forking).
+        
+        Also runs while the static corpus is served, so publishing the first
+        snapshot is picked up without a restart.
+        """
+        if self._corpus_watcher is not None or settings.corpus_poll_interval_s <= 0:
+            return
+        self._corpus_watcher = CorpusWatcher(self.refresh_corpus)
+        self._corpus_watcher.start()
+    
+    def stop_corpus_watcher(self):
+        if self._corpus_watcher is not None:
+            self._corpus_watcher.stop()
+            self._corpus_watcher = None
+    
+    def close_connections(self):
+        """Close the served snapshot's database connection; it reopens lazily on next use.
+        
+        DuckDB connections are not fork-safe, so serve.py calls this in the
+        master before forking workers.
+        """
+        if self._snapshot is not None:
+            self._snapshot.database.close()
+    
+    def warm_up(self):
+        """Initialize and warm the service so the first real request is not slow.
+        
+        Runs one embedding and one search through the configured backends
+        (model weights, allocator, DuckDB cursor) and faults the index pages
+        into the page cache. The service reports ready only afterwards.
+        """
+        self.initialize()
+        started = time.monotonic()
+        try:
+            self._warm_snapshot(self._snapshot)
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}", exc_info=True)
+            return
+        
+        self._checks["warm_up"] = True
+        metrics.set_gauge("warm_up_seconds", time.monotonic() - started)
+        logger.info(f"RAG service ready after {time.monotonic() - started:.2f}s warm-up")
+    
+    def readiness(self) -> Tuple[bool, Dict[str, bool]]:
+        """Whether this worker should receive traffic, with the individual checks.
+        
+        The database check only gates readiness when
+        settings.readiness_require_database is set, so mock mode can still
+        become ready in development. With embedding worker processes, the
+        embedding check pings them on every call, so it blocks for up to
+        settings.embedding_ping_timeout_s.
+        
+        Returns:
+            Tuple of (ready, check results by name)
+        """
+        checks = dict(self._checks)
+        if self._embedding_client is not None:
+            checks["embedding_model"] = self._embedding_client.ping()
+        required = [
+            passed for name, passed in checks.items()
+            if name != "database" or settings.readiness_require_database
+        ]
+        return self._initialized and all(required), checks
+    
+    def _load_embedding_model(self):
+        """Connect to the embedding worker processes, or load the model in-process.
+        
+        Falls back to mock embeddings if the model cannot be loaded.
+        """
+        if settings.embedding_workers > 0:
+            if EmbeddingClient.available():
+                logger.info(f"Embedding queries in worker processes via {settings.embedding_socket_path}")
+                self._embedding_client = EmbeddingClient()
+                return
+            logger.warning("No embedding worker processes running (start with serve.py), loading the model here")
+        
+        self._embedding_model = load_embedding_model()
+        if self._embedding_model is None:
+            logger.error("Using mock embeddings")
+    
+    def _encode(self, texts: List[str]):
+        """Embed texts with the worker processes or the local model; None in mock mode."""
+        if self._embedding_client is not None:
+            return self._embedding_client.embed(texts)
+        if self._embedding_model is not None:
+            return encode_queries(self._embedding_model, texts)
+        return None
     
     def embed_query(self, text: str) -> List[float]:
-        """Convert query text to embedding vector (mock implementation).
+        """Convert query text to embedding vector.
+        
+        Uses the loaded embedding model when available, otherwise a
+        deterministic mock vector. Recent embeddings are cached by exact text,
+        so paginated searches and repeated questions skip the model.
         
         Args:
             text: Query text to embed
             
         Returns:
-            List[float]: Mock embedding vector
+            List[float]: Embedding vector
         """
         if not self._initialized:
             self.initialize()
         
-        # TODO: Replace with real embedding model (Qwen/Qwen3-Embedding-0.6B)
-        # TODO: Initialize embedding model in initialize() method
-        # TODO: Process text through real embedding model
+        cached = self._embedding_cache.get(text)
+        if cached is not None:
+            metrics.increment("embedding_cache_hits_total")
+            return cached
+        
+        embeddings = self._encode([text])
+        if embeddings is not None:
+            embedding = embeddings[0].tolist()
+            self._embedding_cache.put(text, embedding)
+            return embedding
         
         # Generate mock embedding for integration testing
-        logger.debug(f"Processing embedding for text: '{text[:50]}...'")
+        logger.debug("Processing embedding for text: '%s...'", text[:50])
         logger.info("MOCK: Generating deterministic embedding vector")
         
-        import random
-        random.seed(hash(text) % 2147483647)  # Deterministic based on text
-        mock_embedding = [random.uniform(-0.1, 0.1) for _ in range(settings.embedding_dimension)]
+        mock_embedding = _mock_embedding(text)
+        self._embedding_cache.put(text, mock_embedding)
         
-        logger.debug(f"Generated mock embedding with {len(mock_embedding)} dimensions")
+        logger.debug("Generated mock embedding with %d dimensions", len(mock_embedding))
         return mock_embedding
     
-    def search_chunks(self, embedding: List[float], top_k: int = None) -> List[ChunkData]:
-        """Search for similar chunks (mock implementation).
+    def search_chunks(
+        self,
+        embedding: List[float],
+        top_k: int = None,
+        filters: Optional[SearchFilters] = None
+    ) -> List[ChunkRecord]:
+        """Search for similar chunks in the chunks table, or mock chunks without it.
         
         Args:
-            embedding: Query embedding vector (unused in mock)
+            embedding: Query embedding vector
             top_k: Number of results to return
+            filters: Optional metadata restrictions applied before ranking
             
         Returns:
-            List[ChunkData]: Mock document chunks with realistic data
+            List[ChunkRecord]: Chunks sorted by descending score, with token counts and embeddings
         """
         if top_k is None:
             top_k = settings.max_chunks
         
-        # TODO: Replace with real DuckDB vector search
-        # TODO: Execute vector similarity search against embeddings table
-        # TODO: Return real chunks from database with metadata
+        with self._pinned() as corpus:
+            if corpus.index is not None and corpus.database_search:
+                return self._search_index(corpus, embedding, top_k, filters)
+            
+            if corpus.database_search:
+                logger.debug("Searching database for %d similar chunks", top_k)
+                rows = corpus.database.search_chunks(embedding, top_k, filters)
+                return [
+                    ChunkRecord(
+                        text=row["text"] or "",
+                        header=row["header"] or "",
+                        doc_type=row["doc_type"] or "DOCUMENTO",
+                        chunk_id=row["chunk_id"],
+                        doc_id=row["doc_id"],
+                        score=row["score"] or 0.0,
+                        token_count=row["token_count"] or 0,
+                        embedding=row["embedding"]
+                    )
+                    for row in rows
+                ]
         
         # Generate mock chunks for integration testing
-        logger.debug(f"Searching for {top_k} similar chunks")
+        logger.debug("Searching for %d similar chunks", top_k)
         logger.info("MOCK: Returning predefined document chunks")
         
         mock_chunks_data = [
             {
                 "text": "LEY DEL IMPUESTO SOBRE LA RENTA - Artículo 1.- Las personas físicas y las morales están obligadas al pago del impuesto sobre la renta en los siguientes casos: I.- Las residentes en México, respecto de todos sus ingresos, cualquiera que sea la ubicación de la fuente de riqueza de donde procedan.",
                 "header": "Artículo 1 - Obligaciones fiscales generales",
-                "doc_type": "LEY"
+                "doc_type": "LEY",
+                "doc_id": "mock-lisr"
             },
             {
                 "text": "REGLAMENTO DE SEGURIDAD Y SALUD EN EL TRABAJO - Artículo 5.- Los patrones deberán implementar un sistema de gestión de seguridad y salud en el trabajo que incluya la identificación de peligros y evaluación de riesgos.",
                 "header": "Artículo 5 - Sistemas de gestión laboral",
-                "doc_type": "REGLAMENTO"
+                "doc_type": "REGLAMENTO",
+                "doc_id": "mock-rsst"
             },
             {
                 "text": "NORMA Oficial Mexicana NOM-001-SEMARNAT-2021 - Que establece los límites máximos permisibles de contaminantes en las descargas de aguas residuales en aguas y bienes nacionales.",
                 "header": "NOM-001-SEMARNAT-2021 - Límites de contaminantes",
-                "doc_type": "NORMA"
+                "doc_type": "NORMA",
+                "doc_id": "mock-nom001"
             }
         ]
         
-        # Convert to ChunkData objects
+        # Mock documents only carry a type, so only doc_type filters apply here
+        if filters is not None and filters.doc_type:
+            mock_chunks_data = [c for c in mock_chunks_data if c["doc_type"] == filters.doc_type]
+        
+        # Convert to chunk records
         chunk_objects = []
-        for chunk_data in mock_chunks_data[:top_k]:
-            chunk_obj = ChunkData(
+        for rank, chunk_data in enumerate(mock_chunks_data[:top_k]):
+            chunk_obj = ChunkRecord(
                 text=chunk_data["text"],
                 header=chunk_data["header"],
-                doc_type=chunk_data["doc_type"]
+                doc_type=chunk_data["doc_type"],
+                chunk_id=rank,
+                doc_id=chunk_data["doc_id"],
+                score=0.9 - 0.05 * rank,
+                embedding=_mock_embedding(chunk_data["text"])
             )
             chunk_objects.append(chunk_obj)
         
-        logger.debug(f"Returning {len(chunk_objects)} mock ChunkData objects")
+        logger.debug("Returning %d mock chunk records", len(chunk_objects))
         return chunk_objects
     
-    def generate_answer(self, query: str, context_chunks: List[ChunkData]) -> str:
+    def _search_index(
+        self,
+        corpus: CorpusSnapshot,
+        embedding: List[float],
+        top_k: int,
+        filters: Optional[SearchFilters]
+    ) -> List[ChunkRecord]:
+        """Rank with the snapshot's vector index, then fetch payloads for the hits only."""
+        chunk_ids, scores, positions = corpus.index.search(embedding, top_k, filters)
+        rows_by_id = {row["chunk_id"]: row for row in corpus.database.fetch_chunks(chunk_ids.tolist())}
+        return self._chunks_from_rows(corpus, chunk_ids, scores, positions, rows_by_id)
+    
+    def _chunks_from_rows(
+        self,
+        corpus: CorpusSnapshot,
+        chunk_ids,
+        scores,
+        positions,
+        rows_by_id: dict
+    ) -> List[ChunkRecord]:
+        """Combine index hits (ids, scores, vectors) with fetched payload rows, keeping rank order."""
+        vectors = corpus.index.get_vectors(positions)
+        chunks = []
+        for chunk_id, score, vector in zip(chunk_ids.tolist(), scores.tolist(), vectors):
+            row = rows_by_id.get(chunk_id)
+            if row is None:
+                continue
+            chunks.append(ChunkRecord(
+                text=row["text"] or "",
+                header=row["header"] or "",
+                doc_type=row["doc_type"] or "DOCUMENTO",
+                chunk_id=chunk_id,
+                doc_id=row["doc_id"],
+                score=score,
+                token_count=row["token_count"] or 0,
+                embedding=vector
+            ))
+        return chunks
+    
+    def _build_prompt(self, query: str, context_chunks: List[ChunkRecord], history: Optional[str] = None) -> str:
+        """Build the LLM prompt from conversation memory, fragments and the question.
+        
+        Args:
+            query: User query
+            context_chunks: Retrieved context chunks
+            history: Rolling summary and recent turns of the conversation
+            
+        Returns:
+            str: Prompt text
+        """
+        parts = []
+        if history:
+            parts.append(history)
+        fragments = "\n\n".join(
+            f"[{i}] {chunk.doc_type} - {chunk.header}\n{chunk.text}"
+            for i, chunk in enumerate(context_chunks, 1)
+        )
+        parts.append(f"Fragmentos del DOF:\n{fragments}")
+        parts.append(f"Pregunta: {query}")
+        return "\n\n".join(parts)
+    
+    def generate_answer(
+        self,
+        query: str,
+        context_chunks: List[ChunkRecord],
+        history: Optional[str] = None,
+        cancel: Optional[CancellationToken] = None
+    ) -> str:
         """Generate answer (mock implementation).
         
         Args:
             query: User query
             context_chunks: Retrieved context chunks
+            history: Rolling summary and recent turns of the conversation
+            cancel: Stops generation once the client has gone
             
         Returns:
             str: Mock generated answer text
+            
+        Raises:
+            QueryCancelled: If cancelled before or during generation
         """
         # TODO: Replace with real Gemini API integration
         # TODO: Initialize Gemini client with API key
-        # TODO: Build context prompt from chunks
-        # TODO: Send query + context to Gemini and return response
+        # TODO: Send prompt to Gemini and return response
+        prompt = self._build_prompt(query, context_chunks, history)
+        if cancel is not None:
+            cancel.raise_if_cancelled("generation")
         
         # Generate mock response for integration testing
-        logger.debug(f"Generating answer for query: '{query[:50]}...'")
+        logger.debug("Generating answer for query: '%s...' (prompt: %d chars)", query[:50], len(prompt))
         logger.info("MOCK: Generating structured response")
         
         # Extract information from chunks for realistic simulation
@@ -181,134 +659,435 @@ Los documentos analizados contienen información oficial publicada en el Diario
 
 NOTA: Esta es una respuesta simulada para pruebas de integración. En el modo de producción, el sistema buscaría en la base de datos completa de documentos del DOF y proporcionaría información relevante o sugerencias alternativas.""".strip()
         
-        logger.debug(f"Generated response with {len(simulated_answer)} characters")
+        logger.debug("Generated response with %d characters", len(simulated_answer))
         return simulated_answer
     
-    def query(self, text: str) -> EnrichedChatResponse:
+    def query(
+        self,
+        text: str,
+        filters: Optional[SearchFilters] = None,
+        conversation_id: Optional[str] = None,
+        cancel: Optional[CancellationToken] = None
+    ) -> EnrichedChatResponse:
+        """Answer a query, coalescing identical queries that are already in flight.
+        
+        Popular context-free queries are answered from the precomputed
+        answers loaded at startup. Other queries are keyed by normalized
+        text, filters and conversation; while one pipeline run is in
+        progress, identical queries wait for its result instead of repeating
+        the embedding, search and LLM calls. A shared run is cancelled only
+        when every caller waiting for it has cancelled.
+        
+        Args:
+            text: User query in natural language (Spanish)
+            filters: Optional metadata restrictions for the search
+            conversation_id: Conversation whose memory resolves follow-up questions
+            cancel: Cancelled by the caller when its client disconnects
+            
+        Returns:
+            EnrichedChatResponse: Complete response with answer, context HTML, and sources
+            
+        Raises:
+            QueryCancelled: If cancelled before the pipeline finished
+        """
+        metrics.increment("rag_queries_total")
+        
+        # Read once; the precomputed answer check and the pipeline share it
+        conversation = conversation_store.get(conversation_id) if conversation_id else None
+        precomputed = self._precomputed_answer(text, filters, conversation_id, conversation)
+        if precomputed is not None:
+            return precomputed
+        
+        metrics.add_gauge("rag_queries_in_flight", 1)
+        try:
+            # The whole run uses one corpus snapshot; queries arriving after a
+            # swap do not coalesce with runs still on the old one
+            with self._pinned() as corpus:
+                response, shared = self._single_flight.do(
+                    f"{corpus.version}:{_query_key(text, filters, conversation_id)}",
+                    self._run_pipeline, text, filters, conversation_id, conversation,
+                    cancel=cancel
+                )
+        finally:
+            metrics.add_gauge("rag_queries_in_flight", -1)
+        
+        if shared:
+            metrics.increment("rag_queries_coalesced_total")
+            logger.info("Query coalesced with an identical in-flight request")
+        
+        return response
+    
+    def _precomputed_answer(
+        self,
+        text: str,
+        filters: Optional[SearchFilters],
+        conversation_id: Optional[str],
+        conversation: Optional[ConversationState]
+    ) -> Optional[EnrichedChatResponse]:
+        """Precomputed response for popular context-free queries, if available.
+        
+        Only unfiltered queries that are not follow-ups qualify: filters and
+        conversation history change the answer.
+        """
+        if not len(precomputed_answers) or (filters is not None and not filters.is_empty()):
+            return None
+        if precomputed_answers.corpus_version != self.corpus_version:
+            # A snapshot swap is in progress and the answers are still the old corpus's
+            return None
+        if conversation is not None and not conversation.is_empty:
+            return None
+        
+        response = precomputed_answers.get(normalize_query(text))
+        if response is None:
+            return None
+        
+        metrics.increment("precomputed_answer_hits_total")
+        if conversation_id:
+            conversation_store.append_turn(conversation_id, text, response.answer)
+        return response
+    
+    def _run_pipeline(
+        self,
+        text: str,
+        filters: Optional[SearchFilters] = None,
+        conversation_id: Optional[str] = None,
+        conversation: Optional[ConversationState] = None,
+        cancel: Optional[CancellationToken] = None
+    ) -> EnrichedChatResponse:
         """Complete RAG pipeline from user query to enriched response with accordion HTML.
         
-        Pipeline: text → embedding → search → generate → structure → render → JSON response
+        Pipeline: text → embedding → search → (generate ‖ structure → render) → JSON response
         Handles errors gracefully and returns user-friendly responses on failures.
         
         Args:
             text: User query in natural language (Spanish)
+            filters: Optional metadata restrictions for the search
+            conversation_id: Conversation whose memory resolves follow-up questions
+            conversation: Its memory as already read by the caller; read here if omitted
+            cancel: Checked between stages; the run stops once it is cancelled
             
         Returns:
             EnrichedChatResponse: Complete response with answer, context HTML, and sources
+            
+        Raises:
+            QueryCancelled: If cancelled; the turn is not remembered
         """
+        if cancel is None:
+            cancel = CancellationToken()
+        metrics.increment("rag_pipeline_runs_total")
         try:
-            logger.info(f"Starting RAG pipeline for query: '{text[:50]}...'")
+            started_at = time.monotonic()
+            logger.info("Starting RAG pipeline for query: '%s...'", text[:50])
             
             if not self._initialized:
                 logger.info("Initializing RAG service")
                 self.initialize()
             
+            # Step 0: Load bounded conversation memory; follow-ups like
+            # "¿y para personas morales?" are searched together with the previous question
+            if conversation is None and conversation_id:
+                conversation = conversation_store.get(conversation_id)
+            search_text = text
+            history = None
+            if conversation is not None and not conversation.is_empty:
+                search_text = f"{conversation.last_user_message()} {text}"
+                history = conversation.as_prompt_context()
+            
             # Step 1: Embed query
-            embedding = self.embed_query(text)
+            cancel.raise_if_cancelled("embedding")
+            embedding = self.embed_query(search_text)
             
-            # Step 2: Search for relevant chunks
-            chunks = self.search_chunks(embedding)
-            
-            # Step 3: Generate answer
-            answer = self.generate_answer(text, chunks)
-            
-            # Step 4: Create document sources for context rendering
-            document_sources = self._create_document_sources(chunks)
-            
-            # Step 5: Render context HTML using Air components
-            query_id = f"q{int(time.time())}"
-            context_component = render_embedded_sources(document_sources, query_id)
-            
-            # Render Air component to HTML string - ensure it's a proper string
-            if context_component:
-                try:
-                    rendered_html = context_component.render()
-                    # Ensure we have a proper string, not an Air object
-                    context_html = str(rendered_html) if rendered_html else ""
-                    logger.debug(f"Successfully rendered context HTML: {len(context_html)} chars")
-                except Exception as e:
-                    logger.error(f"Failed to render Air component: {e}")
-                    context_html = ""
-            else:
-                context_html = ""
-                logger.warning("No context component generated")
+            # Step 2: Search for a wide set of candidate chunks
+            cancel.raise_if_cancelled("search")
+            candidates = self.search_chunks(embedding, top_k=self._num_candidates(), filters=filters)
             
-            # Step 6: Extract simple sources list as fallback
-            sources = [chunk.header for chunk in chunks if chunk.header]
+            # Step 2a-2b: Rerank and trim to a non-redundant, token-budgeted context
+            cancel.raise_if_cancelled("context selection")
+            chunks = self._select_context(search_text, embedding, candidates, started_at)
             
-            # Create enriched response
-            response = EnrichedChatResponse(
-                answer=answer,
-                context_html=context_html,
-                sources=sources
-            )
+            # Steps 3-6: Generate answer and render sources
+            response = self.answer_from_chunks(text, chunks, history, cancel)
             
-            logger.info(f"RAG pipeline completed - Answer: {len(answer)} chars, Context HTML: {len(context_html)} chars, Sources: {len(sources)}")
+            # Step 7: Remember the turn, unless nobody is left to read the answer
+            cancel.raise_if_cancelled("saving the turn")
+            if conversation_id:
+                conversation_store.append_turn(conversation_id, text, response.answer)
             
             return response
             
+        except QueryCancelled as e:
+            metrics.increment("rag_pipeline_cancelled_total")
+            logger.info("RAG pipeline cancelled: %s", e)
+            raise
+            
         except Exception as e:
             # Log detailed error with stack trace for debugging
-            logger.error(f"Query processing failed: {e}", exc_info=True)
+            logger.error("Query processing failed: %s", e, exc_info=True)
             
             # Return generic user-friendly error message
             return EnrichedChatResponse(
-                answer="Lo siento, hubo un error al procesar tu consulta. Por favor, inténtalo de nuevo más tarde.",
+                answer=ERROR_ANSWER,
                 context_html="",
                 sources=[]
             )
     
-    def _create_document_sources(self, chunks: List[ChunkData]) -> List[DocumentSource]:
-        """Create DocumentSource objects from ChunkData for Air rendering.
+    def _num_candidates(self) -> int:
+        """Number of chunks to retrieve before reranking and context assembly."""
+        if reranker.enabled:
+            return max(settings.search_candidates, settings.rerank_candidates)
+        return settings.search_candidates
+    
+    def _select_context(
+        self,
+        search_text: str,
+        embedding: List[float],
+        candidates: List[ChunkRecord],
+        started_at: Optional[float] = None
+    ) -> List[ChunkRecord]:
+        """Rerank candidates (when enabled and on time) and assemble the final context."""
+        reranked = False
+        if reranker.enabled:
+            candidates, reranked = reranker.rerank(
+                search_text, candidates, top_k=settings.max_chunks, started_at=started_at
+            )
+        
+        if reranked:
+            # Keep the cross-encoder's judgment: MMR relevance comes from its
+            # scores, and the cosine-tuned score gap does not apply to them
+            chunks = assemble_context(candidates, score_gap=settings.rerank_score_gap)
+        else:
+            chunks = assemble_context(candidates, embedding)
+        logger.debug("Context assembly kept %d of %d candidates", len(chunks), len(candidates))
+        return chunks
+    
+    def answer_from_chunks(
+        self,
+        text: str,
+        chunks: List[ChunkRecord],
+        history: Optional[str] = None,
+        cancel: Optional[CancellationToken] = None
+    ) -> EnrichedChatResponse:
+        """Generate the answer for already selected chunks and render their sources.
         
-        Groups chunks by document type and creates structured DocumentSource objects
-        with metadata for accordion display.
+        Args:
+            text: User query
+            chunks: Context chunks selected for the LLM
+            history: Rolling summary and recent turns of the conversation
+            cancel: Stops generation once the client has gone
+            
+        Returns:
+            EnrichedChatResponse: Answer, context HTML and sources
+            
+        Raises:
+            QueryCancelled: If cancelled before the answer was generated
+        """
+        if cancel is not None:
+            cancel.raise_if_cancelled("generation")
+        
+        # Steps 4-6 depend only on the chunks: render sources while the LLM answers
+        # (the copied context keeps the request id on the render thread's logs)
+        rendering = self._render_pool.submit(contextvars.copy_context().run, self._render_sources, chunks)
+        
+        # Step 3: Generate answer
+        answer = self.generate_answer(text, chunks, history, cancel)
+        
+        context_html, sources = rendering.result()
+        
+        # Create enriched response
+        # Every field was produced above, so skip validation
+        response = EnrichedChatResponse.model_construct(
+            answer=answer,
+            context_html=context_html,
+            sources=sources
+        )
+        
+        logger.info(
+            "RAG pipeline completed - Answer: %d chars, Context HTML: %d chars, Sources: %d",
+            len(answer), len(context_html), len(sources)
+        )
+        
+        return response
+    
+    def _render_sources(self, chunks: List[ChunkRecord]) -> Tuple[str, List[str]]:
+        """Group chunks into document sources and render the context HTML.
         
         Args:
-            chunks: List of chunk data objects
+            chunks: Context chunks selected for the LLM
             
         Returns:
-            List[DocumentSource]: Document sources grouped by type
+            Tuple of (context HTML, source headers)
+        """
+        # Step 4: Create document sources for context rendering
+        document_sources = self._create_document_sources(chunks)
+        
+        # Step 5: Render context HTML using Air components
+        query_id = f"q{int(time.time())}"
+        context_component = render_embedded_sources(document_sources, query_id)
+        
+        # Render Air component to HTML string - ensure it's a proper string
+        if context_component:
+            try:
+                rendered_html = context_component.render()
+                # Ensure we have a proper string, not an Air object
+                context_html = str(rendered_html) if rendered_html else ""
+                logger.debug("Successfully rendered context HTML: %d chars", len(context_html))
+            except Exception as e:
+                logger.error("Failed to render Air component: %s", e)
+                context_html = ""
+        else:
+            context_html = ""
+            logger.warning("No context component generated")
+        
+        # Step 6: Extract simple sources list as fallback
+        sources = [chunk.header for chunk in chunks if chunk.header]
+        return context_html, sources
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries in one batched forward pass.
+        
+        Args:
+            texts: Query texts
+            
+        Returns:
+            List[List[float]]: One embedding per text, in order
+        """
+        if not self._initialized:
+            self.initialize()
+        
+        embeddings = self._encode(texts)
+        if embeddings is not None:
+            return embeddings.tolist()
+        
+        return [_mock_embedding(text) for text in texts]
+    
+    def retrieve_batch(
+        self,
+        texts: List[str],
+        filters: Optional[List[Optional[SearchFilters]]] = None
+    ) -> List[List[ChunkRecord]]:
+        """Select context chunks for many queries at once.
+        
+        Queries are embedded in one batch. With the vector index, unfiltered
+        queries are scored with a single matrix-matrix product and chunk
+        payloads for the union of their hits are fetched in one query.
+        Filtered queries, and deployments without an index, fall back to
+        per-query search.
+        
+        Args:
+            texts: Query texts
+            filters: Optional per-query filters, aligned with texts
+            
+        Returns:
+            List[List[ChunkRecord]]: Selected context chunks per query, in order
+        """
+        filters = filters or [None] * len(texts)
+        embeddings = self.embed_queries(texts)
+        num_candidates = self._num_candidates()
+        candidates: List[Optional[List[ChunkRecord]]] = [None] * len(texts)
+        
+        batched = [
+            i for i, item_filters in enumerate(filters)
+            if item_filters is None or item_filters.is_empty()
+        ]
+        with self._pinned() as corpus:
+            if corpus.index is not None and corpus.database_search and batched:
+                hits = corpus.index.search_batch([embeddings[i] for i in batched], num_candidates)
+                union_ids = {chunk_id for ids, _, _ in hits for chunk_id in ids.tolist()}
+                rows_by_id = {row["chunk_id"]: row for row in corpus.database.fetch_chunks(sorted(union_ids))}
+                for i, (chunk_ids, scores, positions) in zip(batched, hits):
+                    candidates[i] = self._chunks_from_rows(corpus, chunk_ids, scores, positions, rows_by_id)
+            
+            for i, text in enumerate(texts):
+                if candidates[i] is None:
+                    candidates[i] = self.search_chunks(embeddings[i], top_k=num_candidates, filters=filters[i])
+        
+        return [
+            self._select_context(text, embedding, item_candidates)
+            for text, embedding, item_candidates in zip(texts, embeddings, candidates)
+        ]
+    
+    def search(
+        self,
+        text: str,
+        filters: Optional[SearchFilters] = None,
+        offset: int = 0,
+        limit: int = 10,
+        embedding: Optional[List[float]] = None,
+        corpus_version: Optional[str] = None
+    ) -> Tuple[List[ChunkRecord], Dict[str, dict], bool, str]:
+        """Retrieval only: ranked chunks for a query, without generation.
+        
+        Each page ranks the top offset + limit + 1 hits again; that is
+        bounded by settings.search_max_results, so no result set is kept
+        between pages.
+        
+        Args:
+            text: Query text
+            filters: Optional metadata restrictions applied before ranking
+            offset: Number of ranked results to skip
+            limit: Page size
+            embedding: Query embedding carried over from the previous page; embedded from text if omitted
+            corpus_version: Corpus the previous page was ranked against, if any
+            
+        Returns:
+            Tuple of (page of chunks, document metadata by doc_id, whether more
+            results exist, corpus version the page was ranked against)
+            
+        Raises:
+            CorpusChanged: If corpus_version is no longer the served corpus;
+                offsets into the old ranking would skip or repeat results
+        """
+        if embedding is None:
+            embedding = self.embed_query(text)
+        with self._pinned() as corpus:
+            if corpus_version is not None and corpus_version != corpus.version:
+                raise CorpusChanged(f"Cursor for corpus {corpus_version}, serving {corpus.version}")
+            hits = self.search_chunks(embedding, top_k=offset + limit + 1, filters=filters)
+            page = hits[offset:offset + limit]
+            documents = self._document_metadata(chunk.doc_id for chunk in page if chunk.doc_id)
+        return page, documents, len(hits) > offset + limit, corpus.version
+    
+    def _document_metadata(self, doc_ids) -> Dict[str, dict]:
+        """Display metadata per document: batched cached lookup, mock data as fallback."""
+        doc_ids = list(dict.fromkeys(doc_ids))
+        with self._pinned() as corpus:
+            metadata = corpus.documents.get_many(doc_ids)
+        for doc_id in doc_ids:
+            if doc_id not in metadata and doc_id in _MOCK_DOCUMENTS:
+                metadata[doc_id] = _MOCK_DOCUMENTS[doc_id]
+        return metadata
+    
+    def _create_document_sources(self, chunks: List[ChunkRecord]) -> List[SourceRecord]:
+        """Group chunk records into source records for Air rendering.
+        
+        Groups chunks by document (in rank order) and attaches title, URL,
+        publication date and age bucket from one batched, cached metadata lookup.
+        
+        Args:
+            chunks: Selected chunk records
+            
+        Returns:
+            List[SourceRecord]: One source per document, ordered by best chunk
         """
-        # Group chunks by document type for realistic simulation
         doc_groups = {}
         for chunk in chunks:
-            doc_key = chunk.doc_type
-            if doc_key not in doc_groups:
-                doc_groups[doc_key] = []
-            doc_groups[doc_key].append(chunk)
+            doc_key = chunk.doc_id or chunk.doc_type
+            doc_groups.setdefault(doc_key, []).append(chunk)
+        
+        metadata_by_doc = self._document_metadata(doc_groups.keys())
         
-        # Create DocumentSource objects
         document_sources = []
-        for doc_type, doc_chunks in doc_groups.items():
-            # Create realistic document metadata
-            if doc_type == "LEY":
-                title = "Ley del Impuesto Sobre la Renta"
-                pub_date = "15 de enero de 2024"
-                age_desc = "Reciente"
-                age_emoji = "🟢"
-                url = "https://dof.gob.mx/nota_detalle.php?codigo=5678901"
-            elif doc_type == "REGLAMENTO":
-                title = "Reglamento de Seguridad y Salud en el Trabajo"
-                pub_date = "20 de febrero de 2024"
-                age_desc = "Reciente"
-                age_emoji = "🟢"
-                url = "https://dof.gob.mx/nota_detalle.php?codigo=5678902"
-            else:  # NORMA
-                title = "NOM-001-SEMARNAT-2021"
-                pub_date = "10 de marzo de 2024"
-                age_desc = "Reciente"
-                age_emoji = "🟢"
-                url = "https://dof.gob.mx/nota_detalle.php?codigo=5678903"
-            
-            doc_source = DocumentSource(
-                title=title,
+        for doc_id, doc_chunks in doc_groups.items():
+            metadata = metadata_by_doc.get(doc_id, {})
+            
+            doc_source = SourceRecord(
+                title=metadata.get("title") or doc_chunks[0].header or "Documento sin título",
                 chunks=doc_chunks,
-                url=url,
-                publication_date=pub_date,
-                age_description=age_desc,
-                age_emoji=age_emoji,
-                metadata={"doc_type": doc_type}
+                url=metadata.get("url"),
+                publication_date=metadata.get("publication_date"),
+                age_description=metadata.get("age_description"),
+                age_emoji=metadata.get("age_emoji"),
+                metadata={"doc_type": doc_chunks[0].doc_type, "doc_id": doc_id}
             )
             
             document_sources.append(doc_source)
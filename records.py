@@ -0,0 +1,95 @@
+"""Internal records passed through the RAG pipeline.
+
+Retrieval, context assembly, grouping and rendering create many small
+objects per request. They use these slotted classes instead of the Pydantic
+schemas, so nothing is validated or copied inside the pipeline. Conversion
+to the API schemas happens once at the edge, through trusted construction
+(model_construct) of data the pipeline itself produced.
+"""
+
+from typing import Any, Dict, List, Optional
+from schemas import ChunkData, DocumentSource
+
+
+class ChunkRecord:
+    """Retrieved fragment with its score, token count and (optional) embedding.
+
+    The embedding may be a list or a NumPy row taken straight from the index.
+    """
+
+    __slots__ = ("text", "header", "doc_type", "chunk_id", "doc_id", "score", "token_count", "embedding")
+
+    def __init__(
+        self,
+        text: str,
+        header: str = "",
+        doc_type: str = "DOCUMENTO",
+        chunk_id: Optional[int] = None,
+        doc_id: Optional[str] = None,
+        score: float = 0.0,
+        token_count: int = 0,
+        embedding=None
+    ):
+        self.text = text
+        self.header = header
+        self.doc_type = doc_type
+        self.chunk_id = chunk_id
+        self.doc_id = doc_id
+        self.score = score
+        self.token_count = token_count
+        self.embedding = embedding
+
+    def with_score(self, score: float) -> "ChunkRecord":
+        """Copy of this record with another score (e.g. after reranking)."""
+        return ChunkRecord(
+            self.text, self.header, self.doc_type, self.chunk_id,
+            self.doc_id, score, self.token_count, self.embedding
+        )
+
+    def to_schema(self) -> ChunkData:
+        """API representation; the embedding is internal and left out."""
+        return ChunkData.model_construct(
+            text=self.text,
+            header=self.header,
+            doc_type=self.doc_type,
+            chunk_id=self.chunk_id,
+            doc_id=self.doc_id,
+            score=self.score,
+            token_count=self.token_count
+        )
+
+
+class SourceRecord:
+    """Document grouping its selected fragments, with display metadata."""
+
+    __slots__ = ("title", "chunks", "url", "publication_date", "age_description", "age_emoji", "metadata")
+
+    def __init__(
+        self,
+        title: str,
+        chunks: Optional[List[ChunkRecord]] = None,
+        url: Optional[str] = None,
+        publication_date: Optional[str] = None,
+        age_description: Optional[str] = None,
+        age_emoji: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        self.title = title
+        self.chunks = chunks if chunks is not None else []
+        self.url = url
+        self.publication_date = publication_date
+        self.age_description = age_description
+        self.age_emoji = age_emoji
+        self.metadata = metadata if metadata is not None else {}
+
+    def to_schema(self) -> DocumentSource:
+        """API representation, converting the grouped fragments as well."""
+        return DocumentSource.model_construct(
+            title=self.title,
+            chunks=[chunk.to_schema() for chunk in self.chunks],
+            url=self.url,
+            publication_date=self.publication_date,
+            age_description=self.age_description,
+            age_emoji=self.age_emoji,
+            metadata=self.metadata
+        )
@@ -0,0 +1,139 @@
+"""Optional cross-encoder reranking stage for retrieved chunks.
+
+Vector search is tuned for recall; a small cross-encoder reading (query, chunk)
+pairs together is much more precise. Reranking a wider candidate set lets the
+pipeline send fewer, better chunks to the LLM.
+
+The stage is skipped when disabled, when the model cannot be loaded, or when
+the request is running late and reranking would not fit in its time budget.
+"""
+
+import threading
+import time
+from typing import List, Optional, Tuple
+from config import settings
+from records import ChunkRecord
+from utils.logger import logger
+
+# Weight of the newest observation in the moving average of rerank latency
+_LATENCY_SMOOTHING = 0.2
+
+
+class CrossEncoderReranker:
+    """Batched CPU cross-encoder reranker with lazy model loading."""
+
+    def __init__(self, model_name: str = None):
+        """Initialize reranker.
+
+        Args:
+            model_name: Hugging Face cross-encoder model name
+        """
+        self.model_name = model_name or settings.rerank_model
+        self._model = None
+        self._load_failed = False
+        self._load_lock = threading.Lock()
+        self._avg_latency_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        """Whether reranking is configured and the model is usable."""
+        return settings.rerank_enabled and not self._load_failed
+
+    def load(self):
+        """Load the cross-encoder model once; later calls are no-ops."""
+        if self._model is not None or self._load_failed:
+            return
+
+        with self._load_lock:
+            if self._model is not None or self._load_failed:
+                return
+            try:
+                from sentence_transformers import CrossEncoder
+
+                logger.info(f"Loading reranker model: {self.model_name}")
+                self._model = CrossEncoder(
+                    self.model_name,
+                    device=settings.device,
+                    max_length=settings.rerank_max_length
+                )
+            except Exception as e:
+                logger.error(f"Failed to load reranker model, reranking disabled: {e}")
+                self._load_failed = True
+
+    def should_rerank(self, started_at: Optional[float]) -> bool:
+        """Decide whether reranking still fits in the request time budget.
+
+        Args:
+            started_at: time.monotonic() timestamp of the request start
+
+        Returns:
+            True if the stage should run
+        """
+        if not self.enabled:
+            return False
+        if started_at is None:
+            return True
+
+        elapsed_ms = (time.monotonic() - started_at) * 1000
+        expected_ms = elapsed_ms + self._avg_latency_ms
+        if expected_ms > settings.rerank_time_budget_ms:
+            logger.info("Skipping rerank: %.0f ms elapsed, ~%.0f ms expected", elapsed_ms, self._avg_latency_ms)
+            return False
+        return True
+
+    def rerank(
+        self,
+        query: str,
+        chunks: List[ChunkRecord],
+        top_k: int = None,
+        started_at: Optional[float] = None
+    ) -> Tuple[List[ChunkRecord], bool]:
+        """Rescore chunks against the query and keep the best top_k.
+
+        Args:
+            query: User query text
+            chunks: Candidate chunks from vector search
+            top_k: Number of chunks to keep
+            started_at: time.monotonic() timestamp of the request start
+
+        Returns:
+            Tuple of (chunks sorted by cross-encoder score, or the first top_k
+            candidates unchanged when the stage is skipped; whether the
+            chunks carry cross-encoder scores)
+        """
+        if top_k is None:
+            top_k = settings.max_chunks
+
+        if not chunks or not self.should_rerank(started_at):
+            return chunks[:top_k], False
+
+        self.load()
+        if self._model is None:
+            return chunks[:top_k], False
+
+        start = time.monotonic()
+        pairs = [(query, f"{chunk.header}\n{chunk.text}" if chunk.header else chunk.text) for chunk in chunks]
+
+        # One batched forward pass over all candidate pairs
+        scores = self._model.predict(
+            pairs,
+            batch_size=max(len(pairs), 1),
+            show_progress_bar=False,
+            convert_to_numpy=True
+        )
+
+        ranked = sorted(zip(scores, chunks), key=lambda pair: float(pair[0]), reverse=True)
+        reranked = [
+            chunk.with_score(float(score))
+            for score, chunk in ranked[:top_k]
+        ]
+
+        latency_ms = (time.monotonic() - start) * 1000
+        self._avg_latency_ms += _LATENCY_SMOOTHING * (latency_ms - self._avg_latency_ms)
+        logger.debug("Reranked %d candidates in %.0f ms", len(chunks), latency_ms)
+
+        return reranked, True
+
+
+# Global reranker instance
+reranker = CrossEncoderReranker()
@@ -5,23 +5,96 @@ Uses FastAPI (not Air) for proper JSON serialization of accordion HTML responses
 
 Endpoints:
 - POST /v1/chat: Main chat endpoint with RAG pipeline
-- GET /v1/health: Service health check
+- POST /v1/chat/batch: Many queries at once, streamed back as NDJSON
+- POST /v1/search: Retrieval-only search with cursor pagination
+- GET /v1/health: Liveness check (the process is up)
+- GET /v1/ready: Readiness check (schema validated, model and index warmed up)
+- GET /v1/metrics: In-process pipeline metrics
+- GET /v1/admin/profiles: Captured request profiles (admin token required)
+- GET /v1/admin/profiles/{name}: Download one profile file (admin token required)
 """
 
-from fastapi import APIRouter, Depends, HTTPException
-from schemas import ChatQuery, EnrichedChatResponse, HealthCheck
+import asyncio
+from contextlib import AsyncExitStack
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from config import settings
+from schemas import (
+    BatchChatQuery,
+    BatchChatResult,
+    ChatQuery,
+    EnrichedChatResponse,
+    HealthCheck,
+    MetricsSnapshot,
+    ProfileFile,
+    ProfileList,
+    ReadinessCheck,
+    SearchCursorState,
+    SearchQuery,
+    SearchResponse,
+    SearchResult,
+    DocumentSource,
+)
+from corpus import CorpusChanged
 from rag_service import RAGService, get_rag_service
+from utils.admission import AdmissionRejected, batch_admission, chat_admission
+from utils.cancellation import CancellationToken, QueryCancelled
+from utils.cursor import decode_cursor, decode_vector, encode_cursor, encode_vector
 from utils.logger import logger
+from utils.metrics import metrics
+from utils.profiling import is_admin, list_profiles, profile_path, requested_capture
+from utils.user_identity import conversation_key, request_user_key
 
 # Initialize FastAPI router with API prefix for better JSON compatibility
 router = APIRouter(prefix="/v1", tags=["chat"])
 
 
+def _json_response(model: BaseModel) -> Response:
+    """Serialize a response model with pydantic's compiled serializer.
+    
+    Skips FastAPI's generic encoder and the response_model re-validation;
+    response_model is still declared on each route for the OpenAPI schema.
+    """
+    return Response(content=model.model_dump_json(), media_type="application/json")
+
+
+# Nginx's "client closed request"; logged only, the client is gone
+CLIENT_CLOSED_REQUEST = 499
+
+# 429 details when the caller, not the service, is over its share
+_USER_LIMIT_DETAIL = "Has enviado demasiadas consultas seguidas. Por favor, espera unos segundos antes de continuar."
+_USER_LIMIT_REASONS = ("user_quota", "user_queue_full")
+
+
+async def _run_until_disconnected(request: Request, cancel: CancellationToken, fn, *args):
+    """Run fn(*args, cancel=cancel) in the threadpool, cancelling it if the client disconnects.
+    
+    The pipeline stops at its next stage boundary; this waits for that, so
+    the request keeps its admission slot until the worker thread is free.
+    
+    Raises:
+        QueryCancelled: If the client disconnected before fn finished
+    """
+    task = asyncio.ensure_future(run_in_threadpool(fn, *args, cancel=cancel))
+    while not task.done():
+        await asyncio.wait({task}, timeout=settings.disconnect_poll_interval_s)
+        if not task.done() and await request.is_disconnected():
+            logger.info("Client disconnected, cancelling request")
+            cancel.cancel()
+            break
+    return await task
+
+
 @router.post("/chat", response_model=EnrichedChatResponse)
 async def handle_chat(
     query: ChatQuery,
+    request: Request,
+    user_key: str = Depends(request_user_key),
     rag_service: RAGService = Depends(get_rag_service)
-) -> EnrichedChatResponse:
+) -> Response:
     """Handle chat queries using RAG service with enriched context.
     
     Processes user questions through RAG pipeline and returns responses
@@ -29,26 +102,58 @@ async def handle_chat(
     
     Args:
         query: ChatQuery object with validated user text
+        request: Incoming request, polled for client disconnects
+        user_key: Clerk user (or client address) the request is scheduled under
         rag_service: Injected singleton RAG service instance
         
     Returns:
-        EnrichedChatResponse: Complete response with answer and accordion HTML
+        Response: JSON-encoded EnrichedChatResponse with answer and accordion HTML
+        (499 without a body if the client disconnected first)
         
     Raises:
-        HTTPException: 500 if RAG pipeline fails
+        HTTPException: 429 if the pipeline is saturated or the user is over quota, 500 if RAG pipeline fails
     """
     try:
-        logger.info(f"Processing chat query: {query.text[:50]}...")
+        logger.info("Processing chat query: %s...", query.text[:50])
+        
+        # Wait for a pipeline slot, served fairly across users; rejected fast
+        # when the queue or the user's quota is full
+        async with chat_admission.slot(user_key):
+            # Process query through RAG pipeline in a worker thread so concurrent
+            # requests can run (and identical ones coalesce) without blocking the loop;
+            # stop the pipeline if the user closes the tab or resubmits
+            capture = requested_capture(request, "chat")
+            pipeline = capture.wrap(rag_service.query) if capture is not None else rag_service.query
+            response = await _run_until_disconnected(
+                request, CancellationToken(), pipeline, query.text, query.filters,
+                conversation_key(request, query.conversation_id)
+            )
+        
+        logger.info("Generated enriched response with %d sources", len(response.sources))
+        http_response = _json_response(response)
+        if capture is not None and capture.captured:
+            http_response.headers["X-Profile-Id"] = capture.name
+        return http_response
         
-        # Process query through RAG pipeline
-        response = rag_service.query(query.text)
+    except QueryCancelled:
+        metrics.increment("chat_cancelled_total")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
         
-        logger.info(f"Generated enriched response with {len(response.sources)} sources")
-        return response
+    except AdmissionRejected as e:
+        logger.warning("Chat query rejected: %s", e)
+        if e.reason in _USER_LIMIT_REASONS:
+            detail = _USER_LIMIT_DETAIL
+        else:
+            detail = "El servicio está recibiendo muchas consultas. Por favor, inténtalo de nuevo en unos segundos."
+        raise HTTPException(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(e.retry_after)}
+        )
         
     except Exception as e:
         # Log detailed error information for debugging
-        logger.error(f"Chat handling failed: {e}", exc_info=True)
+        logger.error("Chat handling failed: %s", e, exc_info=True)
         
         # Return generic error message to client for security
         raise HTTPException(
@@ -57,11 +162,261 @@ async def handle_chat(
         )
 
 
+@router.post("/chat/batch")
+async def handle_chat_batch(
+    batch: BatchChatQuery,
+    user_key: str = Depends(request_user_key),
+    rag_service: RAGService = Depends(get_rag_service)
+) -> StreamingResponse:
+    """Answer many queries at once, streaming results as NDJSON.
+    
+    Retrieval for the whole batch runs first (batched embedding, one
+    matrix-matrix index search, one payload query for the union of hits).
+    LLM calls then run with bounded concurrency and each result line is
+    written as soon as its item completes, so lines arrive out of order.
+    The whole batch runs against one corpus snapshot.
+    
+    Args:
+        batch: BatchChatQuery with the queries to answer
+        user_key: Clerk user (or client address) the batch is scheduled under
+        rag_service: Injected singleton RAG service instance
+        
+    Returns:
+        StreamingResponse: application/x-ndjson, one BatchChatResult per line
+        
+    Raises:
+        HTTPException: 429 if too many batches are already running
+    """
+    # Hold a batch slot for the lifetime of the stream, not just this function.
+    # It is released when the stream ends, or by the background task if the
+    # body is never iterated (closing the stack twice is a no-op).
+    stack = AsyncExitStack()
+    try:
+        await stack.enter_async_context(batch_admission.slot(user_key))
+    except AdmissionRejected as e:
+        logger.warning("Batch rejected: %s", e)
+        raise HTTPException(
+            status_code=429,
+            detail="Hay demasiados lotes en proceso. Por favor, inténtalo de nuevo más tarde.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    texts = [query.text for query in batch.queries]
+    filters = [query.filters for query in batch.queries]
+    # Cancelled when the stream ends early (client gone), stopping pending LLM calls
+    cancel = CancellationToken()
+    logger.info("Processing chat batch with %d queries", len(texts))
+    
+    async def stream_results():
+        # Threadpool calls and answer tasks run on copies of this context, so
+        # retrieval and every answer see the snapshot pinned here
+        try:
+            with rag_service._pinned():
+                try:
+                    contexts = await run_in_threadpool(rag_service.retrieve_batch, texts, filters)
+                except Exception as e:
+                    logger.error("Batch retrieval failed: %s", e, exc_info=True)
+                    for index in range(len(texts)):
+                        yield BatchChatResult.model_construct(index=index, error="retrieval_failed").model_dump_json() + "\n"
+                    return
+                
+                semaphore = asyncio.Semaphore(settings.batch_llm_concurrency)
+                
+                async def answer(index: int) -> BatchChatResult:
+                    async with semaphore:
+                        try:
+                            response = await run_in_threadpool(
+                                rag_service.answer_from_chunks, texts[index], contexts[index], None, cancel
+                            )
+                            return BatchChatResult.model_construct(index=index, response=response)
+                        except QueryCancelled:
+                            return BatchChatResult.model_construct(index=index, error="cancelled")
+                        except Exception as e:
+                            logger.error("Batch item %d failed: %s", index, e, exc_info=True)
+                            return BatchChatResult.model_construct(index=index, error="generation_failed")
+                
+                tasks = [asyncio.create_task(answer(index)) for index in range(len(texts))]
+                try:
+                    for completed in asyncio.as_completed(tasks):
+                        result = await completed
+                        yield result.model_dump_json() + "\n"
+                finally:
+                    cancel.cancel()
+                    for task in tasks:
+                        task.cancel()
+                
+                metrics.increment("chat_batch_items_total", len(texts))
+        finally:
+            await stack.aclose()
+    
+    return StreamingResponse(
+        stream_results(), media_type="application/x-ndjson", background=BackgroundTask(stack.aclose)
+    )
+
+
+@router.post("/search", response_model=SearchResponse)
+async def handle_search(
+    query: SearchQuery,
+    rag_service: RAGService = Depends(get_rag_service)
+) -> Response:
+    """Return matching DOF fragments without generating an answer.
+    
+    Continuation cursors carry the query text, filters, offset and the
+    query embedding (float16), so any worker can serve the next page without
+    running the embedding model. The first page is ranked with the same
+    float16 embedding, so pages never disagree about the order. Cursors
+    also record the corpus version and stop working once a new snapshot is
+    served.
+    
+    Args:
+        query: SearchQuery with text (first page) or cursor (later pages)
+        rag_service: Injected singleton RAG service instance
+        
+    Returns:
+        Response: JSON-encoded SearchResponse with ranked fragments, document metadata and next cursor
+        
+    Raises:
+        HTTPException: 400 if the cursor is invalid, 409 if a new corpus snapshot
+            was swapped in since the cursor was issued, 500 if search fails
+    """
+    text, filters, offset, page_size = query.text, query.filters, 0, query.limit
+    embedding = packed_embedding = corpus_version = None
+    if query.cursor:
+        try:
+            state = SearchCursorState.model_validate(decode_cursor(query.cursor))
+            embedding = decode_vector(state.e, settings.embedding_dimension)
+        except (ValueError, ValidationError):
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        text, filters, offset, packed_embedding, corpus_version = state.t, state.f, state.o, state.e, state.v
+        # Keep the original page size unless the client asks for another one
+        if "limit" not in query.model_fields_set:
+            page_size = state.l
+    
+    limit = min(page_size, max(settings.search_max_results - offset, 0))
+    if limit == 0:
+        return _json_response(SearchResponse())
+    
+    try:
+        if embedding is None:
+            packed_embedding = encode_vector(await run_in_threadpool(rag_service.embed_query, text))
+            embedding = decode_vector(packed_embedding, settings.embedding_dimension)
+        chunks, documents, has_more, corpus_version = await run_in_threadpool(
+            rag_service.search, text, filters, offset, limit, embedding, corpus_version
+        )
+    except CorpusChanged:
+        raise HTTPException(
+            status_code=409,
+            detail="Se publicó una nueva edición del DOF y los resultados cambiaron. Repite la búsqueda."
+        )
+    except Exception as e:
+        logger.error("Search failed: %s", e, exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail="Lo siento, hubo un error al realizar la búsqueda. Por favor, inténtalo de nuevo más tarde."
+        )
+    
+    results = []
+    for chunk in chunks:
+        metadata = documents.get(chunk.doc_id, {})
+        results.append(SearchResult.model_construct(
+            chunk=chunk.to_schema(),
+            document=DocumentSource.model_construct(
+                title=metadata.get("title") or chunk.header or "Documento sin título",
+                url=metadata.get("url"),
+                publication_date=metadata.get("publication_date"),
+                age_description=metadata.get("age_description"),
+                age_emoji=metadata.get("age_emoji"),
+                chunks=[],
+                metadata={"doc_type": chunk.doc_type, "doc_id": chunk.doc_id}
+            )
+        ))
+    
+    next_offset = offset + len(chunks)
+    next_cursor = None
+    if has_more and next_offset < settings.search_max_results:
+        next_cursor = encode_cursor({
+            "t": text,
+            "f": filters.model_dump(mode="json", exclude_none=True) if filters else None,
+            "o": next_offset,
+            "l": page_size,
+            "e": packed_embedding,
+            "v": corpus_version,
+        })
+    
+    return _json_response(SearchResponse.model_construct(results=results, next_cursor=next_cursor))
+
+
 @router.get("/health", response_model=HealthCheck)
 async def health_check() -> HealthCheck:
-    """Health check endpoint.
+    """Liveness check: answers as soon as the process is up.
+    
+    Does not touch the RAG service, so it never blocks on initialization.
     
     Returns:
         HealthCheck: Service health status information
     """
-    return HealthCheck()
\ No newline at end of file
+    return HealthCheck()
+
+
+@router.get("/ready", response_model=ReadinessCheck)
+async def readiness_check(response: Response) -> ReadinessCheck:
+    """Readiness check for load balancers: 503 until this worker is warmed up.
+    
+    Args:
+        response: Outgoing response, used to set the status code
+    
+    Returns:
+        ReadinessCheck: Overall status and individual check results
+    """
+    # Not injected through get_rag_service, which would block on initialization
+    ready, checks = await run_in_threadpool(RAGService().readiness)
+    if not ready:
+        response.status_code = 503
+    return ReadinessCheck(status="ready" if ready else "starting", checks=checks)
+
+
+@router.get("/metrics", response_model=MetricsSnapshot)
+async def metrics_snapshot() -> MetricsSnapshot:
+    """Expose in-process pipeline metrics for this worker.
+    
+    Returns:
+        MetricsSnapshot: Current counters and gauges
+    """
+    return MetricsSnapshot(**metrics.snapshot())
+
+
+def require_admin(request: Request):
+    """Reject requests without the configured admin token."""
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+
+
+@router.get("/admin/profiles", response_model=ProfileList, dependencies=[Depends(require_admin)])
+async def get_profiles() -> ProfileList:
+    """List the request profiles captured on this host, newest first.
+    
+    Returns:
+        ProfileList: Profile files with capture id, size and modification time
+    """
+    profiles = await run_in_threadpool(list_profiles)
+    return ProfileList(profiles=[ProfileFile(**profile) for profile in profiles])
+
+
+@router.get("/admin/profiles/{name}", dependencies=[Depends(require_admin)])
+async def download_profile(name: str) -> FileResponse:
+    """Download one profile file: pstats data (.prof) or its text summary (.txt).
+    
+    Args:
+        name: File name as listed by /v1/admin/profiles
+        
+    Returns:
+        FileResponse: The file
+        
+    Raises:
+        HTTPException: 404 if no such profile exists
+    """
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    media_type = "text/plain; charset=utf-8" if name.endswith(".txt") else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=name)
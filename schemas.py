@@ -1,13 +1,14 @@
 """Pydantic schemas for API data validation and serialization.
 
 Defines all data models for the DOF Chat application:
-- Document models: ChunkData, DocumentSource for RAG pipeline
-- Response models: ChatResponse, EnrichedChatResponse for API outputs  
-- Request models: ChatQuery for API inputs
-- Utility models: HealthCheck for monitoring
+- Document models: ChunkData, DocumentSource for API output (the pipeline itself uses records.py)
+- Response models: ChatResponse, EnrichedChatResponse, BatchChatResult, SearchResponse for API outputs  
+- Request models: ChatQuery, SearchFilters, BatchChatQuery, SearchQuery (and SearchCursorState) for API inputs
+- Utility models: HealthCheck, ReadinessCheck, MetricsSnapshot, ProfileList for monitoring
 """
 
-from pydantic import BaseModel, Field
+from datetime import date
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import List, Optional, Dict, Any
 
 
@@ -30,6 +31,22 @@ class ChunkData(BaseModel):
         default="DOCUMENTO",
         description="Type of document (LEY, REGLAMENTO, NORMA, etc.)"
     )
+    chunk_id: Optional[int] = Field(
+        default=None,
+        description="Primary key of the fragment in the chunks table"
+    )
+    doc_id: Optional[str] = Field(
+        default=None,
+        description="Identifier of the document this fragment belongs to"
+    )
+    score: float = Field(
+        default=0.0,
+        description="Similarity score against the user query"
+    )
+    token_count: int = Field(
+        default=0,
+        description="Number of tokens in the fragment, computed at ingestion"
+    )
 
 
 class DocumentSource(BaseModel):
@@ -90,11 +107,62 @@ class EnrichedChatResponse(BaseModel):
     )
 
 
+class SearchFilters(BaseModel):
+    """Optional metadata restrictions applied before vector ranking.
+    
+    Filters are pushed into the search query so only matching chunks are
+    scored; they never post-filter an already truncated top-k.
+    """
+    
+    doc_type: Optional[str] = Field(
+        default=None,
+        max_length=50,
+        description="Document type to search (LEY, REGLAMENTO, NORMA, etc.)"
+    )
+    date_from: Optional[date] = Field(
+        default=None,
+        description="Earliest publication date (inclusive)"
+    )
+    date_to: Optional[date] = Field(
+        default=None,
+        description="Latest publication date (inclusive)"
+    )
+    agency: Optional[str] = Field(
+        default=None,
+        max_length=200,
+        description="Issuing agency (e.g. SHCP, SEMARNAT)"
+    )
+    
+    @field_validator("doc_type")
+    @classmethod
+    def normalize_doc_type(cls, v: Optional[str]) -> Optional[str]:
+        """Store document types in the upper-case form used by the index."""
+        if v is None:
+            return None
+        return v.strip().upper() or None
+    
+    @model_validator(mode="after")
+    def validate_date_range(self) -> "SearchFilters":
+        """Reject ranges whose start is after their end."""
+        if self.date_from and self.date_to and self.date_from > self.date_to:
+            raise ValueError("date_from must be on or before date_to")
+        return self
+    
+    def is_empty(self) -> bool:
+        """Whether no restriction is set."""
+        return not (self.doc_type or self.date_from or self.date_to or self.agency)
+    
+    def cache_key(self) -> str:
+        """Stable string form used to key caches and coalesced queries."""
+        return f"{self.doc_type or ''}|{self.date_from or ''}|{self.date_to or ''}|{self.agency or ''}"
+
+
 class ChatQuery(BaseModel):
     """User input validation for chat requests.
     
     Validates user text input with length constraints (1-1000 chars)
-    for the chat API endpoint.
+    for the chat API endpoint, plus optional search filters and the
+    conversation the question belongs to.
     """
     
     text: str = Field(
@@ -103,6 +171,126 @@ class ChatQuery(BaseModel):
         max_length=1000,
         description="User question or query text"
     )
+    filters: Optional[SearchFilters] = Field(
+        default=None,
+        description="Optional restrictions on the searched documents"
+    )
+    conversation_id: Optional[str] = Field(
+        default=None,
+        min_length=8,
+        max_length=64,
+        pattern=r"^[A-Za-z0-9_-]+$",
+        description="Client-generated conversation identifier for follow-up questions, scoped to the session cookie"
+    )
+
+
+class BatchChatQuery(BaseModel):
+    """Many chat queries answered in one request.
+    
+    Used by internal tools and nightly reports; conversation memory does not
+    apply to batch items.
+    """
+    
+    queries: List[ChatQuery] = Field(
+        ...,
+        min_length=1,
+        max_length=500,
+        description="Queries to answer, each with optional filters"
+    )
+
+
+class BatchChatResult(BaseModel):
+    """One line of the NDJSON batch response, emitted as each item completes."""
+    
+    index: int = Field(
+        ...,
+        description="Position of the query in the request"
+    )
+    response: Optional[EnrichedChatResponse] = Field(
+        default=None,
+        description="Answer for the query, if it succeeded"
+    )
+    error: Optional[str] = Field(
+        default=None,
+        description="Error message, if the query failed"
+    )
+
+
+class SearchQuery(BaseModel):
+    """Retrieval-only search request.
+    
+    The first page is requested with text (and optional filters); later
+    pages only need the cursor returned with the previous page.
+    """
+    
+    text: Optional[str] = Field(
+        default=None,
+        min_length=1,
+        max_length=1000,
+        description="Query text; required unless a cursor is given"
+    )
+    filters: Optional[SearchFilters] = Field(
+        default=None,
+        description="Optional restrictions on the searched documents"
+    )
+    limit: int = Field(
+        default=10,
+        ge=1,
+        le=50,
+        description="Number of results per page"
+    )
+    cursor: Optional[str] = Field(
+        default=None,
+        max_length=8192,
+        description="Opaque cursor from a previous page"
+    )
+    
+    @model_validator(mode="after")
+    def validate_text_or_cursor(self) -> "SearchQuery":
+        """A search needs either a query text or a cursor to continue from."""
+        if not self.text and not self.cursor:
+            raise ValueError("Either text or cursor is required")
+        return self
+
+
+class SearchCursorState(BaseModel):
+    """Decoded /v1/search cursor, validated like the request that started the search.
+    
+    Field names are abbreviated to keep cursors short.
+    """
+    
+    t: str = Field(..., min_length=1, max_length=1000, description="Query text")
+    f: Optional[SearchFilters] = Field(default=None, description="Search filters")
+    o: int = Field(..., ge=0, description="Offset of the next page")
+    l: int = Field(default=10, ge=1, le=50, description="Page size")
+    e: str = Field(..., max_length=8192, description="Query embedding (utils.cursor.encode_vector)")
+    v: str = Field(..., max_length=64, description="Corpus version the previous pages were ranked against")
+
+
+class SearchResult(BaseModel):
+    """One retrieved fragment with its score and source document."""
+    
+    chunk: ChunkData = Field(
+        ...,
+        description="Matching fragment, including its similarity score"
+    )
+    document: DocumentSource = Field(
+        ...,
+        description="Metadata of the document the fragment belongs to"
+    )
+
+
+class SearchResponse(BaseModel):
+    """A page of retrieval-only search results."""
+    
+    results: List[SearchResult] = Field(
+        default_factory=list,
+        description="Ranked fragments for this page"
+    )
+    next_cursor: Optional[str] = Field(
+        default=None,
+        description="Cursor for the next page, or null on the last page"
+    )
 
 
 class ChatResponse(BaseModel):
@@ -131,4 +319,46 @@ class HealthCheck(BaseModel):
     
     status: str = Field(default="ok")
     service: str = Field(default="dof-chat")
-    version: str = Field(default="0.1.0")
\ No newline at end of file
+    version: str = Field(default="0.1.0")
+
+
+class ReadinessCheck(BaseModel):
+    """Readiness probe response: whether this worker should receive traffic.
+    
+    Separate from HealthCheck (liveness), which succeeds as soon as the
+    process answers, even while models and indexes are still loading.
+    """
+    
+    status: str = Field(
+        default="starting",
+        description="\"ready\" once warmed up, otherwise \"starting\""
+    )
+    checks: Dict[str, bool] = Field(
+        default_factory=dict,
+        description="Result of each readiness check (database, embedding_model, search_index, warm_up)"
+    )
+
+
+class MetricsSnapshot(BaseModel):
+    """Point-in-time copy of the worker's in-process metrics.
+    
+    Counters only grow; gauges reflect current values such as in-flight requests.
+    """
+    
+    counters: Dict[str, int] = Field(default_factory=dict)
+    gauges: Dict[str, float] = Field(default_factory=dict)
+
+
+class ProfileFile(BaseModel):
+    """One file of a captured request profile."""
+    
+    name: str = Field(..., description="File name (<capture>.prof for pstats, <capture>.txt for the summary)")
+    capture: str = Field(..., description="Capture id, also sent in the X-Profile-Id response header")
+    size: int = Field(..., description="File size in bytes")
+    modified: str = Field(..., description="Last modification time (ISO 8601, UTC)")
+
+
+class ProfileList(BaseModel):
+    """Captured request profiles, newest first."""
+    
+    profiles: List[ProfileFile] = Field(default_factory=list)
@@ -0,0 +1,546 @@
+"""Recency-partitioned vector index for chunk embeddings.
+
+Chunk embeddings are stored newest-first in one contiguous, memory-mapped
+matrix, split into publication year/month partitions.
+
+Every row of a partition lies in a cone around the partition's mean
+direction, whose width is stored at build time (min_cos). For a query, the
+cone bounds the similarity any row of the partition can reach. Partitions
+are visited in decreasing order of that bound plus their recency bonus, and
+the scan stops as soon as the next bound cannot beat the running top-k.
+That rule is exact but only prunes when partitions are topically narrow, so
+settings.index_scan_budget also caps the rows scanned per query: once top_k
+hits are found and the budget is spent, the partitions with lower bounds
+are left out. Partitions and rows scanned
+are counted in the metrics (index_partitions_scanned_total,
+index_rows_scanned_total), and tools.evaluate_search measures the recall
+the budget costs against exact search.
+
+On-disk layout (settings.index_path):
+- manifest.json: dimension, partitions (key, row range, radius, min_cos), vocabularies
+- vectors.npy: (N, dim) float32, L2-normalized, sorted newest partition first
+- centers.npy: (P, dim) float32 mean vector of each partition
+- chunk_ids.npy, dates.npy, doc_types.npy, agencies.npy: per-row metadata
+
+The index only returns (chunk_id, score) pairs; chunk payloads are fetched
+from DuckDB for the final top-k.
+"""
+
+import json
+import mmap
+import os
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from config import settings
+from schemas import SearchFilters
+from utils.logger import logger
+from utils.metrics import metrics
+
+MANIFEST_FILE = "manifest.json"
+_ARRAYS = ("vectors", "centers", "chunk_ids", "dates", "doc_types", "agencies")
+# Queries scored together by search_batch; bounds the (rows, queries) score matrix
+QUERY_CHUNK_SIZE = 64
+# Added to similarity bounds so float32 rounding never prunes a partition that ties
+_BOUND_SLACK = 1e-5
+_EPOCH = date(1970, 1, 1)
+_UNDATED_KEY = "sin-fecha"
+
+
+def _month_index(value: date) -> int:
+    return value.year * 12 + value.month - 1
+
+
+def days_since_epoch(value: date) -> int:
+    """Publication date as stored in the index arrays: days since 1970-01-01."""
+    return (value - _EPOCH).days
+
+
+def recency_bonus(partition_key: str, today: Optional[date] = None) -> float:
+    """Score bonus for a partition, decaying with its age in months.
+
+    The newest partition gets settings.recency_bias; the bonus halves every
+    settings.recency_half_life_months. Undated partitions get no bonus.
+    """
+    if settings.recency_bias <= 0 or partition_key == _UNDATED_KEY:
+        return 0.0
+    year, month = (int(part) for part in partition_key.split("-"))
+    age_months = max(_month_index(today or date.today()) - (year * 12 + month - 1), 0)
+    return settings.recency_bias * 0.5 ** (age_months / settings.recency_half_life_months)
+
+
+def row_recency_bonus(days: np.ndarray, today: Optional[date] = None) -> np.ndarray:
+    """Per-row version of recency_bonus for rows given as days since epoch.
+
+    Undated rows (the int32 minimum) get no bonus.
+    """
+    if settings.recency_bias <= 0:
+        return np.zeros(days.shape, dtype=np.float32)
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) + 1970 * 12
+    age_months = np.maximum(_month_index(today or date.today()) - months, 0)
+    bonus = settings.recency_bias * 0.5 ** (age_months / settings.recency_half_life_months)
+    bonus[days == np.iinfo(np.int32).min] = 0.0
+    return bonus.astype(np.float32)
+
+
+def prefetch_files(paths: List[str]) -> int:
+    """Fault every page of the given files into the page cache.
+
+    Each file is mapped read-only on its own, advised as needed soon where
+    the platform supports it, and read one byte per page. The page cache is
+    shared, so index arrays memory-mapped from the same files (in this and
+    every other worker) find their pages resident.
+
+    Args:
+        paths: Files to load
+
+    Returns:
+        int: Number of bytes covered
+    """
+    total = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, "madvise"):
+                    mapped.madvise(mmap.MADV_WILLNEED)
+                pages = np.frombuffer(mapped, dtype=np.uint8)[::mmap.PAGESIZE]
+                int(pages.sum())
+                # The view must go before the map can be closed
+                del pages
+        total += size
+    return total
+
+
+def row_filter_mask(
+    filters: Optional[SearchFilters],
+    doc_types: np.ndarray,
+    agencies: np.ndarray,
+    dates: np.ndarray,
+    doc_type_codes: Dict[str, int],
+    agency_codes: Dict[str, int]
+) -> Optional[np.ndarray]:
+    """Boolean mask of rows passing the filters, or None when nothing is filtered.
+
+    Args:
+        filters: Search filters
+        doc_types, agencies: Per-row vocabulary codes
+        dates: Per-row publication date in days since epoch
+        doc_type_codes, agency_codes: Vocabulary name to code
+
+    Returns:
+        Optional[np.ndarray]: Mask aligned with the given rows
+    """
+    if filters is None or filters.is_empty():
+        return None
+
+    mask = np.ones(dates.shape[0], dtype=bool)
+    if filters.doc_type:
+        mask &= doc_types == doc_type_codes.get(filters.doc_type, -1)
+    if filters.agency:
+        mask &= agencies == agency_codes.get(filters.agency, -1)
+    if filters.date_from:
+        mask &= dates >= days_since_epoch(filters.date_from)
+    if filters.date_to:
+        mask &= dates <= days_since_epoch(filters.date_to)
+    return mask
+
+
+class PartitionedIndex:
+    """Cosine-similarity search over recency partitions with bounded early termination."""
+
+    def __init__(self, path: str, manifest: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+        self.path = path
+        self.dimension = manifest["dimension"]
+        self.partitions = manifest["partitions"]
+        self.doc_type_codes = {name: code for code, name in enumerate(manifest["doc_types"])}
+        self.agency_codes = {name: code for code, name in enumerate(manifest["agencies"])}
+        self.vectors = arrays["vectors"]
+        self.centers = arrays["centers"]
+        self.chunk_ids = arrays["chunk_ids"]
+        self.dates = arrays["dates"]
+        self.doc_types = arrays["doc_types"]
+        self.agencies = arrays["agencies"]
+
+        centers = np.asarray(self.centers, dtype=np.float32).reshape(-1, self.dimension)
+        self._axes = centers / np.maximum(np.linalg.norm(centers, axis=1, keepdims=True), 1e-12)
+        self._radii = np.asarray([partition["radius"] for partition in self.partitions], dtype=np.float32)
+        # Indexes built before min_cos was stored get a cone that bounds nothing
+        min_cos = np.asarray([partition.get("min_cos", -1.0) for partition in self.partitions], dtype=np.float32)
+        self._cone_angles = np.arccos(np.clip(min_cos, -1.0, 1.0))
+        self._bonus_day: Optional[date] = None
+        self._bonus_values = np.zeros(len(self.partitions), dtype=np.float32)
+
+    @classmethod
+    def exists(cls, path: str = None) -> bool:
+        """Whether an index has been built at path."""
+        return os.path.exists(os.path.join(path or settings.index_path, MANIFEST_FILE))
+
+    @classmethod
+    def load(cls, path: str = None) -> "PartitionedIndex":
+        """Open an index with all arrays memory-mapped read-only.
+
+        Args:
+            path: Index directory
+
+        Returns:
+            PartitionedIndex: Loaded index
+        """
+        path = path or settings.index_path
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        index = cls(path, manifest, arrays)
+        logger.info(f"Loaded search index: {len(index)} vectors in {len(index.partitions)} partitions")
+        return index
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def prefetch(self) -> int:
+        """Fault every page of the index files into the page cache.
+
+        The first queries after startup then do not pay for disk reads.
+        Pages stay shared between workers.
+
+        Returns:
+            int: Number of bytes covered
+        """
+        return prefetch_files([os.path.join(self.path, f"{name}.npy") for name in _ARRAYS])
+
+    def get_vectors(self, positions: np.ndarray) -> np.ndarray:
+        """Return the stored (normalized) vectors at the given row positions."""
+        return np.asarray(self.vectors[positions])
+
+    def _bonuses(self, today: date) -> np.ndarray:
+        """Recency bonus of every partition, recomputed once per day."""
+        if self._bonus_day != today:
+            self._bonus_values = np.asarray(
+                [recency_bonus(partition["key"], today) for partition in self.partitions], dtype=np.float32
+            )
+            self._bonus_day = today
+        return self._bonus_values
+
+    def _upper_bounds(self, queries: np.ndarray) -> np.ndarray:
+        """Highest cosine similarity any row of each partition can have with each query.
+
+        A row within angle a of the partition axis is at least angle(q, axis) - a
+        away from the query. The older center + radius bound is kept where it
+        is tighter.
+
+        Args:
+            queries: (Q, dim) normalized query vectors
+
+        Returns:
+            np.ndarray: (partitions, queries) bounds, without recency bonus
+        """
+        angles = np.arccos(np.clip(self._axes @ queries.T, -1.0, 1.0))
+        cone = np.cos(np.maximum(angles - self._cone_angles[:, None], 0.0))
+        ball = self.centers @ queries.T + self._radii[:, None]
+        return np.minimum(cone, ball) + _BOUND_SLACK
+
+    def _record_scan(self, queries: int, partitions: int, rows: int, budget_stop: bool):
+        metrics.increment("index_searches_total", queries)
+        metrics.increment("index_partitions_scanned_total", partitions * queries)
+        metrics.increment("index_rows_scanned_total", rows * queries)
+        if budget_stop:
+            metrics.increment("index_scan_budget_stops_total", queries)
+
+    def search(
+        self,
+        embedding: List[float],
+        top_k: int,
+        filters: Optional[SearchFilters] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Find the top_k chunks by cosine similarity plus recency bonus.
+
+        Exact unless settings.index_scan_budget stops the scan before the
+        similarity bounds do.
+
+        Args:
+            embedding: Query embedding vector
+            top_k: Number of results to return
+            filters: Optional metadata restrictions applied before ranking
+
+        Returns:
+            Tuple of (chunk_ids, scores, row positions), sorted by descending score
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+
+        best_scores = np.empty(0, dtype=np.float32)
+        best_positions = np.empty(0, dtype=np.int64)
+        threshold = -np.inf
+        scanned = scanned_partitions = 0
+        budget_stop = False
+        budget = settings.index_scan_budget
+        bonuses = self._bonuses(date.today())
+
+        matches = np.fromiter(
+            (self._partition_matches(partition, filters) for partition in self.partitions),
+            dtype=bool, count=len(self.partitions)
+        )
+        bounds = self._upper_bounds(query[None, :])[:, 0] + bonuses
+        bounds[~matches] = -np.inf
+
+        # Most promising first; ties keep newest-first order
+        for number in np.argsort(-bounds, kind="stable"):
+            if bounds[number] == -np.inf:
+                break
+            if best_scores.size >= top_k:
+                if bounds[number] <= threshold:
+                    break
+                if budget and scanned >= budget:
+                    budget_stop = True
+                    break
+
+            partition = self.partitions[number]
+            start, end = partition["start"], partition["end"]
+            bonus = bonuses[number]
+
+            positions = np.arange(start, end)
+            mask = self._row_mask(start, end, filters)
+            if mask is not None:
+                positions = positions[mask]
+                if positions.size == 0:
+                    continue
+                vectors = self.vectors[positions]
+            else:
+                vectors = self.vectors[start:end]
+
+            scores = vectors @ query + bonus
+            scanned += positions.size
+            scanned_partitions += 1
+
+            best_scores = np.concatenate([best_scores, scores])
+            best_positions = np.concatenate([best_positions, positions])
+            if best_scores.size > top_k:
+                keep = np.argpartition(best_scores, -top_k)[-top_k:]
+                best_scores, best_positions = best_scores[keep], best_positions[keep]
+            if best_scores.size >= top_k:
+                threshold = float(best_scores.min())
+
+        order = np.argsort(-best_scores)
+        best_scores, best_positions = best_scores[order], best_positions[order]
+        self._record_scan(1, scanned_partitions, scanned, budget_stop)
+        logger.debug("Index search scanned %d of %d vectors", scanned, len(self))
+        return np.asarray(self.chunk_ids[best_positions]), best_scores, best_positions
+
+    def search_batch(
+        self,
+        embeddings: List[List[float]],
+        top_k: int
+    ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Find the top_k chunks for many queries with one matrix product per partition.
+
+        Uses the same recency bonus, bounds and scan budget as search().
+        Partitions are visited in decreasing order of their best bound over
+        the chunk; one is skipped when it cannot improve any query, and the
+        scan stops once no remaining partition can. Queries
+        are processed QUERY_CHUNK_SIZE at a time, so the per-partition score
+        matrix stays bounded however large the batch is.
+
+        Args:
+            embeddings: Query embedding vectors
+            top_k: Number of results per query
+
+        Returns:
+            List of (chunk_ids, scores, row positions) per query, sorted by descending score
+        """
+        results = []
+        for first in range(0, len(embeddings), QUERY_CHUNK_SIZE):
+            results.extend(self._search_chunk(embeddings[first:first + QUERY_CHUNK_SIZE], top_k))
+        return results
+
+    def _search_chunk(
+        self,
+        embeddings: List[List[float]],
+        top_k: int
+    ) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        num_queries = queries.shape[0]
+
+        best_scores = np.full((top_k, num_queries), -np.inf, dtype=np.float32)
+        best_positions = np.full((top_k, num_queries), -1, dtype=np.int64)
+        scanned = scanned_partitions = 0
+        budget_stop = False
+        budget = settings.index_scan_budget
+        bonuses = self._bonuses(date.today())
+
+        bounds = self._upper_bounds(queries) + bonuses[:, None]
+        order = np.argsort(-bounds.max(axis=1), kind="stable")
+        # Per query, the best bound of this partition or any visited after it
+        remaining = np.maximum.accumulate(bounds[order][::-1], axis=0)[::-1]
+
+        for step, number in enumerate(order):
+            # -inf until a query has top_k hits, so nothing is pruned before that
+            thresholds = best_scores.min(axis=0)
+            if np.all(remaining[step] <= thresholds):
+                break
+            if budget and scanned >= budget and np.all(np.isfinite(thresholds)):
+                budget_stop = True
+                break
+            if np.all(bounds[number] <= thresholds):
+                continue
+
+            partition = self.partitions[number]
+            start, end = partition["start"], partition["end"]
+            bonus = bonuses[number]
+
+            # (rows, queries) scores for the whole chunk in one product, cut
+            # to each query's top_k before merging with the running results
+            scores = self.vectors[start:end] @ queries.T + bonus
+            scanned += end - start
+            scanned_partitions += 1
+            if scores.shape[0] > top_k:
+                top = np.argpartition(-scores, top_k - 1, axis=0)[:top_k]
+                scores = np.take_along_axis(scores, top, axis=0)
+                positions = top + start
+            else:
+                positions = np.broadcast_to(np.arange(start, end)[:, None], scores.shape)
+
+            combined_scores = np.concatenate([best_scores, scores])
+            combined_positions = np.concatenate([best_positions, positions])
+            keep = np.argpartition(-combined_scores, top_k - 1, axis=0)[:top_k]
+            best_scores = np.take_along_axis(combined_scores, keep, axis=0)
+            best_positions = np.take_along_axis(combined_positions, keep, axis=0)
+
+        self._record_scan(num_queries, scanned_partitions, scanned, budget_stop)
+        order = np.argsort(-best_scores, axis=0)
+        best_scores = np.take_along_axis(best_scores, order, axis=0)
+        best_positions = np.take_along_axis(best_positions, order, axis=0)
+
+        results = []
+        for column in range(num_queries):
+            valid = best_positions[:, column] >= 0
+            positions = best_positions[valid, column]
+            results.append((np.asarray(self.chunk_ids[positions]), best_scores[valid, column], positions))
+        return results
+
+    def _partition_matches(self, partition: Dict[str, Any], filters: Optional[SearchFilters]) -> bool:
+        """Prune whole partitions outside the requested date range."""
+        if filters is None or not (filters.date_from or filters.date_to):
+            return True
+        if partition["key"] == _UNDATED_KEY:
+            return False
+        first_day, last_day = partition["first_day"], partition["last_day"]
+        if filters.date_from and last_day < days_since_epoch(filters.date_from):
+            return False
+        if filters.date_to and first_day > days_since_epoch(filters.date_to):
+            return False
+        return True
+
+    def _row_mask(self, start: int, end: int, filters: Optional[SearchFilters]) -> Optional[np.ndarray]:
+        """Boolean mask of rows in [start, end) that pass the filters, or None for all."""
+        return row_filter_mask(
+            filters,
+            self.doc_types[start:end],
+            self.agencies[start:end],
+            self.dates[start:end],
+            self.doc_type_codes,
+            self.agency_codes
+        )
+
+
+def build_partitioned_index(connection, path: str = None, batch_size: int = 10000) -> Dict[str, Any]:
+    """Export chunk embeddings from DuckDB into a partitioned index directory.
+
+    Args:
+        connection: Open DuckDB connection with chunks and documents tables
+        path: Output directory (created if missing)
+        batch_size: Rows fetched from DuckDB per batch
+
+    Returns:
+        Dict: The written manifest
+    """
+    path = path or settings.index_path
+    os.makedirs(path, exist_ok=True)
+
+    total = connection.execute("SELECT count(*) FROM chunks").fetchone()[0]
+    dimension = settings.embedding_dimension
+
+    vectors = np.lib.format.open_memmap(
+        os.path.join(path, "vectors.npy"), mode="w+", dtype=np.float32, shape=(total, dimension)
+    )
+    chunk_ids = np.empty(total, dtype=np.int64)
+    dates = np.full(total, np.iinfo(np.int32).min, dtype=np.int32)
+    doc_types = np.empty(total, dtype=np.int16)
+    agencies = np.empty(total, dtype=np.int16)
+    keys: List[str] = []
+    doc_type_vocab: Dict[str, int] = {}
+    agency_vocab: Dict[str, int] = {}
+
+    cursor = connection.execute("""
+        SELECT c.chunk_id, c.embedding, c.doc_type, d.agency, d.publication_date
+        FROM chunks c
+        LEFT JOIN documents d ON d.doc_id = c.doc_id
+        ORDER BY d.publication_date DESC NULLS LAST, c.chunk_id
+    """)
+
+    row = 0
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        end = row + len(batch)
+        embeddings = np.asarray([item[1] for item in batch], dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        vectors[row:end] = embeddings
+
+        for offset, (chunk_id, _, doc_type, agency, publication_date) in enumerate(batch):
+            chunk_ids[row + offset] = chunk_id
+            doc_types[row + offset] = doc_type_vocab.setdefault(doc_type or "DOCUMENTO", len(doc_type_vocab))
+            agencies[row + offset] = agency_vocab.setdefault(agency or "", len(agency_vocab))
+            if publication_date is not None:
+                dates[row + offset] = days_since_epoch(publication_date)
+                keys.append(f"{publication_date.year:04d}-{publication_date.month:02d}")
+            else:
+                keys.append(_UNDATED_KEY)
+        row = end
+
+    # Rows are sorted newest-first, so each partition is a contiguous range
+    partitions = []
+    centers = []
+    start = 0
+    for position in range(1, total + 1):
+        if position < total and keys[position] == keys[start]:
+            continue
+        block = vectors[start:position]
+        center = block.mean(axis=0)
+        radius = float(np.linalg.norm(block - center, axis=1).max())
+        axis = center / max(float(np.linalg.norm(center)), 1e-12)
+        partitions.append({
+            "key": keys[start],
+            "start": start,
+            "end": position,
+            "radius": radius,
+            "min_cos": float((block @ axis).min()),
+            "first_day": int(dates[start:position].min()),
+            "last_day": int(dates[start:position].max()),
+        })
+        centers.append(center)
+        start = position
+
+    vectors.flush()
+    np.save(os.path.join(path, "centers.npy"), np.asarray(centers, dtype=np.float32).reshape(-1, dimension))
+    np.save(os.path.join(path, "chunk_ids.npy"), chunk_ids)
+    np.save(os.path.join(path, "dates.npy"), dates)
+    np.save(os.path.join(path, "doc_types.npy"), doc_types)
+    np.save(os.path.join(path, "agencies.npy"), agencies)
+
+    manifest = {
+        "dimension": dimension,
+        "count": total,
+        "partitions": partitions,
+        "doc_types": list(doc_type_vocab),
+        "agencies": list(agency_vocab),
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"Built search index at {path}: {total} vectors in {len(partitions)} partitions")
+    return manifest
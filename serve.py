@@ -0,0 +1,178 @@
+"""Production prefork server for DOF Chat.
+
+The master process imports the application, loads settings and the embedding
+model once, and binds the listening socket. It then forks the workers, which
+inherit the already-loaded model weights and share their memory pages
+copy-on-write with the master and with each other.
+
+The search index is memory-mapped read-only, so its pages live in the OS
+page cache and are shared by every worker. DuckDB connections are not
+fork-safe, so the master closes its connection before forking and each
+worker reopens the read-only database lazily. Each worker then watches for
+new corpus snapshots (see corpus.py) and swaps to them on its own, so new
+DOF editions are served without restarting anything.
+
+With settings.embedding_workers > 0, the master first forks that many
+embedding inference processes (see embedding_workers.py), and the web
+workers embed queries through them instead of running the model.
+
+Usage:
+    python serve.py
+"""
+
+import gc
+import os
+import signal
+import socket
+import sys
+from typing import Dict, Tuple
+from config import settings
+from utils.logger import logger, stop_listener
+
+
+def _set_torch_threads(num_threads: int):
+    """Limit torch intra-op threads if torch is installed."""
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(num_threads)
+
+
+def _preload():
+    """Load everything workers should share before forking.
+
+    Returns:
+        The ASGI application object
+    """
+    from main import app
+    from rag_service import rag_service
+
+    rag_service.initialize()
+    rag_service.close_connections()
+
+    # Move preloaded objects out of the GC's reach so collections in workers
+    # do not write to (and un-share) their pages
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def _bind_socket() -> socket.socket:
+    """Create the listening socket shared by all workers."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((settings.server_host, settings.server_port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, worker_id: int):
+    """Serve requests in a forked worker until it is told to stop."""
+    import uvicorn
+
+    _set_torch_threads(settings.torch_threads_per_worker)
+
+    logger.info(f"Worker {worker_id} started (pid {os.getpid()})")
+    config = uvicorn.Config(app, lifespan="on", log_level="info", access_log=False)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(target, *args) -> int:
+    """Fork a process running target(*args) and return its pid."""
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            target(*args)
+        except BaseException as e:
+            logger.error(f"Process {os.getpid()} crashed: {e}", exc_info=True)
+            exit_code = 1
+        finally:
+            # os._exit skips atexit handlers; flush queued log records first
+            stop_listener()
+            os._exit(exit_code)
+    return pid
+
+
+def _start_embedding_workers() -> Tuple[object, socket.socket]:
+    """Load the embedding model and bind the socket the inference processes share.
+
+    Returns:
+        Tuple of (model, listening socket), or (None, None) when disabled or the model failed to load
+    """
+    if settings.embedding_workers <= 0 or settings.embedding_backend != "sentence-transformers":
+        return None, None
+    from embedding_workers import bind_socket, load_embedding_model
+
+    model = load_embedding_model()
+    if model is None:
+        logger.error("Embedding workers disabled: model failed to load")
+        return None, None
+    return model, bind_socket()
+
+
+def main():
+    """Preload the application, fork workers and supervise them."""
+    logger.info(f"Starting DOF Chat production server with {settings.server_workers} workers")
+    # Keep the master single-threaded so no OpenMP pool is alive at fork time
+    _set_torch_threads(1)
+
+    # Bind the embedding socket before preloading, so the service embeds
+    # through the inference processes instead of loading its own model copy
+    model, embedding_sock = _start_embedding_workers()
+    processes: Dict[str, Tuple] = {}
+    if model is not None:
+        from embedding_workers import serve as serve_embeddings
+        for worker_id in range(settings.embedding_workers):
+            processes[f"embedding worker {worker_id}"] = (serve_embeddings, model, embedding_sock, worker_id)
+
+    app = _preload()
+    sock = _bind_socket()
+    for worker_id in range(settings.server_workers):
+        processes[f"worker {worker_id}"] = (_run_worker, app, sock, worker_id)
+
+    workers: Dict[int, str] = {}
+    for name, (target, *args) in processes.items():
+        workers[_spawn(target, *args)] = name
+
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        logger.info("Shutting down workers")
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    # Reap workers; replace any that die unexpectedly
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        name = workers.pop(pid, None)
+        if name is None or stopping:
+            continue
+        logger.warning(f"{name.capitalize()} (pid {pid}) exited with status {status}, restarting")
+        target, *args = processes[name]
+        workers[_spawn(target, *args)] = name
+
+    sock.close()
+    if embedding_sock is not None:
+        embedding_sock.close()
+        os.unlink(settings.embedding_socket_path)
+    logger.info("DOF Chat production server stopped")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
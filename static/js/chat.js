@@ -12,10 +12,12 @@ class ChatClient {
         /<object/i,
         /<embed/i
     ];
+    static DEFAULT_RETRY_AFTER_SECONDS = 5;
     static REQUIRED_ACCORDION_ELEMENTS = ['embedded-sources-container', '<details', '<summary'];
     static MESSAGES = {
         LOADING: 'Procesando tu consulta...',
         ERROR: 'Lo siento, hubo un error al procesar tu consulta. Por favor, inténtalo de nuevo.',
+        BUSY: (seconds) => `El servicio está muy ocupado en este momento. Podrás reenviar tu consulta en ${seconds} segundos.`,
         SENDING: 'Enviando...',
         SEND: 'Enviar'
     };
@@ -29,9 +31,24 @@ class ChatClient {
             sendButton: document.getElementById('send-button')
         };
         
+        this.conversationId = this.getConversationId();
+        // In-flight /chat request; a new submission aborts it
+        this.pendingRequest = null;
         this.initializeEventListeners();
     }
 
+    getConversationId() {
+        // One conversation per browser tab; survives reloads but not new tabs
+        let conversationId = sessionStorage.getItem('dof-chat-conversation-id');
+        if (!conversationId) {
+            conversationId = window.crypto && crypto.randomUUID
+                ? crypto.randomUUID()
+                : Date.now().toString(36) + Math.random().toString(36).substr(2, 9);
+            sessionStorage.setItem('dof-chat-conversation-id', conversationId);
+        }
+        return conversationId;
+    }
+
     initializeEventListeners() {
         this.elements.chatForm.addEventListener('submit', (e) => {
             e.preventDefault();
@@ -44,42 +61,75 @@ class ChatClient {
                 this.handleSubmit();
             }
         });
+
+        // Closing the connection lets the server stop work nobody will read
+        window.addEventListener('pagehide', () => this.pendingRequest?.abort());
     }
 
     async handleSubmit() {
         const message = this.elements.chatInput.value.trim();
         if (!message) return;
 
-        this.setInputEnabled(false);
+        // A resubmission replaces the question still being answered
+        this.pendingRequest?.abort();
+        const controller = new AbortController();
+        this.pendingRequest = controller;
+
         this.elements.chatInput.value = '';
         this.addMessage(message, 'user');
         
         const loadingId = this.addMessage(ChatClient.MESSAGES.LOADING, 'loading');
 
         try {
-            const response = await this.sendChatRequest(message);
+            const response = await this.sendChatRequest(message, controller.signal);
             this.removeMessage(loadingId);
             this.addBotResponse(response);
         } catch (error) {
-            console.error('Chat error:', error);
             this.removeMessage(loadingId);
+            if (error.name === 'AbortError') {
+                return;
+            }
+            if (error.status === 429) {
+                // Server is shedding load: keep the question and retry later
+                this.handleBusy(message, error.retryAfter);
+                return;
+            }
+            console.error('Chat error:', error);
             this.addMessage(ChatClient.MESSAGES.ERROR, 'bot error-message');
         } finally {
+            if (this.pendingRequest === controller) {
+                this.pendingRequest = null;
+            }
+        }
+        this.elements.chatInput.focus();
+    }
+
+    handleBusy(message, retryAfter) {
+        const seconds = retryAfter || ChatClient.DEFAULT_RETRY_AFTER_SECONDS;
+        this.addMessage(ChatClient.MESSAGES.BUSY(seconds), 'bot error-message');
+        this.elements.chatInput.value = message;
+        this.setInputEnabled(false);
+
+        setTimeout(() => {
             this.setInputEnabled(true);
             this.elements.chatInput.focus();
-        }
+        }, seconds * 1000);
     }
 
-    async sendChatRequest(message) {
+    async sendChatRequest(message, signal) {
         const response = await fetch('/api/v1/chat', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ text: message })
+            body: JSON.stringify({ text: message, conversation_id: this.conversationId }),
+            signal
         });
 
         if (!response.ok) {
             const errorData = await response.json().catch(() => ({}));
-            throw new Error(errorData.detail || `HTTP ${response.status}`);
+            const error = new Error(errorData.detail || `HTTP ${response.status}`);
+            error.status = response.status;
+            error.retryAfter = parseInt(response.headers.get('Retry-After'), 10) || null;
+            throw error;
         }
 
         return response.json();
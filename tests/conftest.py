@@ -0,0 +1,11 @@
+"""Shared fixtures."""
+
+import pytest
+from config import settings
+from tests.synthetic_corpus import DIMENSION
+
+
+@pytest.fixture
+def small_dimension(monkeypatch):
+    monkeypatch.setattr(settings, "embedding_dimension", DIMENSION)
+    return DIMENSION
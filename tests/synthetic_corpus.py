@@ -0,0 +1,60 @@
+"""Small synthetic DOF corpora in in-memory DuckDB databases, for index tests."""
+
+import json
+from datetime import date
+import duckdb
+import numpy as np
+
+DIMENSION = 16
+
+
+def make_corpus(months: int = 24, rows_per_month: int = 40, spread: float = 0.3, seed: int = 0):
+    """Chunks and documents spread over consecutive months, one topic direction per month.
+
+    Args:
+        months: Number of publication months, newest December 2024
+        rows_per_month: Chunks per month
+        spread: Noise added to each month's topic; large values make months overlap
+        seed: Random seed
+
+    Returns:
+        Open DuckDB connection with documents and chunks tables
+    """
+    rng = np.random.default_rng(seed)
+    connection = duckdb.connect()
+    connection.execute(
+        "CREATE TABLE documents (doc_id VARCHAR, title VARCHAR, url VARCHAR, publication_date DATE, "
+        "doc_type VARCHAR, agency VARCHAR)"
+    )
+    connection.execute(
+        f"CREATE TABLE chunks (chunk_id BIGINT, doc_id VARCHAR, header VARCHAR, text VARCHAR, "
+        f"doc_type VARCHAR, token_count INTEGER, embedding FLOAT[{DIMENSION}])"
+    )
+    documents, chunks = [], []
+    for month in range(months):
+        year, month_of_year = 2024 - month // 12, 12 - month % 12
+        topic = rng.normal(size=DIMENSION)
+        for row in range(rows_per_month):
+            chunk_id = month * rows_per_month + row
+            doc_id = f"d{chunk_id}"
+            doc_type = ("LEY", "ACUERDO", "DECRETO")[chunk_id % 3]
+            day = date(year, month_of_year, 1 + row % 28).isoformat()
+            documents.append((doc_id, f"Documento {chunk_id}", "u", day, doc_type, ("SHCP", "SEP")[chunk_id % 2]))
+            vector = topic + spread * np.linalg.norm(topic) * rng.normal(size=DIMENSION)
+            chunks.append((chunk_id, doc_id, "h", "texto", doc_type, 10, vector.tolist()))
+
+    # Each column is bound as one JSON string; binding Python values one by
+    # one is orders of magnitude slower
+    connection.execute(
+        "INSERT INTO documents SELECT UNNEST(?::JSON::VARCHAR[]), UNNEST(?::JSON::VARCHAR[]), "
+        "UNNEST(?::JSON::VARCHAR[]), UNNEST(?::JSON::DATE[]), UNNEST(?::JSON::VARCHAR[]), "
+        "UNNEST(?::JSON::VARCHAR[])",
+        [json.dumps(column) for column in zip(*documents)]
+    )
+    connection.execute(
+        "INSERT INTO chunks SELECT UNNEST(?::JSON::BIGINT[]), UNNEST(?::JSON::VARCHAR[]), "
+        "UNNEST(?::JSON::VARCHAR[]), UNNEST(?::JSON::VARCHAR[]), UNNEST(?::JSON::VARCHAR[]), "
+        f"UNNEST(?::JSON::INTEGER[]), UNNEST(?::JSON::FLOAT[{DIMENSION}][])",
+        [json.dumps(column) for column in zip(*chunks)]
+    )
+    return connection
@@ -0,0 +1,145 @@
+"""Tests for the per-user fair scheduling in utils.admission."""
+
+import asyncio
+import pytest
+from utils.admission import AdmissionController, AdmissionRejected
+
+
+def _controller(**options) -> AdmissionController:
+    defaults = dict(
+        max_concurrency=1, max_queue=30, queue_timeout=5.0,
+        user_rate_per_minute=0, user_burst=1, max_user_queue=30, name="test"
+    )
+    defaults.update(options)
+    return AdmissionController(**defaults)
+
+
+async def _hold(controller: AdmissionController, key: str, release: asyncio.Event, admitted: asyncio.Event):
+    async with controller.slot(key):
+        admitted.set()
+        await release.wait()
+
+
+async def _run(controller: AdmissionController, key: str, order: list):
+    async with controller.slot(key):
+        order.append(key)
+
+
+def test_light_users_overtake_a_flooding_user():
+    async def scenario():
+        controller = _controller()
+        release, admitted = asyncio.Event(), asyncio.Event()
+        blocker = asyncio.create_task(_hold(controller, "heavy", release, admitted))
+        await admitted.wait()
+
+        # 24 requests from one user are queued before 6 other users send one each
+        order = []
+        keys = ["heavy"] * 24 + [f"light-{number}" for number in range(6)]
+        tasks = []
+        for key in keys:
+            tasks.append(asyncio.create_task(_run(controller, key, order)))
+            await asyncio.sleep(0)
+        assert controller._waiting == 30
+
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+        return order
+
+    order = asyncio.run(scenario())
+    assert len(order) == 30
+    assert order[:6] == [f"light-{number}" for number in range(6)]
+    assert order[6:] == ["heavy"] * 24
+
+
+def test_users_alternate_when_both_have_queued_requests():
+    async def scenario():
+        controller = _controller()
+        release, admitted = asyncio.Event(), asyncio.Event()
+        blocker = asyncio.create_task(_hold(controller, "other", release, admitted))
+        await admitted.wait()
+
+        order = []
+        tasks = []
+        for key in ["a"] * 15 + ["b"] * 15:
+            tasks.append(asyncio.create_task(_run(controller, key, order)))
+            await asyncio.sleep(0)
+
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+        return order
+
+    order = asyncio.run(scenario())
+    assert order == ["a", "b"] * 15
+
+
+def test_rejected_requests_are_not_charged_to_the_quota():
+    async def scenario():
+        controller = _controller(max_queue=0, user_rate_per_minute=1, user_burst=1)
+        release, admitted = asyncio.Event(), asyncio.Event()
+        blocker = asyncio.create_task(_hold(controller, "other", release, admitted))
+        await admitted.wait()
+
+        for _ in range(3):
+            with pytest.raises(AdmissionRejected) as rejected:
+                await _run(controller, "user", [])
+            assert rejected.value.reason == "queue_full"
+
+        release.set()
+        await blocker
+        order = []
+        await _run(controller, "user", order)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await _run(controller, "user", order)
+        assert rejected.value.reason == "user_quota"
+        return order
+
+    assert asyncio.run(scenario()) == ["user"]
+
+
+def test_user_queue_cap_leaves_room_for_others():
+    async def scenario():
+        controller = _controller(max_user_queue=4)
+        release, admitted = asyncio.Event(), asyncio.Event()
+        blocker = asyncio.create_task(_hold(controller, "other", release, admitted))
+        await admitted.wait()
+
+        order = []
+        tasks = [asyncio.create_task(_run(controller, "flood", order)) for _ in range(4)]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await _run(controller, "flood", order)
+        assert rejected.value.reason == "user_queue_full"
+        tasks.append(asyncio.create_task(_run(controller, "polite", order)))
+        await asyncio.sleep(0)
+
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["flood", "polite", "flood", "flood", "flood"]
+
+
+def test_requests_that_never_get_a_slot_are_refunded():
+    async def scenario():
+        controller = _controller(queue_timeout=0.01, user_rate_per_minute=1, user_burst=1)
+        release, admitted = asyncio.Event(), asyncio.Event()
+        blocker = asyncio.create_task(_hold(controller, "other", release, admitted))
+        await admitted.wait()
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await _run(controller, "user", [])
+        assert rejected.value.reason == "queue_timeout"
+
+        cancelled = asyncio.create_task(_run(controller, "user", []))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+        release.set()
+        await blocker
+        order = []
+        await _run(controller, "user", order)
+        return order
+
+    assert asyncio.run(scenario()) == ["user"]
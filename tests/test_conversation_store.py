@@ -0,0 +1,94 @@
+"""Tests for the batched conversation writes in conversation_store."""
+
+import sqlite3
+import threading
+import time
+import pytest
+from config import settings
+from conversation_store import ConversationStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Long interval: only flush(), close() or a full queue write turns
+    monkeypatch.setattr(settings, "conversation_flush_interval_s", 60.0)
+    store = ConversationStore(str(tmp_path / "conversations.sqlite3"))
+    yield store
+    store.close()
+
+
+def _stored_turn_count(store: ConversationStore, conversation_id: str) -> int:
+    """Turns of the conversation already written to SQLite."""
+    return store._read(store._connection(), conversation_id).turn_count
+
+
+def test_queued_turns_are_read_before_they_are_written(store):
+    store.append_turn("c", "hola", "buenas")
+    store.append_turn("c", "¿y la ley?", "vigente")
+
+    assert _stored_turn_count(store, "c") == 0
+    state = store.get("c")
+    assert state.turn_count == 2
+    assert state.last_user_message() == "¿y la ley?"
+
+    store.flush()
+    assert _stored_turn_count(store, "c") == 2
+    assert store.get("c").turn_count == 2
+
+
+def test_concurrent_turns_are_written_in_one_batch(store):
+    threads = [
+        threading.Thread(target=store.append_turn, args=("c", f"pregunta {number}", "respuesta"))
+        for number in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.flush()
+
+    state = store.get("c")
+    assert state.turn_count == 20
+    assert len(state.recent_turns) == settings.conversation_recent_turns
+    assert state.summary
+
+
+def test_workers_sharing_the_file_keep_each_others_turns(store):
+    # A second store stands in for another worker process
+    other = ConversationStore(store.db_path)
+    try:
+        store.append_turn("c", "uno", "a")
+        other.append_turn("c", "dos", "b")
+        store.flush()
+        other.flush()
+        assert _stored_turn_count(store, "c") == 2
+    finally:
+        other.close()
+
+
+def test_full_queue_wakes_the_writer(store, monkeypatch):
+    monkeypatch.setattr(settings, "conversation_max_pending_writes", 3)
+    for number in range(3):
+        store.append_turn(f"c{number}", "hola", "buenas")
+
+    deadline = time.monotonic() + 5
+    while _stored_turn_count(store, "c2") == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [_stored_turn_count(store, f"c{number}") for number in range(3)] == [1, 1, 1]
+
+
+def test_close_writes_queued_turns_and_closes_every_connection(store):
+    store.append_turn("c", "hola", "buenas")
+    store.get("c")
+    reader = threading.Thread(target=store.get, args=("c",))
+    reader.start()
+    reader.join()
+    connections = list(store._connections)
+    assert len(connections) >= 2
+
+    store.close()
+
+    assert _stored_turn_count(store, "c") == 1
+    for connection in connections:
+        with pytest.raises(sqlite3.ProgrammingError):
+            connection.execute("SELECT 1")
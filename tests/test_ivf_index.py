@@ -0,0 +1,63 @@
+"""Tests for the IVF index against brute-force search."""
+
+import numpy as np
+import pytest
+from ivf_index import IVFIndex, build_ivf_index
+from schemas import SearchFilters
+from search_index import QUERY_CHUNK_SIZE, row_filter_mask, row_recency_bonus
+from tests.synthetic_corpus import DIMENSION, make_corpus
+
+
+def _load(tmp_path, nlist: int = 16, **corpus_options) -> IVFIndex:
+    connection = make_corpus(**corpus_options)
+    build_ivf_index(connection, str(tmp_path / "ivf"), nlist=nlist, iterations=5)
+    return IVFIndex.load(str(tmp_path / "ivf"))
+
+
+def _brute_force(index: IVFIndex, query: np.ndarray, top_k: int, filters=None) -> set:
+    query = query / np.linalg.norm(query)
+    scores = np.asarray(index.vectors) @ query + row_recency_bonus(np.asarray(index.dates))
+    mask = row_filter_mask(
+        filters, index.doc_types, index.agencies, index.dates, index.doc_type_codes, index.agency_codes
+    )
+    if mask is not None:
+        scores[~mask] = -np.inf
+    order = np.argsort(-scores)[:top_k]
+    return set(index.chunk_ids[order[np.isfinite(scores[order])]].tolist())
+
+
+@pytest.mark.parametrize("filters", [
+    None,
+    SearchFilters(doc_type="DECRETO"),
+    SearchFilters(agency="SHCP", date_from="2023-01-01", date_to="2024-03-31"),
+])
+def test_probing_every_cluster_matches_brute_force(tmp_path, small_dimension, filters):
+    index = _load(tmp_path)
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        query = rng.normal(size=DIMENSION)
+        chunk_ids, scores, _ = index.search(query.tolist(), 10, filters, nprobe=index.nlist)
+        assert set(chunk_ids.tolist()) == _brute_force(index, query, 10, filters)
+        assert np.all(np.diff(scores) <= 0)
+
+
+def test_search_batch_matches_search(tmp_path, small_dimension):
+    index = _load(tmp_path)
+    queries = np.random.default_rng(2).normal(size=(QUERY_CHUNK_SIZE + 10, DIMENSION)).tolist()
+    batch = index.search_batch(queries, 8, nprobe=4)
+    assert len(batch) == len(queries)
+    for (chunk_ids, scores, positions), query in zip(batch, queries):
+        expected_ids, expected_scores, _ = index.search(query, 8, nprobe=4)
+        assert chunk_ids.tolist() == expected_ids.tolist()
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+        assert index.chunk_ids[positions].tolist() == chunk_ids.tolist()
+
+
+def test_nlist_is_clamped_to_the_sampled_rows(tmp_path, small_dimension):
+    connection = make_corpus(months=2, rows_per_month=10)
+    manifest = build_ivf_index(connection, str(tmp_path / "ivf"), nlist=50, sample_size=12, iterations=2)
+    index = IVFIndex.load(str(tmp_path / "ivf"))
+
+    assert index.nlist == 12
+    assert len(index) == 20
+    assert manifest["offsets"][-1] == 20
@@ -0,0 +1,109 @@
+"""Tests for /v1/search cursor pagination and its corpus version check."""
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from corpus import CorpusChanged
+from rag_service import get_rag_service
+from records import ChunkRecord
+from routers import api
+from tests.synthetic_corpus import DIMENSION
+from utils.cursor import decode_cursor, decode_vector, encode_cursor, encode_vector
+
+
+class _Service:
+    """Stand-in for RAGService.search over a fixed ranking of 25 chunks."""
+
+    def __init__(self):
+        self.version = "v1"
+        self.embedded = []
+        self.embeddings = []
+
+    def embed_query(self, text):
+        self.embedded.append(text)
+        return np.linspace(-1, 1, DIMENSION).tolist()
+
+    def search(self, text, filters, offset, limit, embedding, corpus_version):
+        if corpus_version is not None and corpus_version != self.version:
+            raise CorpusChanged(f"Cursor for corpus {corpus_version}, serving {self.version}")
+        self.embeddings.append(embedding)
+        ranked = [ChunkRecord(f"{text} {number}", chunk_id=number, score=1 - number / 100) for number in range(25)]
+        return ranked[offset:offset + limit], {}, offset + limit < len(ranked), self.version
+
+
+@pytest.fixture
+def service(small_dimension):
+    return _Service()
+
+
+@pytest.fixture
+def client(service):
+    app = FastAPI()
+    app.include_router(api.router)
+    app.dependency_overrides[get_rag_service] = lambda: service
+    return TestClient(app)
+
+
+def _page(client, **body):
+    response = client.post("/v1/search", json=body)
+    assert response.status_code == 200, response.text
+    page = response.json()
+    return [result["chunk"]["chunk_id"] for result in page["results"]], page["next_cursor"]
+
+
+def test_vector_round_trips_through_float16():
+    vector = np.random.default_rng(0).normal(size=DIMENSION).astype(np.float16)
+    assert decode_vector(encode_vector(vector), DIMENSION) == vector.astype(np.float32).tolist()
+
+
+@pytest.mark.parametrize("packed", [
+    "%%%",
+    encode_vector([0.5] * (DIMENSION - 1)),
+    encode_vector([np.inf] * DIMENSION),
+])
+def test_malformed_vectors_are_rejected(packed):
+    with pytest.raises(ValueError):
+        decode_vector(packed, DIMENSION)
+
+
+@pytest.mark.parametrize("cursor", ["no es un cursor", encode_cursor([1, 2])])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_continue_without_embedding_again(client, service):
+    seen, cursor = _page(client, text="ley", limit=10)
+    while cursor:
+        chunk_ids, cursor = _page(client, cursor=cursor)
+        seen += chunk_ids
+
+    assert seen == list(range(25))
+    assert service.embedded == ["ley"]
+    # Every page is ranked with the same float16 embedding
+    assert all(embedding == service.embeddings[0] for embedding in service.embeddings)
+
+
+def test_cursor_keeps_its_page_size_unless_overridden(client):
+    _, cursor = _page(client, text="ley", limit=4)
+    assert _page(client, cursor=cursor)[0] == [4, 5, 6, 7]
+    assert _page(client, cursor=cursor, limit=2)[0] == [4, 5]
+
+
+def test_cursor_from_another_corpus_version_is_rejected(client, service):
+    _, cursor = _page(client, text="ley")
+    service.version = "v2"
+
+    response = client.post("/v1/search", json={"cursor": cursor})
+    assert response.status_code == 409
+
+
+@pytest.mark.parametrize("payload", [
+    {"t": "ley", "o": 10, "e": "AAAA", "v": "v1"},
+    {"t": "ley", "o": -1, "e": encode_vector([0.0] * DIMENSION), "v": "v1"},
+    {"t": "ley", "o": 10, "e": encode_vector([0.0] * DIMENSION)},
+])
+def test_invalid_cursor_state_is_a_bad_request(client, payload):
+    response = client.post("/v1/search", json={"cursor": encode_cursor(payload)})
+    assert response.status_code == 400
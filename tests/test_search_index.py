@@ -0,0 +1,96 @@
+"""Tests for the recency-partitioned index against brute-force search."""
+
+import numpy as np
+import pytest
+from config import settings
+from schemas import SearchFilters
+from search_index import (
+    QUERY_CHUNK_SIZE, PartitionedIndex, build_partitioned_index, row_filter_mask, row_recency_bonus
+)
+from tests.synthetic_corpus import DIMENSION, make_corpus
+from utils.metrics import metrics
+
+
+def _load(tmp_path, **corpus_options) -> PartitionedIndex:
+    connection = make_corpus(**corpus_options)
+    build_partitioned_index(connection, str(tmp_path / "index"))
+    return PartitionedIndex.load(str(tmp_path / "index"))
+
+
+def _brute_force(index: PartitionedIndex, query: np.ndarray, top_k: int, filters=None) -> set:
+    query = query / np.linalg.norm(query)
+    scores = np.asarray(index.vectors) @ query + row_recency_bonus(np.asarray(index.dates))
+    mask = row_filter_mask(
+        filters, index.doc_types, index.agencies, index.dates, index.doc_type_codes, index.agency_codes
+    )
+    if mask is not None:
+        scores[~mask] = -np.inf
+    order = np.argsort(-scores)[:top_k]
+    return set(index.chunk_ids[order[np.isfinite(scores[order])]].tolist())
+
+
+def _counter(name: str) -> int:
+    return metrics.snapshot()["counters"].get(name, 0)
+
+
+@pytest.fixture
+def exact(monkeypatch):
+    monkeypatch.setattr(settings, "index_scan_budget", 0)
+
+
+@pytest.mark.parametrize("filters", [
+    None,
+    SearchFilters(doc_type="ACUERDO"),
+    SearchFilters(agency="SEP", date_from="2023-03-01", date_to="2024-06-30"),
+])
+def test_search_matches_brute_force(tmp_path, small_dimension, exact, filters):
+    index = _load(tmp_path, spread=3.0)
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        query = rng.normal(size=DIMENSION)
+        chunk_ids, scores, _ = index.search(query.tolist(), 10, filters)
+        assert set(chunk_ids.tolist()) == _brute_force(index, query, 10, filters)
+        assert np.all(np.diff(scores) <= 0)
+
+
+def test_search_batch_matches_search(tmp_path, small_dimension, exact):
+    index = _load(tmp_path, spread=1.0)
+    queries = np.random.default_rng(2).normal(size=(QUERY_CHUNK_SIZE + 10, DIMENSION)).tolist()
+    batch = index.search_batch(queries, 8)
+    assert len(batch) == len(queries)
+    for (chunk_ids, scores, positions), query in zip(batch, queries):
+        expected_ids, expected_scores, _ = index.search(query, 8)
+        assert chunk_ids.tolist() == expected_ids.tolist()
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+        assert index.chunk_ids[positions].tolist() == chunk_ids.tolist()
+
+
+def test_bounds_skip_partitions_that_cannot_compete(tmp_path, small_dimension, exact):
+    # Topically narrow months: a query on an old month's topic cannot match the others
+    index = _load(tmp_path, spread=0.1)
+    query = np.asarray(index.get_vectors(np.array([len(index) - 5]))[0])
+    rows_before = _counter("index_rows_scanned_total")
+    partitions_before = _counter("index_partitions_scanned_total")
+
+    chunk_ids, _, _ = index.search(query.tolist(), 5)
+
+    assert set(chunk_ids.tolist()) == _brute_force(index, query, 5)
+    assert _counter("index_rows_scanned_total") - rows_before < len(index) // 2
+    assert _counter("index_partitions_scanned_total") - partitions_before < len(index.partitions) // 2
+
+
+def test_scan_budget_bounds_the_rows_scanned(tmp_path, small_dimension, monkeypatch):
+    index = _load(tmp_path, spread=3.0, rows_per_month=40)
+    monkeypatch.setattr(settings, "index_scan_budget", 100)
+    stops_before = _counter("index_scan_budget_stops_total")
+    rows_before = _counter("index_rows_scanned_total")
+
+    _, _, positions = index.search(np.ones(DIMENSION).tolist(), 5)
+
+    # Three 40-row partitions reach the budget of 100 rows
+    assert _counter("index_rows_scanned_total") - rows_before == 120
+    assert _counter("index_scan_budget_stops_total") == stops_before + 1
+    assert len(positions) == 5
+
+    batch = index.search_batch([np.ones(DIMENSION).tolist()], 5)
+    assert batch[0][2].tolist() == positions.tolist()
@@ -0,0 +1,170 @@
+"""Tests for single-flight coalescing and its shared cancellation."""
+
+import threading
+import time
+import pytest
+from utils.cancellation import CancellationToken, QueryCancelled
+from utils.single_flight import SingleFlight
+
+
+def _in_thread(target, *args, **kwargs) -> dict:
+    """Run target in a thread; the returned dict gets its result or exception."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = target(*args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    outcome["thread"] = threading.Thread(target=run)
+    outcome["thread"].start()
+    return outcome
+
+
+def _wait_for_callers(flight: SingleFlight, key: str, count: int):
+    """Block until count callers have joined the in-flight call for key."""
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with flight._lock:
+            call = flight._calls.get(key)
+        cancellation = call.cancellation if call else None
+        if cancellation and len(cancellation._tokens) + cancellation._pinned >= count:
+            return
+        time.sleep(0.001)
+    raise AssertionError(f"{count} callers never joined {key}")
+
+
+class _Pipeline:
+    """Stand-in for the RAG pipeline: the first run blocks until released."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.runs = 0
+
+    def __call__(self, text, cancel=None):
+        self.runs += 1
+        if self.runs == 1:
+            self.started.set()
+            self.release.wait(5)
+        if cancel is not None:
+            cancel.raise_if_cancelled("generation")
+        return f"respuesta {self.runs}"
+
+
+def test_identical_calls_share_one_run():
+    flight, pipeline = SingleFlight(), _Pipeline()
+    leader = _in_thread(flight.do, "key", pipeline, "texto", cancel=CancellationToken())
+    pipeline.started.wait(5)
+    follower = _in_thread(flight.do, "key", pipeline, "texto", cancel=CancellationToken())
+    _wait_for_callers(flight, "key", 2)
+    pipeline.release.set()
+    leader["thread"].join(5)
+    follower["thread"].join(5)
+
+    assert pipeline.runs == 1
+    assert leader["result"] == ("respuesta 1", False)
+    assert follower["result"] == ("respuesta 1", True)
+    assert flight.in_flight() == 0
+
+
+def test_caller_arriving_after_cancellation_runs_again():
+    flight, pipeline = SingleFlight(), _Pipeline()
+    gone = CancellationToken()
+    leader = _in_thread(flight.do, "key", pipeline, "texto", cancel=gone)
+    pipeline.started.wait(5)
+    gone.cancel()
+
+    # Joins while the cancelled run is still registered under the key
+    result = flight.do("key", pipeline, "texto", cancel=CancellationToken())
+    pipeline.release.set()
+    leader["thread"].join(5)
+
+    assert result == ("respuesta 2", False)
+    assert isinstance(leader["error"], QueryCancelled)
+    assert flight.in_flight() == 0
+
+
+def test_connected_follower_retries_when_shared_run_is_cancelled():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    runs = []
+
+    def pipeline(text, cancel=None):
+        runs.append(text)
+        if len(runs) == 1:
+            started.set()
+            release.wait(5)
+            raise QueryCancelled("Cancelled before generation")
+        return "respuesta"
+
+    leader = _in_thread(flight.do, "key", pipeline, "texto", cancel=CancellationToken())
+    started.wait(5)
+    follower = _in_thread(flight.do, "key", pipeline, "texto", cancel=CancellationToken())
+    _wait_for_callers(flight, "key", 2)
+    release.set()
+    leader["thread"].join(5)
+    follower["thread"].join(5)
+
+    assert isinstance(leader["error"], QueryCancelled)
+    assert follower["result"] == ("respuesta", False)
+    assert len(runs) == 2
+
+
+def test_run_is_cancelled_only_when_every_caller_cancelled():
+    flight, pipeline = SingleFlight(), _Pipeline()
+    first, second = CancellationToken(), CancellationToken()
+    leader = _in_thread(flight.do, "key", pipeline, "texto", cancel=first)
+    pipeline.started.wait(5)
+    follower = _in_thread(flight.do, "key", pipeline, "texto", cancel=second)
+    _wait_for_callers(flight, "key", 2)
+
+    first.cancel()
+    assert not flight._calls["key"].cancellation.cancelled
+    second.cancel()
+    pipeline.release.set()
+    leader["thread"].join(5)
+    follower["thread"].join(5)
+
+    assert pipeline.runs == 1
+    assert isinstance(leader["error"], QueryCancelled)
+    assert isinstance(follower["error"], QueryCancelled)
+
+
+def test_caller_without_token_keeps_the_run_alive():
+    flight, pipeline = SingleFlight(), _Pipeline()
+    gone = CancellationToken()
+    leader = _in_thread(flight.do, "key", pipeline, "texto", cancel=gone)
+    pipeline.started.wait(5)
+    follower = _in_thread(flight.do, "key", pipeline, "texto")
+    _wait_for_callers(flight, "key", 2)
+    gone.cancel()
+    pipeline.release.set()
+    leader["thread"].join(5)
+    follower["thread"].join(5)
+
+    assert leader["result"] == ("respuesta 1", False)
+    assert follower["result"] == ("respuesta 1", True)
+
+
+def test_errors_reach_every_caller():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing(text, cancel=None):
+        started.set()
+        release.wait(5)
+        raise ValueError(text)
+
+    leader = _in_thread(flight.do, "key", failing, "roto", cancel=CancellationToken())
+    started.wait(5)
+    follower = _in_thread(flight.do, "key", failing, "roto", cancel=CancellationToken())
+    _wait_for_callers(flight, "key", 2)
+    release.set()
+    leader["thread"].join(5)
+    follower["thread"].join(5)
+
+    for outcome in (leader, follower):
+        with pytest.raises(ValueError):
+            raise outcome["error"]
@@ -0,0 +1 @@
+"""Offline maintenance tools for dof-chat (run with `python -m tools.<name>`)."""
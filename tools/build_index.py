@@ -0,0 +1,48 @@
+"""Build a vector search index from the DuckDB database.
+
+The partitioned index (recency partitions, exact search) is the default; the
+IVF index clusters embeddings with k-means and scans only the nearest
+settings.ivf_nprobe clusters per query. Select it with search_backend=ivf.
+
+Usage:
+    python -m tools.build_index [--database dof_db/db.duckdb] [--output dof_db/index]
+    python -m tools.build_index --kind ivf [--nlist 1024] [--output dof_db/ivf]
+"""
+
+import argparse
+import duckdb
+from config import settings
+from ivf_index import build_ivf_index
+from search_index import build_partitioned_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default=settings.database_path, help="DuckDB database file")
+    parser.add_argument("--kind", choices=["partitioned", "ivf"], default="partitioned", help="Index type to build")
+    parser.add_argument("--output", help="Index output directory (default: index_path or ivf_index_path)")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows fetched per batch")
+    parser.add_argument("--nlist", type=int, help="IVF clusters (default: 4 * sqrt(rows))")
+    parser.add_argument("--iterations", type=int, default=20, help="IVF k-means iterations")
+    parser.add_argument("--sample-size", type=int, default=100000, help="Rows used to train IVF centroids")
+    args = parser.parse_args()
+
+    connection = duckdb.connect(args.database, read_only=True)
+    try:
+        if args.kind == "ivf":
+            build_ivf_index(
+                connection,
+                args.output or settings.ivf_index_path,
+                nlist=args.nlist,
+                iterations=args.iterations,
+                sample_size=args.sample_size,
+                batch_size=args.batch_size
+            )
+        else:
+            build_partitioned_index(connection, args.output or settings.index_path, batch_size=args.batch_size)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Write a copy of the DuckDB database with zstd-compressed chunk text.
+
+Chunk text moves out of the chunks table into chunk_texts(chunk_id, dict_id,
+text_zstd), compressed with a dictionary trained on a sample of the corpus
+and stored in text_dictionaries. The chunks table keeps its embeddings and
+metadata, so ranking never reads text; the application decompresses only the
+top-k rows it returns. All other tables are copied unchanged.
+
+Usage:
+    python -m tools.compress_chunks --output dof_db/db.compressed.duckdb [--database dof_db/db.duckdb]
+"""
+
+import argparse
+import os
+import duckdb
+from config import settings
+from utils.logger import logger
+from utils.text_compression import TextCodec, train_dictionary
+
+_DICT_ID = 1
+
+
+def _quote(path: str) -> str:
+    return "'" + path.replace("'", "''") + "'"
+
+
+def compress_database(
+    source_path: str,
+    output_path: str,
+    dict_size: int = 112640,
+    sample_size: int = 20000,
+    level: int = 19,
+    batch_size: int = 5000
+) -> dict:
+    """Copy source_path to output_path, storing chunk text compressed.
+
+    Args:
+        source_path: Existing DuckDB database with text inline in chunks
+        output_path: New database file to create
+        dict_size: Maximum dictionary size in bytes
+        sample_size: Chunk texts sampled to train the dictionary
+        level: zstd compression level
+        batch_size: Rows compressed and inserted per batch
+
+    Returns:
+        dict: Row count, raw/compressed text sizes and both file sizes in bytes
+    """
+    if os.path.exists(output_path):
+        raise FileExistsError(f"Output database already exists: {output_path}")
+
+    connection = duckdb.connect(output_path)
+    try:
+        connection.execute(f"ATTACH {_quote(source_path)} AS source (READ_ONLY)")
+
+        # Recreate every table from its original DDL (keeps primary keys)
+        tables = connection.execute(
+            "SELECT table_name, sql FROM duckdb_tables() WHERE database_name = 'source' AND schema_name = 'main'"
+        ).fetchall()
+        for table_name, ddl in tables:
+            connection.execute(ddl)
+            if table_name == "chunks":
+                connection.execute("ALTER TABLE chunks DROP COLUMN text")
+                connection.execute("INSERT INTO chunks BY NAME SELECT * EXCLUDE (text) FROM source.chunks")
+            else:
+                connection.execute(f"INSERT INTO {table_name} SELECT * FROM source.{table_name}")
+
+        connection.execute("""
+            CREATE TABLE text_dictionaries (
+                dict_id INTEGER PRIMARY KEY,
+                dictionary BLOB NOT NULL
+            )
+        """)
+        connection.execute("""
+            CREATE TABLE chunk_texts (
+                chunk_id BIGINT PRIMARY KEY,
+                dict_id INTEGER NOT NULL,
+                text_zstd BLOB NOT NULL
+            )
+        """)
+
+        samples = [row[0] for row in connection.execute(
+            f"SELECT text FROM source.chunks WHERE text IS NOT NULL USING SAMPLE {int(sample_size)} ROWS"
+        ).fetchall()]
+        dictionary = train_dictionary(samples, dict_size)
+        connection.execute("INSERT INTO text_dictionaries VALUES (?, ?)", [_DICT_ID, dictionary])
+        codec = TextCodec({_DICT_ID: dictionary}, level=level)
+
+        raw_bytes = compressed_bytes = rows = 0
+        cursor = connection.cursor()
+        cursor.execute("SELECT chunk_id, text FROM source.chunks ORDER BY chunk_id")
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            chunk_ids = [chunk_id for chunk_id, _ in batch]
+            blobs = [codec.compress(text or "", _DICT_ID) for _, text in batch]
+            connection.execute(
+                "INSERT INTO chunk_texts SELECT UNNEST(?::BIGINT[]), ?, UNNEST(?::BLOB[])",
+                [chunk_ids, _DICT_ID, blobs]
+            )
+            raw_bytes += sum(len((text or "").encode("utf-8")) for _, text in batch)
+            compressed_bytes += sum(len(blob) for blob in blobs)
+            rows += len(batch)
+
+        connection.execute("DETACH source")
+        connection.execute("CHECKPOINT")
+    finally:
+        connection.close()
+
+    stats = {
+        "rows": rows,
+        "raw_bytes": raw_bytes,
+        "compressed_bytes": compressed_bytes + len(dictionary),
+        "source_file_bytes": os.path.getsize(source_path),
+        "output_file_bytes": os.path.getsize(output_path),
+    }
+    ratio = raw_bytes / max(stats["compressed_bytes"], 1)
+    logger.info(
+        f"Compressed {rows} chunk texts: {raw_bytes / 2**20:.1f} MiB -> "
+        f"{stats['compressed_bytes'] / 2**20:.1f} MiB ({ratio:.1f}x) in {output_path}"
+    )
+    # DuckDB already applies lightweight string compression, so compare the
+    # files before switching settings.database_path to the new one
+    logger.info(
+        f"Database file size: {stats['source_file_bytes'] / 2**20:.1f} MiB -> "
+        f"{stats['output_file_bytes'] / 2**20:.1f} MiB"
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", default=settings.database_path, help="Source DuckDB database file")
+    parser.add_argument("--output", required=True, help="Database file to create")
+    parser.add_argument("--dict-size", type=int, default=112640, help="Dictionary size in bytes")
+    parser.add_argument("--sample-size", type=int, default=20000, help="Chunks sampled for dictionary training")
+    parser.add_argument("--level", type=int, default=19, help="zstd compression level")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows compressed per batch")
+    args = parser.parse_args()
+
+    compress_database(
+        args.database,
+        args.output,
+        dict_size=args.dict_size,
+        sample_size=args.sample_size,
+        level=args.level,
+        batch_size=args.batch_size
+    )
+
+
+if __name__ == "__main__":
+    main()
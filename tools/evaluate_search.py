@@ -0,0 +1,295 @@
+"""Evaluate retrieval quality and latency of every available search backend.
+
+The golden set is a JSON lines file with one query per line:
+
+    {"query": "requisitos para importar maíz", "relevant": [1042, 1043], "filters": {"doc_type": "ACUERDO"}}
+
+filters is optional. Each backend/setting combination ranks every query and
+is scored on recall@k and MRR against the labelled relevant chunks, on
+overlap@k with exact search, and on p50/p95 ranking latency. Only ranking is
+timed; payload fetches are the same for every backend.
+
+Exact search is a plain cosine scan over every vector stored in the built
+index, independent of partitions, clusters and the recency bonus, so overlap
+measures what the backends lose to approximation and ranking tweaks. The
+"exact" backend reports that scan both as is and with the recency bonus the
+index backends add, to separate the two effects.
+
+Results are printed as a table and, with --json, written for trend tracking.
+
+Usage:
+    python -m tools.evaluate_search --golden golden.jsonl [--k 10] [--nprobe 1,4,8,16] [--json eval.json]
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from config import settings
+from database import db_manager
+from ivf_index import IVFIndex
+from rag_service import rag_service
+from schemas import SearchFilters
+from search_index import PartitionedIndex, row_filter_mask, row_recency_bonus
+from utils.logger import logger
+
+SearchFunction = Callable[[List[float], int, Optional[SearchFilters]], List[int]]
+
+BACKENDS = ("exact", "partitioned", "ivf", "sql")
+
+# Rows scored per matrix product in the exact scan
+EXACT_SCAN_BLOCK = 65536
+
+
+def load_golden_set(path: str) -> List[Dict]:
+    """Read golden queries with their relevant chunk ids and optional filters.
+
+    Args:
+        path: JSON lines file
+
+    Returns:
+        List of dicts with query, relevant (set of chunk ids) and filters
+    """
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            if not data.get("query") or not data.get("relevant"):
+                raise ValueError(f"{path}:{line_number}: query and relevant are required")
+            filters = SearchFilters.model_validate(data["filters"]) if data.get("filters") else None
+            items.append({
+                "query": data["query"],
+                "relevant": {int(chunk_id) for chunk_id in data["relevant"]},
+                "filters": filters,
+            })
+    return items
+
+
+def _index_search(index, **options) -> SearchFunction:
+    def search(embedding, top_k, filters):
+        return index.search(embedding, top_k, filters, **options)[0].tolist()
+    return search
+
+
+def _sql_search(embedding, top_k, filters):
+    return [chunk_id for chunk_id, _ in db_manager.rank_chunks(embedding, top_k, filters)]
+
+
+def exact_search(
+    partitioned: Optional[PartitionedIndex],
+    ivf: Optional[IVFIndex],
+    recency: bool = False
+) -> Optional[SearchFunction]:
+    """Brute-force cosine ranking over every vector of a built index.
+
+    Both index kinds store all chunk vectors with their filter columns; the
+    scan only reads those arrays and scores with a plain numpy dot product.
+
+    Args:
+        partitioned: Loaded partitioned index, if built
+        ivf: Loaded IVF index, if built
+        recency: Add the per-row recency bonus the index backends use
+
+    Returns:
+        Optional[SearchFunction]: Ranking function, or None without a built index
+    """
+    index = partitioned if partitioned is not None else ivf
+    if index is None:
+        return None
+
+    def search(embedding, top_k, filters):
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        for start in range(0, len(index), EXACT_SCAN_BLOCK):
+            end = min(start + EXACT_SCAN_BLOCK, len(index))
+            vectors = np.asarray(index.vectors[start:end], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1)
+            scores = vectors @ query / np.where(norms > 0, norms, 1.0)
+            if recency:
+                scores += row_recency_bonus(np.asarray(index.dates[start:end]))
+            mask = row_filter_mask(
+                filters, index.doc_types[start:end], index.agencies[start:end], index.dates[start:end],
+                index.doc_type_codes, index.agency_codes
+            )
+            rows = np.arange(start, end)
+            if mask is not None:
+                scores, rows = scores[mask], rows[mask]
+            best_scores = np.concatenate([best_scores, scores.astype(np.float32)])
+            best_rows = np.concatenate([best_rows, rows])
+            if best_scores.shape[0] > top_k:
+                keep = np.argpartition(-best_scores, top_k)[:top_k]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+        order = np.argsort(-best_scores, kind="stable")
+        return index.chunk_ids[best_rows[order]].tolist()
+
+    return search
+
+
+def configured_runs(
+    backends: List[str],
+    nprobes: List[int],
+    partitioned: Optional[PartitionedIndex],
+    ivf: Optional[IVFIndex]
+) -> List[Dict]:
+    """Backend/setting combinations to evaluate, skipping backends that are not built.
+
+    Args:
+        backends: Backend names to include
+        nprobes: IVF nprobe values to sweep
+        partitioned: Loaded partitioned index, if built
+        ivf: Loaded IVF index, if built
+
+    Returns:
+        List of dicts with backend, setting (dict of knob values) and search function
+    """
+    runs = []
+    if "exact" in backends and (partitioned is not None or ivf is not None):
+        for recency in (False, True):
+            runs.append({
+                "backend": "exact",
+                "setting": {"recency": "on" if recency else "off"},
+                "search": exact_search(partitioned, ivf, recency=recency),
+            })
+    if "partitioned" in backends and partitioned is not None:
+        runs.append({"backend": "partitioned", "setting": {}, "search": _index_search(partitioned)})
+    if "ivf" in backends and ivf is not None:
+        for nprobe in sorted(set(min(nprobe, ivf.nlist) for nprobe in nprobes)):
+            runs.append({"backend": "ivf", "setting": {"nprobe": nprobe}, "search": _index_search(ivf, nprobe=nprobe)})
+    if "sql" in backends and db_manager.test_connection().get("tables", {}).get("chunks"):
+        runs.append({"backend": "sql", "setting": {}, "search": _sql_search})
+    return runs
+
+
+def evaluate_run(
+    search: SearchFunction,
+    golden: List[Dict],
+    embeddings: List[List[float]],
+    k: int,
+    reference: Optional[List[List[int]]] = None
+) -> Dict[str, float]:
+    """Score one backend/setting over the golden set.
+
+    Args:
+        search: Ranking function returning chunk ids
+        golden: Golden queries from load_golden_set
+        embeddings: Query embeddings aligned with golden
+        k: Cut-off for recall, MRR and overlap
+        reference: Exact top-k ids per query, for overlap@k
+
+    Returns:
+        Dict with recall, mrr, overlap (None without a reference), p50_ms and p95_ms
+    """
+    # One untimed query so lazy initialization does not land in the percentiles
+    search(embeddings[0], k, golden[0]["filters"])
+
+    recalls, reciprocal_ranks, overlaps, latencies = [], [], [], []
+    for number, (item, embedding) in enumerate(zip(golden, embeddings)):
+        started = time.perf_counter()
+        ids = search(embedding, k, item["filters"])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        relevant = item["relevant"]
+        recalls.append(len(relevant.intersection(ids)) / len(relevant))
+        rank = next((position for position, chunk_id in enumerate(ids, 1) if chunk_id in relevant), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        if reference is not None:
+            expected = reference[number]
+            overlaps.append(len(set(expected).intersection(ids)) / len(expected) if expected else 1.0)
+
+    return {
+        "recall": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "overlap": float(np.mean(overlaps)) if overlaps else None,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def format_table(results: List[Dict], k: int) -> str:
+    """Render evaluation results as a fixed-width text table."""
+    headers = ["backend", "setting", f"recall@{k}", f"mrr@{k}", f"exact@{k}", "p50 ms", "p95 ms"]
+    rows = []
+    for result in results:
+        setting = ", ".join(f"{name}={value}" for name, value in result["setting"].items()) or "-"
+        overlap = result["overlap"]
+        rows.append([
+            result["backend"],
+            setting,
+            f"{result['recall']:.3f}",
+            f"{result['mrr']:.3f}",
+            f"{overlap:.3f}" if overlap is not None else "-",
+            f"{result['p50_ms']:.2f}",
+            f"{result['p95_ms']:.2f}",
+        ])
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(headers, widths))]
+    lines.append("  ".join("-" * width for width in widths))
+    lines.extend("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--golden", required=True, help="Golden set (JSON lines)")
+    parser.add_argument("--k", type=int, default=settings.max_chunks, help="Cut-off for recall, MRR and overlap")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated backends to evaluate")
+    parser.add_argument("--nprobe", default="1,4,8,16,32", help="Comma-separated IVF nprobe values")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    golden = load_golden_set(args.golden)
+    if not golden:
+        parser.error("golden set is empty")
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+    nprobes = [int(value) for value in args.nprobe.split(",") if value.strip()]
+
+    embeddings = rag_service.embed_queries([item["query"] for item in golden])
+
+    partitioned = PartitionedIndex.load() if PartitionedIndex.exists() else None
+    ivf = IVFIndex.load() if IVFIndex.exists() else None
+
+    exact = exact_search(partitioned, ivf)
+    reference = None
+    if exact is not None:
+        reference = [exact(embedding, args.k, item["filters"]) for item, embedding in zip(golden, embeddings)]
+    else:
+        logger.warning("No vector index built; exact search and overlap with it are not reported")
+
+    results = []
+    for run in configured_runs(backends, nprobes, partitioned, ivf):
+        logger.info(f"Evaluating {run['backend']} {run['setting']} on {len(golden)} queries")
+        metrics = evaluate_run(run["search"], golden, embeddings, args.k, reference)
+        results.append({"backend": run["backend"], "setting": run["setting"], **metrics})
+
+    if not results:
+        logger.error("No search backend available to evaluate")
+        return
+
+    print(format_table(results, args.k))
+
+    if args.json:
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "corpus_version": rag_service.corpus_version,
+            "golden_set": args.golden,
+            "queries": len(golden),
+            "k": args.k,
+            "results": results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"Wrote evaluation results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
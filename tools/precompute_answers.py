@@ -0,0 +1,92 @@
+"""Precompute answers for the most frequent queries in a query log.
+
+The log is a text file with one query per line, or JSON lines with a "text"
+field (e.g. exported from the API gateway). Queries are grouped by their
+normalized form, the N most frequent groups are answered through the full
+RAG pipeline, and the responses are written with the current corpus version
+next to the corpus being served: into the current snapshot directory, or to
+settings.answer_cache_path without snapshots. Workers pick the file up on
+their next start or snapshot swap.
+
+Usage:
+    python -m tools.precompute_answers --queries queries.log [--top 500] [--output answer_cache.json]
+"""
+
+import argparse
+import json
+from collections import Counter, defaultdict
+from typing import Dict, Iterator, List
+from answer_cache import precomputed_answers, write_answers
+from corpus import resolve_location
+from rag_service import ERROR_ANSWER, normalize_query, rag_service
+from utils.logger import logger
+
+
+def _read_queries(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    line = json.loads(line).get("text") or ""
+                except ValueError:
+                    pass
+            if line:
+                yield line
+
+
+def top_queries(path: str, limit: int) -> List[Dict]:
+    """Most frequent normalized queries, each with its most common spelling.
+
+    Args:
+        path: Query log file
+        limit: Number of queries to return
+
+    Returns:
+        List of dicts with key (normalized text), query and count, most frequent first
+    """
+    counts: Counter = Counter()
+    spellings: Dict[str, Counter] = defaultdict(Counter)
+    for text in _read_queries(path):
+        key = normalize_query(text)
+        if key:
+            counts[key] += 1
+            spellings[key][text] += 1
+    return [
+        {"key": key, "query": spellings[key].most_common(1)[0][0], "count": count}
+        for key, count in counts.most_common(limit)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", required=True, help="Query log file")
+    parser.add_argument("--top", type=int, default=500, help="Number of queries to precompute")
+    parser.add_argument("--output", help="Answer file to write (default: next to the served corpus)")
+    args = parser.parse_args()
+    args.output = args.output or resolve_location().answer_cache_path
+
+    rag_service.initialize()
+    # Answer from the pipeline, not from a previously loaded answer file
+    precomputed_answers.clear()
+
+    entries = []
+    for item in top_queries(args.queries, args.top):
+        response = rag_service.query(item["query"])
+        if response.answer == ERROR_ANSWER:
+            logger.warning(f"Skipping query that failed in the pipeline: {item['query'][:50]}")
+            continue
+        entries.append({**item, "response": response.model_dump(mode="json")})
+
+    write_answers(args.output, rag_service.corpus_version, entries)
+    covered = sum(entry["count"] for entry in entries)
+    logger.info(
+        f"Precomputed {len(entries)} answers for corpus {rag_service.corpus_version} "
+        f"({covered} logged queries) in {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
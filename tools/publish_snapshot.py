@@ -0,0 +1,133 @@
+"""Publish a DuckDB database as a new corpus snapshot.
+
+Copies the database into settings.corpus_dir/<name>/, builds the vector
+index the configured search backend uses inside the snapshot, and then
+points CURRENT at it. Running workers pick the snapshot up on their next
+poll (settings.corpus_poll_interval_s) and swap to it without restarting.
+
+The snapshot CURRENT pointed to before is marked retired (a RETIRED file
+whose mtime is the retirement time). Older snapshots beyond --keep are
+deleted only once they have been retired for ten poll intervals, so
+every worker has noticed the swap and finished the queries still pinned
+to them. Nothing is deleted when hot swapping is disabled,
+since workers then serve whichever snapshot they started with.
+
+Usage:
+    python -m tools.publish_snapshot --database new.duckdb [--name 2026-10-19] [--kind ivf] [--keep 3]
+"""
+
+import argparse
+import os
+import shutil
+import time
+from datetime import date
+import duckdb
+from config import settings
+from corpus import DATABASE_FILE, SnapshotLocation, current_snapshot_name, set_current
+from ivf_index import build_ivf_index
+from search_index import build_partitioned_index
+from utils.logger import logger
+
+
+# Marker file in a snapshot directory; its mtime is when the snapshot stopped being current
+RETIRED_FILE = "RETIRED"
+
+# Poll intervals a retired snapshot is kept for workers to swap and drain their queries
+_RETIRED_GRACE_POLLS = 10
+
+
+def _default_kind() -> str:
+    return {"ivf": "ivf", "sql": "none"}.get(settings.search_backend, "partitioned")
+
+
+def mark_retired(corpus_dir: str, name: str):
+    """Record that a snapshot stopped being current now."""
+    with open(os.path.join(corpus_dir, name, RETIRED_FILE), "w") as f:
+        f.write(f"{time.time()}\n")
+
+
+def prune_snapshots(corpus_dir: str, keep: int, grace_s: float = None):
+    """Delete the oldest snapshot directories beyond keep that no worker can still hold.
+
+    A snapshot is deleted only if it is not current and was retired more
+    than grace_s seconds ago. Snapshots without a retirement record (never
+    current, or published before records were kept) get one now and are
+    deleted by a later run.
+
+    Args:
+        corpus_dir: Directory holding the snapshots
+        keep: Snapshots to keep, including the current one
+        grace_s: Seconds a retired snapshot is kept (default: _RETIRED_GRACE_POLLS poll intervals)
+    """
+    if grace_s is None:
+        if settings.corpus_poll_interval_s <= 0:
+            logger.info("Hot swapping is disabled, not deleting old corpus snapshots")
+            return
+        grace_s = _RETIRED_GRACE_POLLS * settings.corpus_poll_interval_s
+
+    current = current_snapshot_name(corpus_dir)
+    names = sorted(
+        (entry.name for entry in os.scandir(corpus_dir)
+         if entry.is_dir() and os.path.exists(os.path.join(entry.path, DATABASE_FILE))),
+        reverse=True
+    )
+    now = time.time()
+    for name in names[keep:]:
+        if name == current:
+            continue
+        marker = os.path.join(corpus_dir, name, RETIRED_FILE)
+        if not os.path.exists(marker):
+            mark_retired(corpus_dir, name)
+            continue
+        retired_for = now - os.path.getmtime(marker)
+        if retired_for < grace_s:
+            logger.info(f"Keeping corpus snapshot {name}, retired {retired_for:.0f}s ago")
+            continue
+        shutil.rmtree(os.path.join(corpus_dir, name))
+        logger.info(f"Deleted corpus snapshot {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True, help="DuckDB database file with the new corpus")
+    parser.add_argument("--name", default=date.today().isoformat(), help="Snapshot name (default: today's date)")
+    parser.add_argument("--corpus-dir", default=settings.corpus_dir, help="Directory holding the snapshots")
+    parser.add_argument(
+        "--kind", choices=["partitioned", "ivf", "none"], default=_default_kind(),
+        help="Index to build in the snapshot (default: the one settings.search_backend uses)"
+    )
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows fetched per batch")
+    parser.add_argument("--keep", type=int, default=3, help="Snapshots to keep, including the new one")
+    args = parser.parse_args()
+
+    location = SnapshotLocation.in_directory(args.name, args.corpus_dir)
+    directory = os.path.dirname(location.database_path)
+    if os.path.exists(directory):
+        parser.error(f"Snapshot {args.name} already exists in {args.corpus_dir}")
+    os.makedirs(directory)
+
+    # Copy under a temporary name so a half-copied database is never mistaken for a snapshot
+    partial_path = location.database_path + ".partial"
+    shutil.copyfile(args.database, partial_path)
+    os.replace(partial_path, location.database_path)
+
+    if args.kind != "none":
+        connection = duckdb.connect(location.database_path, read_only=True)
+        try:
+            if args.kind == "ivf":
+                build_ivf_index(connection, location.ivf_index_path, batch_size=args.batch_size)
+            else:
+                build_partitioned_index(connection, location.index_path, batch_size=args.batch_size)
+        finally:
+            connection.close()
+
+    previous = current_snapshot_name(args.corpus_dir)
+    set_current(args.name, args.corpus_dir)
+    if previous and previous != args.name and os.path.isdir(os.path.join(args.corpus_dir, previous)):
+        mark_retired(args.corpus_dir, previous)
+    logger.info(f"Published corpus snapshot {args.name}")
+    prune_snapshots(args.corpus_dir, args.keep)
+
+
+if __name__ == "__main__":
+    main()
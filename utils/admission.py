@@ -0,0 +1,265 @@
+"""Admission control, backpressure and per-user fair scheduling for the RAG pipeline.
+
+Bounds how many requests run the pipeline at once and how many may wait for
+a slot. When both are full, requests are rejected immediately so clients can
+back off, instead of every queued request timing out together.
+
+Waiting requests are not served first-come-first-served but by start-time
+fair queuing over their user key: each user's requests are stamped with
+virtual start tags that advance by one per request, so a user with many
+queued requests waits behind everyone else's next request instead of in
+front of it. Per-user token buckets (sustained rate plus burst) and a cap on
+each user's queued requests keep one client from filling the shared queue.
+A request only keeps its charge to the user's quota once it gets a slot, so
+requests turned away because the queue is full, or that time out or are
+cancelled while waiting, cost the user nothing.
+
+All of this state lives in one worker process. serve.py forks
+settings.server_workers of them and the kernel spreads connections across
+them, so a user's effective quota and queue allowance are the configured
+values times the number of workers; divide the settings accordingly.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config import settings
+from utils.metrics import metrics
+
+# Weight of the newest observation in the moving average of service time
+_SERVICE_TIME_SMOOTHING = 0.2
+
+# Per-user state is pruned once this many users have been seen
+_MAX_TRACKED_USERS = 4096
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries a retry hint in seconds."""
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(f"Request rejected ({reason}), retry after {retry_after}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    """Request quota refilled at a constant rate, holding up to burst tokens."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        """Initialize a full bucket.
+
+        Args:
+            rate: Tokens added per second
+            burst: Bucket capacity
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> bool:
+        """Consume one token if available."""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def refund(self):
+        """Return a token taken by a request that never ran."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def seconds_until_token(self) -> float:
+        return max(1 - self.tokens, 0) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+class AdmissionController:
+    """Bounded concurrency plus a bounded, per-user fair wait queue for a single event loop."""
+
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        max_queue: int = None,
+        queue_timeout: float = None,
+        user_rate_per_minute: float = None,
+        user_burst: int = None,
+        max_user_queue: int = None,
+        name: str = "chat"
+    ):
+        """Initialize admission controller.
+
+        Args:
+            max_concurrency: Requests allowed to run the pipeline at once
+            max_queue: Requests allowed to wait for a free slot
+            queue_timeout: Seconds a request may wait before being rejected
+            user_rate_per_minute: Sustained requests per user; 0 disables the quota
+            user_burst: Requests a user may send at once above the sustained rate
+            max_user_queue: Requests one user may have waiting at once
+            name: Prefix for metric names
+        """
+        self.max_concurrency = max_concurrency or settings.chat_max_concurrency
+        self.max_queue = max_queue if max_queue is not None else settings.chat_max_queue
+        self.queue_timeout = queue_timeout or settings.chat_queue_timeout_s
+        self.user_rate = (
+            user_rate_per_minute if user_rate_per_minute is not None else settings.chat_user_rate_per_minute
+        ) / 60
+        self.user_burst = user_burst or settings.chat_user_burst
+        self.max_user_queue = max_user_queue or settings.chat_user_max_queued
+        self.name = name
+        self._waiting = 0
+        self._active = 0
+        self._avg_service_time = 0.0
+        # Start-time fair queuing: heap of (start tag, arrival, user key, future)
+        self._queue: List[Tuple[float, int, str, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[str, float] = {}
+        self._queued_by_user: Dict[str, int] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def retry_after(self) -> int:
+        """Estimate seconds until the current queue drains."""
+        drain_time = (self._waiting + 1) * self._avg_service_time / self.max_concurrency
+        return max(settings.chat_retry_after_s, math.ceil(drain_time))
+
+    def _reject(self, reason: str, retry_after: int = None) -> AdmissionRejected:
+        metrics.increment(f"{self.name}_rejected_total")
+        metrics.increment(f"{self.name}_rejected_{reason}_total")
+        return AdmissionRejected(retry_after or self.retry_after(), reason)
+
+    def _update_gauges(self):
+        metrics.set_gauge(f"{self.name}_queue_depth", self._waiting)
+        metrics.set_gauge(f"{self.name}_active", self._active)
+
+    def _take_quota(self, key: str) -> Optional[int]:
+        """Consume one request from the user's quota; returns seconds to wait if exhausted."""
+        if self.user_rate <= 0:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= _MAX_TRACKED_USERS:
+                # Full buckets carry no state: a new bucket would be identical
+                self._buckets = {user: b for user, b in self._buckets.items() if not b.is_full()}
+            bucket = self._buckets[key] = TokenBucket(self.user_rate, self.user_burst)
+        if bucket.take():
+            return None
+        return max(math.ceil(bucket.seconds_until_token()), 1)
+
+    def _refund_quota(self, key: str):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.refund()
+
+    def _start_tag(self, key: str) -> float:
+        """Virtual start tag of a new request; each request advances its user's tag by one."""
+        start = max(self._virtual_time, self._finish_tags.get(key, 0.0))
+        if len(self._finish_tags) >= _MAX_TRACKED_USERS:
+            # Tags at or behind virtual time are equivalent to no tag
+            self._finish_tags = {
+                user: tag for user, tag in self._finish_tags.items() if tag > self._virtual_time
+            }
+        self._finish_tags[key] = start + 1
+        return start
+
+    def _dispatch(self):
+        """Hand free slots to the waiting requests with the smallest start tags."""
+        while self._queue and self._active < self.max_concurrency:
+            start, _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                # Timed out or cancelled while waiting
+                continue
+            self._virtual_time = max(self._virtual_time, start)
+            self._active += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, key: str = "") -> AsyncIterator[None]:
+        """Hold a pipeline slot for the duration of the block.
+
+        Args:
+            key: User the request belongs to (see utils.user_identity)
+
+        Raises:
+            AdmissionRejected: If the user is over quota, or the user's or the
+                shared queue is full, or the wait timed out
+        """
+        runs_now = self._active < self.max_concurrency and not self._waiting
+        if not runs_now:
+            if self._waiting >= self.max_queue:
+                raise self._reject("queue_full")
+            if self._queued_by_user.get(key, 0) >= self.max_user_queue:
+                raise self._reject("user_queue_full")
+
+        quota_wait = self._take_quota(key)
+        if quota_wait is not None:
+            raise self._reject("user_quota", quota_wait)
+
+        if runs_now:
+            self._virtual_time = max(self._virtual_time, self._start_tag(key))
+            self._active += 1
+        else:
+            try:
+                await self._wait_for_slot(key, self._start_tag(key))
+            except (AdmissionRejected, asyncio.CancelledError):
+                self._refund_quota(key)
+                raise
+
+        self._update_gauges()
+        metrics.increment(f"{self.name}_admitted_total")
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            self._avg_service_time += _SERVICE_TIME_SMOOTHING * (elapsed - self._avg_service_time)
+            self._release()
+
+    async def _wait_for_slot(self, key: str, start: float):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (start, next(self._arrivals), key, future))
+        self._waiting += 1
+        self._queued_by_user[key] = self._queued_by_user.get(key, 0) + 1
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as the wait ended: give it back
+                self._release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject("queue_timeout")
+            raise
+        finally:
+            self._waiting -= 1
+            remaining = self._queued_by_user[key] - 1
+            if remaining:
+                self._queued_by_user[key] = remaining
+            else:
+                del self._queued_by_user[key]
+            self._update_gauges()
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+        self._update_gauges()
+
+
+# Global admission controllers for the chat and batch endpoints
+chat_admission = AdmissionController()
+batch_admission = AdmissionController(
+    max_concurrency=settings.batch_max_requests, max_queue=0, user_rate_per_minute=0, name="batch"
+)
@@ -0,0 +1,82 @@
+"""Cooperative cancellation for pipeline work whose client has gone away.
+
+Request handlers create a CancellationToken and cancel it when the client
+disconnects. The pipeline runs in worker threads, which cannot be
+interrupted, so it checks the token between stages (embedding, search,
+context selection, generation) and stops with QueryCancelled at the next
+check instead of finishing a response nobody will read.
+"""
+
+import threading
+from typing import List, Optional
+
+
+class QueryCancelled(Exception):
+    """Raised inside the pipeline when every client waiting for it has gone."""
+
+
+class CancellationToken:
+    """Thread-safe, one-way cancellation flag."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self, stage: str = ""):
+        """Stop the current pipeline run if its token has been cancelled.
+
+        Raises:
+            QueryCancelled: If cancelled
+        """
+        if self.cancelled:
+            raise QueryCancelled(f"Cancelled before {stage}" if stage else "Cancelled")
+
+
+class SharedCancellation(CancellationToken):
+    """Token for work shared by several callers (single-flight coalescing).
+
+    Cancelled only once every joined caller has cancelled; a caller that
+    joins without a token keeps the work alive. Once observed, cancellation
+    is final: later callers cannot join and must start the work again.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._tokens: List[CancellationToken] = []
+        self._pinned = False
+
+    def join(self, token: Optional[CancellationToken]) -> bool:
+        """Add a caller's token; None means the caller can never cancel.
+
+        Returns:
+            bool: False if the shared work is already cancelled (nothing was joined)
+        """
+        with self._lock:
+            if self._cancelled_locked():
+                return False
+            if token is None:
+                self._pinned = True
+            else:
+                self._tokens.append(token)
+            return True
+
+    def _cancelled_locked(self) -> bool:
+        if not self._event.is_set():
+            if self._pinned or not self._tokens or not all(token.cancelled for token in self._tokens):
+                return False
+            self._event.set()
+        return True
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        with self._lock:
+            return self._cancelled_locked()
@@ -0,0 +1,148 @@
+"""Context assembly between vector search and answer generation.
+
+Search returns a wide candidate list; only part of it should reach the LLM.
+This module trims that list in three passes:
+
+1. Adaptive top-k: cut the ranking at the first large score gap
+2. Redundancy removal: vectorized MMR that drops near-duplicate fragments
+3. Token packing: fill a fixed token budget using ingestion-time token counts
+
+Smaller prompts translate directly into lower generation latency and cost.
+"""
+
+from typing import List, Optional
+import numpy as np
+from config import settings
+from records import ChunkRecord
+
+# Rough characters-per-token ratio for Spanish text, used when a chunk
+# has no token count stored at ingestion
+_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(chunk: ChunkRecord) -> int:
+    """Returns the token count stored at ingestion or a length-based estimate."""
+    if chunk.token_count > 0:
+        return chunk.token_count
+    return len(chunk.text) // _CHARS_PER_TOKEN + 1
+
+
+def assemble_context(
+    chunks: List[ChunkRecord],
+    query_embedding: Optional[List[float]] = None,
+    token_budget: int = None,
+    max_chunks: int = None,
+    score_gap: float = None,
+) -> List[ChunkRecord]:
+    """Selects the fragments that will be sent to the LLM.
+
+    Args:
+        chunks: Search candidates sorted by descending score
+        query_embedding: Query vector for MMR relevance (cosine); without it
+            the chunks' own scores are the relevance, e.g. after reranking
+        token_budget: Maximum total tokens of the selected fragments
+        max_chunks: Maximum number of selected fragments
+        score_gap: Score drop that cuts the ranking; 0 disables the cut
+            (default: settings.context_score_gap, tuned for cosine scores)
+
+    Returns:
+        List[ChunkRecord]: Selected fragments in selection order
+    """
+    if token_budget is None:
+        token_budget = settings.context_token_budget
+    if max_chunks is None:
+        max_chunks = settings.max_chunks
+    if score_gap is None:
+        score_gap = settings.context_score_gap
+
+    if not chunks:
+        return []
+
+    candidates = _cut_at_score_gap(chunks, score_gap)
+    candidates = _mmr_order(candidates, query_embedding)
+    return _pack_to_budget(candidates, token_budget, max_chunks)
+
+
+def _cut_at_score_gap(chunks: List[ChunkRecord], max_gap: float) -> List[ChunkRecord]:
+    """Keeps the ranking prefix before the first score drop larger than max_gap."""
+    if len(chunks) < 2 or max_gap <= 0:
+        return chunks
+
+    scores = np.fromiter((chunk.score for chunk in chunks), dtype=np.float32, count=len(chunks))
+    gaps = scores[:-1] - scores[1:]
+    cut_positions = np.flatnonzero(gaps > max_gap)
+
+    if cut_positions.size == 0:
+        return chunks
+    return chunks[:cut_positions[0] + 1]
+
+
+def _mmr_order(chunks: List[ChunkRecord], query_embedding: Optional[List[float]]) -> List[ChunkRecord]:
+    """Reorders chunks by maximal marginal relevance, dropping near-duplicates.
+
+    Pairwise similarities are computed once as a single matrix product; each
+    selection step is then a vector operation over the remaining candidates.
+    """
+    if len(chunks) < 2 or any(chunk.embedding is None for chunk in chunks):
+        return chunks
+
+    vectors = np.asarray([chunk.embedding for chunk in chunks], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.maximum(norms, 1e-12)
+
+    if query_embedding is not None:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        relevance = vectors @ query
+    else:
+        # Scores may be on any scale (cross-encoder logits); map them to [0, 1]
+        # so they trade off against cosine redundancy as cosine relevance would
+        relevance = np.fromiter((chunk.score for chunk in chunks), dtype=np.float32, count=len(chunks))
+        spread = float(relevance.max() - relevance.min())
+        relevance = (relevance - relevance.min()) / spread if spread > 0 else np.ones_like(relevance)
+
+    similarity = vectors @ vectors.T
+    mmr_lambda = settings.context_mmr_lambda
+    duplicate_threshold = settings.context_duplicate_threshold
+
+    # Highest similarity of each candidate to anything already selected
+    max_similarity = np.full(len(chunks), -np.inf, dtype=np.float32)
+    available = np.ones(len(chunks), dtype=bool)
+    order = []
+
+    while available.any():
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        mmr_scores = mmr_lambda * relevance - (1.0 - mmr_lambda) * redundancy
+        mmr_scores[~available] = -np.inf
+        best = int(np.argmax(mmr_scores))
+
+        order.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+
+        # Near-duplicates of the selected chunk add tokens but no information
+        available &= max_similarity < duplicate_threshold
+
+    return [chunks[i] for i in order]
+
+
+def _pack_to_budget(chunks: List[ChunkRecord], token_budget: int, max_chunks: int) -> List[ChunkRecord]:
+    """Greedily adds chunks in order while they fit in the token budget."""
+    selected = []
+    used_tokens = 0
+
+    for chunk in chunks:
+        if len(selected) >= max_chunks:
+            break
+        tokens = estimate_tokens(chunk)
+        if used_tokens + tokens > token_budget:
+            # A smaller, lower-ranked chunk may still fit
+            continue
+        selected.append(chunk)
+        used_tokens += tokens
+
+    # Never send an empty context when there were candidates
+    if not selected and chunks:
+        selected.append(chunks[0])
+
+    return selected
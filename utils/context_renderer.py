@@ -19,7 +19,7 @@ Level 1: Main Container
 
 DATA FLOW:
 ----------
-DocumentSource + ChunkData → Air Components → HTML String → Frontend JSON
+SourceRecord + ChunkRecord → Air Components → HTML String → Frontend JSON
 
 
 MAIN FUNCTIONS:
@@ -35,14 +35,14 @@ import re
 import time
 from typing import List
 from air import Details, Summary, Div, Strong, A, Span, Br, H1, H2, H3, H4, Em
-from schemas import DocumentSource, ChunkData
+from records import ChunkRecord, SourceRecord
 
 # Pre-compile regex patterns for better performance
 _BOLD_PATTERN = re.compile(r'\*\*(.*?)\*\*')
 _ITALIC_PATTERN = re.compile(r'(?<!\*)\*([^*]+?)\*(?!\*)')
 
 
-def render_embedded_sources(sources: List[DocumentSource], query_id: str = None) -> Div:
+def render_embedded_sources(sources: List[SourceRecord], query_id: str = None) -> Div:
     """Converts RAG document sources into interactive Air accordion components.
     
     Args:
@@ -82,7 +82,7 @@ def render_embedded_sources(sources: List[DocumentSource], query_id: str = None)
     return embedded_component
 
 
-def _render_sources_content(sources: List[DocumentSource]) -> List:
+def _render_sources_content(sources: List[SourceRecord]) -> List:
     """Processes list of documents and generates Air components."""
     content_components = []
     
@@ -93,7 +93,7 @@ def _render_sources_content(sources: List[DocumentSource]) -> List:
     return content_components
 
 
-def _format_document_section(source: DocumentSource, index: int) -> Details:
+def _format_document_section(source: SourceRecord, index: int) -> Details:
     """Creates accordion component for a complete document with metadata and fragments.
     
     Args:
@@ -156,7 +156,7 @@ def _format_document_section(source: DocumentSource, index: int) -> Details:
     return document_component
 
 
-def _format_chunk_collapsible(chunk: ChunkData, index: int) -> Details:
+def _format_chunk_collapsible(chunk: ChunkRecord, index: int) -> Details:
     """Creates accordion component for a document fragment.
     
     Args:
@@ -268,11 +268,11 @@ def _process_inline_formatting(text: str) -> List:
     return components if components else [html.escape(text)]
 
 
-def _get_age_text(source: DocumentSource) -> str:
+def _get_age_text(source: SourceRecord) -> str:
     """Returns formatted document age text with date and description if available.
     
     Args:
-        source: DocumentSource with temporal metadata
+        source: SourceRecord with temporal metadata
         
     Returns:
         str: Formatted age text with emoji
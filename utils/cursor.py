@@ -0,0 +1,59 @@
+"""Opaque pagination cursors.
+
+Cursors are URL-safe base64 encodings of a small JSON payload. They carry
+everything needed to continue a listing, so any worker can serve the next
+page without shared server-side state. Vectors (e.g. a query embedding) are
+packed as base64 float16, so later pages skip the embedding model.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, Dict, List
+import numpy as np
+
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """Encodes a JSON-serializable payload as an opaque cursor string."""
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decodes a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def encode_vector(vector) -> str:
+    """Packs a vector as base64 float16 for a cursor payload."""
+    raw = np.asarray(vector, dtype=np.float16).tobytes()
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_vector(packed: str, dimension: int) -> List[float]:
+    """Unpacks a vector produced by encode_vector.
+
+    Raises:
+        ValueError: If the data is malformed or not of the expected dimension
+    """
+    try:
+        raw = base64.urlsafe_b64decode((packed + "=" * (-len(packed) % 4)).encode("ascii"))
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError("Invalid vector") from e
+    if len(raw) != dimension * 2:
+        raise ValueError("Invalid vector")
+    vector = np.frombuffer(raw, dtype=np.float16).astype(np.float32)
+    if not np.isfinite(vector).all():
+        raise ValueError("Invalid vector")
+    return vector.tolist()
@@ -0,0 +1,120 @@
+"""Document metadata lookup for source rendering.
+
+Retrieved chunks only carry a doc_id. Titles, URLs and publication dates are
+fetched from the documents table in one batched query per request, behind a
+bounded LRU cache so frequently cited documents are read from DuckDB once.
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+from config import settings
+from database import DatabaseManager, db_manager
+from utils.cache import LRUCache
+from utils.logger import logger
+from utils.metrics import metrics
+
+_SPANISH_MONTHS = [
+    "enero", "febrero", "marzo", "abril", "mayo", "junio",
+    "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"
+]
+
+
+def format_publication_date(value: Optional[date]) -> Optional[str]:
+    """Formats a date as Spanish long form, e.g. '15 de enero de 2024'."""
+    if value is None:
+        return None
+    return f"{value.day} de {_SPANISH_MONTHS[value.month - 1]} de {value.year}"
+
+
+def age_bucket(value: Optional[date], today: Optional[date] = None) -> Tuple[Optional[str], Optional[str]]:
+    """Classifies a publication date into a (description, emoji) age bucket."""
+    if value is None:
+        return None, None
+    if isinstance(value, datetime):
+        value = value.date()
+
+    age_days = ((today or date.today()) - value).days
+    if age_days < 365:
+        return "Reciente", "🟢"
+    if age_days < 5 * 365:
+        return "Intermedio", "🟡"
+    return "Antiguo", "🔴"
+
+
+def _build_metadata(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Converts a documents row into display-ready metadata."""
+    publication_date = row.get("publication_date")
+    age_description, age_emoji = age_bucket(publication_date)
+    return {
+        "title": row.get("title") or "Documento sin título",
+        "url": row.get("url"),
+        "publication_date": format_publication_date(publication_date),
+        "age_description": age_description,
+        "age_emoji": age_emoji,
+        "doc_type": row.get("doc_type"),
+        "agency": row.get("agency"),
+    }
+
+
+class DocumentMetadataStore:
+    """Batched, cached access to the documents table of one database."""
+
+    def __init__(self, cache_size: int = None, database: DatabaseManager = None):
+        """Initialize metadata store.
+
+        Args:
+            cache_size: Maximum number of documents kept in the cache
+            database: Database to read from (default: the global db_manager)
+        """
+        self._database = database or db_manager
+        self._cache = LRUCache(cache_size or settings.document_cache_size)
+        self._database_lookup: Optional[bool] = None
+
+    def _database_available(self) -> bool:
+        if self._database_lookup is None:
+            try:
+                self._database_lookup = self._database.has_table("documents")
+            except Exception as e:
+                logger.warning(f"Documents table unavailable, metadata lookups disabled: {e}")
+                self._database_lookup = False
+        return self._database_lookup
+
+    def get_many(self, doc_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Return display metadata for the given documents.
+
+        Cached documents are served from memory; the rest are fetched with a
+        single query. Unknown documents are absent from the result.
+
+        Args:
+            doc_ids: Document identifiers (duplicates allowed)
+
+        Returns:
+            Dict mapping doc_id to metadata (title, url, publication_date, age bucket)
+        """
+        found = {}
+        missing = []
+        for doc_id in dict.fromkeys(doc_ids):
+            metadata = self._cache.get(doc_id)
+            if metadata is None:
+                missing.append(doc_id)
+            else:
+                found[doc_id] = metadata
+
+        metrics.increment("document_cache_hits_total", len(found))
+        metrics.increment("document_cache_misses_total", len(missing))
+
+        if missing and self._database_available():
+            for row in self._database.fetch_documents(missing):
+                metadata = _build_metadata(row)
+                self._cache.put(row["doc_id"], metadata)
+                found[row["doc_id"]] = metadata
+
+        return found
+
+    def clear(self):
+        """Drop all cached metadata."""
+        self._cache.clear()
+
+
+# Global document metadata store
+document_store = DocumentMetadataStore()
@@ -1,24 +1,157 @@
-"""Centralized logging configuration for DOF Chat application."""
+"""Centralized logging configuration for DOF Chat application.
 
+Log calls only enqueue the record; a background listener thread formats it
+and writes to stdout, so slow stdout never blocks the event loop. Messages
+use lazy %-style arguments and are formatted in the listener.
+
+Each request gets an id (see bind_request_id) that is attached to its
+records. Per-request INFO/DEBUG records can be sampled with
+settings.log_sample_rate; warnings and errors are always kept.
+"""
+
+import contextvars
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
 import sys
+import uuid
+from typing import Optional, Tuple
+from config import settings
+
+# (request id, whether this request's low-severity records are kept)
+_request_context: contextvars.ContextVar[Optional[Tuple[str, bool]]] = contextvars.ContextVar(
+    "dof_chat_request_context", default=None
+)
+
+# Client-provided ids are echoed into logs, so only accept plain tokens
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+_TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s:%(lineno)d - %(message)s'
+
+
+def bind_request_id(request_id: Optional[str] = None) -> contextvars.Token:
+    """Attach a request id (generated if missing or malformed) and sampling decision to the current context.
+
+    Returns:
+        Token for restoring the previous context with unbind_request_id
+    """
+    if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+        request_id = uuid.uuid4().hex
+    sampled = random.random() < settings.log_sample_rate
+    return _request_context.set((request_id, sampled))
+
+
+def unbind_request_id(token: contextvars.Token):
+    """Restore the context that was active before bind_request_id."""
+    _request_context.reset(token)
+
+
+def current_request_id() -> Optional[str]:
+    """Request id bound to the current context, if any."""
+    context = _request_context.get()
+    return context[0] if context else None
+
+
+class RequestContextFilter(logging.Filter):
+    """Adds the request id to records and drops unsampled per-request INFO/DEBUG records.
+
+    Runs in the calling thread, where the request context is visible.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request_context.get()
+        if context is None:
+            record.request_id = "-"
+            return True
+        record.request_id, sampled = context
+        return sampled or record.levelno > logging.INFO
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with timestamp, level, location, request id and message."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "location": f"{record.filename}:{record.funcName}:{record.lineno}",
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that defers message formatting to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue is in-process, so the record (args, exc_info) can be
+        # handed over as-is instead of being formatted here
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block the caller; drop the record when the writer falls behind
+            pass
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _build_output_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stdout)
+    if settings.log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(_TEXT_FORMAT))
+    return handler
+
+
+def _start_listener(queue_handler: LazyQueueHandler):
+    """Start (or restart, e.g. after fork) the background writer thread."""
+    global _listener
+    queue_handler.queue = queue.Queue(settings.log_queue_size)
+    _listener = logging.handlers.QueueListener(
+        queue_handler.queue, _build_output_handler(), respect_handler_level=False
+    )
+    _listener.start()
+
+
+def stop_listener():
+    """Flush queued records and stop the writer thread."""
+    if _listener is not None:
+        _listener.stop()
 
 
 def setup_logger() -> logging.Logger:
-    """Setup application logger with console output."""
+    """Setup application logger with non-blocking console output."""
     logger = logging.getLogger('dof_chat')
-    
+
     if not logger.handlers:
-        logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setFormatter(logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(filename)s:%(funcName)s:%(lineno)d - %(message)s'
-        ))
+        logger.setLevel(settings.log_level.upper())
+        handler = LazyQueueHandler(queue.Queue(settings.log_queue_size))
+        handler.addFilter(RequestContextFilter())
         logger.addHandler(handler)
         logger.propagate = False
-    
+        _start_listener(handler)
+
+        # Threads do not survive fork: forked workers need their own writer
+        os.register_at_fork(after_in_child=lambda: _start_listener(handler))
+
+        import atexit
+        atexit.register(stop_listener)
+
     return logger
 
 
 # Global logger instance
-logger = setup_logger()
\ No newline at end of file
+logger = setup_logger()
@@ -0,0 +1,45 @@
+"""In-process metrics registry for DOF Chat.
+
+Thread-safe counters and gauges exposed through the /api/v1/metrics endpoint.
+Values are per worker process and reset on restart.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict
+
+
+class Metrics:
+    """Thread-safe registry of named counters and gauges."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._gauges: Dict[str, float] = defaultdict(float)
+    
+    def increment(self, name: str, value: int = 1):
+        """Increase a monotonically growing counter."""
+        with self._lock:
+            self._counters[name] += value
+    
+    def set_gauge(self, name: str, value: float):
+        """Set a gauge to an absolute value."""
+        with self._lock:
+            self._gauges[name] = value
+    
+    def add_gauge(self, name: str, delta: float):
+        """Move a gauge up or down by delta."""
+        with self._lock:
+            self._gauges[name] += delta
+    
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Return a consistent copy of all current values."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges)
+            }
+
+
+# Global metrics registry
+metrics = Metrics()
@@ -0,0 +1,176 @@
+"""Opt-in profiling of live requests.
+
+With settings.profiling_enabled, a request carrying "X-Profile: 1" and a
+valid admin token, or a settings.profiling_sample_rate fraction of all
+requests, runs the pipeline under cProfile. Admin-forced captures can also
+trace allocations with tracemalloc (settings.profiling_memory); sampled ones
+never do, since tracemalloc slows down every thread of the process, not just
+the profiled request. Each capture is written to settings.profiling_dir as a pstats file plus a
+text summary, and only the newest settings.profiling_max_files captures
+are kept.
+
+Both profilers are process-wide, so at most one request is profiled at a
+time; requests arriving meanwhile run unprofiled. The profile covers the
+worker thread running the pipeline, not the helper threads it submits work
+to. When profiling is disabled, the only cost is one settings lookup per
+request.
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from fastapi import Request
+from config import settings
+from utils.logger import current_request_id, logger
+
+PROFILE_HEADER = "X-Profile"
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+\.(prof|txt)$")
+_capture_lock = threading.Lock()
+
+
+def is_admin(request: Request) -> bool:
+    """Whether the request carries the configured admin token."""
+    expected = settings.profiling_admin_token
+    provided = request.headers.get(ADMIN_TOKEN_HEADER, "")
+    return bool(expected) and hmac.compare_digest(provided.encode(), expected.encode())
+
+
+def requested_capture(request: Request, label: str) -> Optional["ProfileCapture"]:
+    """Capture to run this request under, or None (always None while profiling is disabled).
+
+    Args:
+        request: Incoming request
+        label: Endpoint name used in the capture file name
+
+    Returns:
+        Optional[ProfileCapture]: Capture for an admin request or a sampled one
+    """
+    if not settings.profiling_enabled:
+        return None
+    if request.headers.get(PROFILE_HEADER) == "1":
+        if not is_admin(request):
+            logger.warning("Ignoring profiling request without a valid admin token")
+            return None
+        return ProfileCapture(label, memory=settings.profiling_memory)
+    if settings.profiling_sample_rate > 0 and random.random() < settings.profiling_sample_rate:
+        return ProfileCapture(label)
+    return None
+
+
+class ProfileCapture:
+    """One profiled pipeline run and the files it produces."""
+
+    def __init__(self, label: str, memory: bool = False):
+        """Initialize capture.
+
+        Args:
+            label: Endpoint name used in the capture file name
+            memory: Also trace allocations with tracemalloc
+        """
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        self.name = f"{stamp}-{label}-{current_request_id() or 'none'}"
+        self.memory = memory
+        self.captured = False
+
+    def wrap(self, fn: Callable) -> Callable:
+        """Wrap fn so that it runs profiled in whichever thread calls it."""
+        def profiled(*args, **kwargs):
+            if not _capture_lock.acquire(blocking=False):
+                logger.info("Another request is being profiled, running %s unprofiled", self.name)
+                return fn(*args, **kwargs)
+            try:
+                return self._run(fn, args, kwargs)
+            finally:
+                _capture_lock.release()
+        return profiled
+
+    def _run(self, fn: Callable, args, kwargs):
+        track_memory = self.memory and not tracemalloc.is_tracing()
+        if track_memory:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot() if track_memory else None
+            peak = tracemalloc.get_traced_memory()[1] if track_memory else None
+            if track_memory:
+                tracemalloc.stop()
+            try:
+                self._write(profiler, elapsed, snapshot, peak)
+            except OSError as e:
+                logger.error(f"Failed to write profile {self.name}: {e}")
+
+    def _write(self, profiler: cProfile.Profile, elapsed: float, snapshot, peak: Optional[int]):
+        os.makedirs(settings.profiling_dir, exist_ok=True)
+        base = os.path.join(settings.profiling_dir, self.name)
+        profiler.dump_stats(f"{base}.prof")
+
+        summary = io.StringIO()
+        summary.write(f"{self.name}: {elapsed * 1000:.1f} ms wall time\n\n")
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(40)
+        if snapshot is not None:
+            summary.write(f"\nPeak traced memory: {peak / 2**20:.1f} MiB\nTop allocations by line:\n")
+            for stat in snapshot.statistics("lineno")[:25]:
+                summary.write(f"{stat}\n")
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+
+        self.captured = True
+        logger.info(f"Wrote profile {self.name} ({elapsed * 1000:.1f} ms)")
+        _rotate()
+
+
+def _rotate():
+    """Delete the oldest captures beyond settings.profiling_max_files."""
+    captures = sorted({entry["capture"] for entry in list_profiles()}, reverse=True)
+    for capture in captures[settings.profiling_max_files:]:
+        for suffix in (".prof", ".txt"):
+            try:
+                os.remove(os.path.join(settings.profiling_dir, capture + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> List[Dict]:
+    """Profile files in settings.profiling_dir, newest first.
+
+    Returns:
+        List of dicts with name, capture (shared by a .prof/.txt pair), size and modified
+    """
+    if not os.path.isdir(settings.profiling_dir):
+        return []
+    entries = []
+    for entry in os.scandir(settings.profiling_dir):
+        if entry.is_file() and _NAME_PATTERN.match(entry.name):
+            stat = entry.stat()
+            entries.append({
+                "name": entry.name,
+                "capture": os.path.splitext(entry.name)[0],
+                "size": stat.st_size,
+                "modified": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+            })
+    return sorted(entries, key=lambda entry: entry["name"], reverse=True)
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a captured profile file, or None if the name is invalid or unknown."""
+    if not _NAME_PATTERN.match(name):
+        return None
+    path = os.path.join(settings.profiling_dir, name)
+    return path if os.path.isfile(path) else None
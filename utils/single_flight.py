@@ -0,0 +1,95 @@
+"""Single-flight coalescing of identical concurrent calls.
+
+While a call for a given key is running, further calls with the same key
+wait for its result instead of starting their own computation. A call whose
+callers have all cancelled is never joined; a caller that arrives then, or
+that was waiting when the shared run was cancelled without having cancelled
+itself, runs the computation again.
+"""
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+from utils.cancellation import CancellationToken, QueryCancelled, SharedCancellation
+
+
+class _Call:
+    """One in-flight computation and the cancellation shared by its callers."""
+    
+    __slots__ = ("future", "cancellation")
+    
+    def __init__(self):
+        self.future = Future()
+        self.cancellation = SharedCancellation()
+
+
+class SingleFlight:
+    """Thread-safe registry of in-flight calls keyed by string."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+    
+    def do(
+        self,
+        key: str,
+        fn: Callable[..., Any],
+        *args,
+        cancel: Optional[CancellationToken] = None,
+        **kwargs
+    ) -> Tuple[Any, bool]:
+        """Run fn once per key at a time and share its outcome.
+        
+        Args:
+            key: Coalescing key; calls with equal keys share one execution
+            fn: Callable to execute
+            *args: Positional arguments for fn
+            cancel: Caller's cancellation token. When the leader passes one,
+                fn receives cancel=<shared token>, cancelled only after every
+                caller of this execution has cancelled
+            **kwargs: Keyword arguments for fn
+            
+        Returns:
+            Tuple of (result, shared) where shared is True if the result came
+            from a call started by another thread
+            
+        Raises:
+            Exception: Whatever fn raised, re-raised in every waiting caller
+            QueryCancelled: If this caller's own token was cancelled
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None or not call.cancellation.join(cancel)
+                if leader:
+                    # Replaces a cancelled call that has not been removed yet
+                    call = _Call()
+                    call.cancellation.join(cancel)
+                    self._calls[key] = call
+            if leader:
+                break
+            try:
+                return call.future.result(), True
+            except QueryCancelled:
+                if cancel is not None and cancel.cancelled:
+                    raise
+                # Everyone else gave up on the shared run, but this caller is still waiting
+        
+        try:
+            if cancel is not None:
+                kwargs["cancel"] = call.cancellation
+            result = fn(*args, **kwargs)
+            call.future.set_result(result)
+            return result, False
+        except BaseException as e:
+            call.future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+    
+    def in_flight(self) -> int:
+        """Number of distinct keys currently being computed."""
+        with self._lock:
+            return len(self._calls)
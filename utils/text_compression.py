@@ -0,0 +1,72 @@
+"""Dictionary-based zstd compression for chunk text.
+
+Chunk texts are short and share most of their vocabulary (legal Spanish,
+article headers, agency names), so each one compresses poorly on its own.
+A dictionary trained on a sample of the corpus supplies that shared context
+and is stored once in the database next to the compressed texts.
+
+Only the final top-k texts of a query are ever decompressed.
+"""
+
+import threading
+from typing import Dict, List
+import zstandard
+
+
+def train_dictionary(samples: List[str], dict_size: int) -> bytes:
+    """Train a zstd dictionary on sample chunk texts.
+
+    Args:
+        samples: Representative chunk texts
+        dict_size: Maximum dictionary size in bytes
+
+    Returns:
+        bytes: Raw dictionary content
+    """
+    encoded = [sample.encode("utf-8") for sample in samples if sample]
+    return zstandard.train_dictionary(dict_size, encoded).as_bytes()
+
+
+class TextCodec:
+    """Compresses and decompresses chunk text with per-id dictionaries.
+
+    zstd contexts are not thread-safe, so each thread gets its own.
+    """
+
+    def __init__(self, dictionaries: Dict[int, bytes], level: int = 19):
+        """Initialize codec.
+
+        Args:
+            dictionaries: Raw dictionary content by dict_id
+            level: Compression level used by compress()
+        """
+        self.level = level
+        self._dictionaries = {
+            dict_id: zstandard.ZstdCompressionDict(data) for dict_id, data in dictionaries.items()
+        }
+        self._local = threading.local()
+
+    def _contexts(self, kind: str) -> Dict[int, object]:
+        contexts = getattr(self._local, kind, None)
+        if contexts is None:
+            contexts = {}
+            setattr(self._local, kind, contexts)
+        return contexts
+
+    def compress(self, text: str, dict_id: int) -> bytes:
+        """Compress one text with the given dictionary."""
+        contexts = self._contexts("compressors")
+        compressor = contexts.get(dict_id)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._dictionaries[dict_id])
+            contexts[dict_id] = compressor
+        return compressor.compress(text.encode("utf-8"))
+
+    def decompress(self, data: bytes, dict_id: int) -> str:
+        """Decompress one text compressed with the given dictionary."""
+        contexts = self._contexts("decompressors")
+        decompressor = contexts.get(dict_id)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor(dict_data=self._dictionaries[dict_id])
+            contexts[dict_id] = decompressor
+        return decompressor.decompress(data).decode("utf-8")
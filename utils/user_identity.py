@@ -0,0 +1,108 @@
+"""Identify the user behind an API request for per-user scheduling.
+
+Clerk keeps the session JWT in the __session cookie (or an Authorization
+bearer header for scripts). It is verified locally against Clerk's cached
+signing key, without the user lookup airclerk's require_auth performs, and
+verified tokens are remembered until they expire, so identifying a request
+costs a dictionary lookup on the hot path.
+
+Only tokens issued for one of settings.clerk_authorized_parties are
+accepted; the origin is never taken from the request, whose Host header the
+client controls. Requests without a valid session, or before the authorized
+origins are configured, are keyed by client address, so anonymous traffic is
+still scheduled fairly against signed-in users.
+
+Conversation memory is keyed by the server-side session instead: the
+client-generated conversation id only tells apart the conversations (browser
+tabs) of one session, so knowing another user's id does not expose their
+conversation.
+"""
+
+import secrets
+import time
+from typing import List, Optional
+from fastapi import Request
+from config import settings
+from utils.cache import LRUCache
+from utils.logger import logger
+
+try:
+    from clerk_backend_api.security import VerifyTokenOptions, verify_token_async
+except ImportError:  # Installed with airclerk; without it every request is keyed by address
+    verify_token_async = None
+
+# Verified session token -> (user key, expiry as a Unix timestamp)
+_verified_tokens = LRUCache(4096)
+
+# Key in the signed session cookie (air.SessionMiddleware) holding the conversation scope
+_CONVERSATION_SCOPE = "conversation_scope"
+
+
+def _session_token(request: Request) -> Optional[str]:
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:].strip() or None
+    return request.cookies.get("__session")
+
+
+def _authorized_parties() -> List[str]:
+    return [origin.strip() for origin in settings.clerk_authorized_parties.split(",") if origin.strip()]
+
+
+def _address_key(request: Request) -> str:
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+async def request_user_key(request: Request) -> str:
+    """Scheduling key for a request: "user:<clerk user id>" or "ip:<address>".
+
+    Args:
+        request: Incoming API request
+
+    Returns:
+        str: Key shared by all requests of the same user
+    """
+    token = _session_token(request)
+    authorized_parties = _authorized_parties()
+    if token is None or verify_token_async is None or not settings.clerk_secret_key or not authorized_parties:
+        return _address_key(request)
+
+    cached = _verified_tokens.get(token)
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
+
+    try:
+        payload = await verify_token_async(token, VerifyTokenOptions(
+            secret_key=settings.clerk_secret_key,
+            authorized_parties=authorized_parties
+        ))
+    except Exception as e:
+        logger.debug("Session token not accepted for scheduling: %s", e)
+        return _address_key(request)
+
+    key = f"user:{payload['sub']}"
+    _verified_tokens.put(token, (key, float(payload.get("exp", 0))))
+    return key
+
+
+def conversation_key(request: Request, conversation_id: Optional[str]) -> Optional[str]:
+    """Server-side key for a client conversation, scoped to the caller's session.
+
+    A random scope is stored in the signed session cookie on first use, so
+    the same conversation id sent without that cookie maps to a different
+    (empty) conversation.
+
+    Args:
+        request: Incoming API request
+        conversation_id: Client-generated conversation identifier, if any
+
+    Returns:
+        Optional[str]: "<session scope>:<conversation id>", or None without a
+        conversation id or session support (memory is then disabled, not shared)
+    """
+    if not conversation_id or "session" not in request.scope:
+        return None
+    scope = request.session.get(_CONVERSATION_SCOPE)
+    if scope is None:
+        scope = request.session[_CONVERSATION_SCOPE] = secrets.token_urlsafe(16)
+    return f"{scope}:{conversation_id}"